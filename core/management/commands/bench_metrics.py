@@ -0,0 +1,37 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from store.benchmarks import bench_client, create_catalog, rolled_back, summarize, timed
+
+METRICS_MIDDLEWARE = 'core.metrics.MetricsMiddleware'
+
+
+class Command(BaseCommand):
+    help = 'Measure the request overhead of the metrics middleware and query instrumentation'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        without = [name for name in settings.MIDDLEWARE if name != METRICS_MIDDLEWARE]
+        with rolled_back(), override_settings(CATALOG_CACHE_ENABLED=False):
+            products = create_catalog(products=options['products'])
+            urls = ['/api/store/products/', '/api/store/collections/']
+            urls += [f'/api/store/products/{product.id}/' for product in products[:20]]
+            # Interleave the two configurations so drift affects both alike.
+            samples = {'without_metrics': [], 'with_metrics': []}
+            for round_ in range(10):
+                for label, middleware in (('without_metrics', without), ('with_metrics', settings.MIDDLEWARE)):
+                    with override_settings(MIDDLEWARE=middleware):
+                        client = bench_client()
+                        for i in range(options['requests'] // 10):
+                            duration, response = timed(client.get, urls[i % len(urls)])
+                            assert response.status_code == 200, response.content
+                            samples[label].append(duration)
+
+        report = {label: summarize(durations) for label, durations in samples.items()}
+        baseline, instrumented = report['without_metrics']['mean_ms'], report['with_metrics']['mean_ms']
+        report['overhead_percent'] = round((instrumented - baseline) / baseline * 100, 2)
+        self.stdout.write(json.dumps(report, indent=2))
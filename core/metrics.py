@@ -0,0 +1,203 @@
+"""
+Per-route request metrics: latency histogram, query count, DB time,
+serializer time and response rendering time, exported at /metrics in the
+Prometheus text format. Serializer time comes from the project's
+serializers, which mix in TimedSerializerMixin; rendering is timed by the
+renderer classes below, set in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].
+
+Metrics live in process memory, so every worker process exposes its own
+and Prometheus aggregates across them.
+"""
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+
+logger = logging.getLogger('foody.slow_requests')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+UNMATCHED_ROUTE = 'unmatched'
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializer_depth', 'render_time', 'worst_query')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.render_time = 0.0
+        self.worst_query = (0.0, None)
+
+
+current = ContextVar('request_stats', default=None)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}
+            self.histograms = {}
+            self.totals = {}
+
+    def observe(self, route, method, status, duration, stats):
+        with self.lock:
+            key = (route, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            buckets = self.histograms.setdefault(route, [0] * len(LATENCY_BUCKETS) + [0, 0.0])
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    buckets[index] += 1
+            # Then the +Inf bucket (the count) and the sum.
+            buckets[-2] += 1
+            buckets[-1] += duration
+            totals = self.totals.setdefault(route, [0, 0.0, 0.0, 0.0])
+            totals[0] += stats.queries
+            totals[1] += stats.db_time
+            totals[2] += stats.serializer_time
+            totals[3] += stats.render_time
+
+    def snapshot(self):
+        """{route: (requests, queries)} so far."""
+        with self.lock:
+            return {route: (buckets[-2], self.totals[route][0]) for route, buckets in self.histograms.items()}
+
+    def render(self):
+        with self.lock:
+            lines = [
+                '# HELP foody_requests_total Requests handled, by route, method and status.',
+                '# TYPE foody_requests_total counter',
+            ]
+            lines += [f'foody_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}'
+                      for (route, method, status), count in sorted(self.requests.items())]
+            lines += [
+                '# HELP foody_request_duration_seconds Request latency, by route.',
+                '# TYPE foody_request_duration_seconds histogram',
+            ]
+            for route, buckets in sorted(self.histograms.items()):
+                lines += [f'foody_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {count}'
+                          for bound, count in zip(LATENCY_BUCKETS, buckets)]
+                lines.append(f'foody_request_duration_seconds_bucket{{route="{route}",le="+Inf"}} {buckets[-2]}')
+                lines.append(f'foody_request_duration_seconds_count{{route="{route}"}} {buckets[-2]}')
+                lines.append(f'foody_request_duration_seconds_sum{{route="{route}"}} {buckets[-1]:.6f}')
+            for index, (name, help_text) in enumerate([
+                    ('foody_db_queries_total', 'SQL statements executed, by route.'),
+                    ('foody_db_seconds_total', 'Time spent executing SQL, by route.'),
+                    ('foody_serializer_seconds_total',
+                     'Time spent turning objects into serializer data, including any lazy queries, by route.'),
+                    ('foody_render_seconds_total',
+                     'Time spent rendering DRF responses to bytes, by route.')]):
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+                for route, totals in sorted(self.totals.items()):
+                    value = totals[index] if index == 0 else f'{totals[index]:.6f}'
+                    lines.append(f'{name}{{route="{route}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+def record_query(execute, sql, params, many, context):
+    stats = current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        stats.queries += 1
+        stats.db_time += duration
+        if duration > stats.worst_query[0]:
+            stats.worst_query = (duration, sql)
+
+
+class MetricsMiddleware:
+    """Outermost middleware: times the request and everything below it."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_request_seconds = settings.METRICS_SLOW_REQUEST_SECONDS
+
+    def __call__(self, request):
+        stats = RequestStats()
+        token = current.set(stats)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else UNMATCHED_ROUTE
+        registry.observe(route, request.method, response.status_code, duration, stats)
+        if duration >= self.slow_request_seconds:
+            worst_time, worst_sql = stats.worst_query
+            logger.warning(
+                'Slow request %s %s (%s): %.3fs, %d queries in %.3fs, serializer %.3fs, '
+                'rendering %.3fs; slowest query %.3fs: %s',
+                request.method, request.path, route, duration, stats.queries, stats.db_time,
+                stats.serializer_time, stats.render_time, worst_time, (worst_sql or '')[:1000])
+        return response
+
+
+class TimedSerializerMixin:
+    """
+    For the project's serializers: adds the time spent in to_representation
+    to the request's serializer time. Only the outermost serializer counts,
+    nested ones run inside it; with many=True each item is the outermost,
+    so fetching the list itself is left to the DB metrics.
+    """
+
+    def to_representation(self, instance):
+        stats = current.get()
+        if stats is None:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            if not stats.serializer_depth:
+                stats.serializer_time += time.perf_counter() - start
+
+
+class TimedRendererMixin:
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        stats = current.get()
+        if stats is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        start = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            stats.render_time += time.perf_counter() - start
+
+
+class TimedJSONRenderer(TimedRendererMixin, JSONRenderer):
+    pass
+
+
+class TimedBrowsableAPIRenderer(TimedRendererMixin, BrowsableAPIRenderer):
+    pass
+
+
+def metrics_view(request):
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
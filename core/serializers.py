@@ -1,11 +1,12 @@
 from djoser.serializers import UserSerializer as BaseUserSerializer,UserCreateSerializer as BaseUserCreateSerializer
+from .metrics import TimedSerializerMixin
 
 
-class UserCreateSerializer(BaseUserCreateSerializer):
+class UserCreateSerializer(TimedSerializerMixin, BaseUserCreateSerializer):
     class Meta(BaseUserCreateSerializer.Meta):
         fields = ['id','username', 'email', 'password', 'first_name', 'last_name']
 
-class UserSerializer(BaseUserSerializer):
+class UserSerializer(TimedSerializerMixin, BaseUserSerializer):
     class Meta(BaseUserSerializer.Meta):
         fields = ['id','username', 'email', 'first_name', 'last_name']
 
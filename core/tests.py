@@ -1,3 +1,39 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from core import metrics
+from store import models
 
-# Create your tests here.
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        collection = models.Collection.objects.create(title='Fruits')
+        models.Product.objects.create(title='Mango', description='', unit_price=1, quantity=5, collection=collection)
+
+    def test_records_per_route_metrics(self):
+        self.client.get('/api/store/products/')
+        self.client.get('/api/store/products/')
+        self.client.get('/api/store/nowhere/')
+        body = self.client.get('/metrics').content.decode()
+
+        self.assertIn('foody_requests_total{route="products-list",method="GET",status="200"} 2', body)
+        self.assertIn('foody_requests_total{route="unmatched",method="GET",status="404"} 1', body)
+        self.assertIn('foody_request_duration_seconds_count{route="products-list"} 2', body)
+        self.assertIn('foody_request_duration_seconds_bucket{route="products-list",le="+Inf"} 2', body)
+        values = {line.split(' ')[0]: float(line.split(' ')[1]) for line in body.splitlines()
+                  if not line.startswith('#')}
+        self.assertGreater(values['foody_db_queries_total{route="products-list"}'], 0)
+        self.assertGreater(values['foody_db_seconds_total{route="products-list"}'], 0)
+        self.assertGreater(values['foody_serializer_seconds_total{route="products-list"}'], 0)
+        self.assertGreater(values['foody_render_seconds_total{route="products-list"}'], 0)
+
+    def test_metrics_are_private(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='10.0.0.1').status_code, 404)
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_logs_slow_requests_with_their_worst_query(self):
+        with self.assertLogs('foody.slow_requests', 'WARNING') as logs:
+            self.client.get('/api/store/products/')
+        self.assertIn('products-list', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+        self.assertIn('serializer', logs.output[0])
@@ -43,7 +43,6 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'rest_framework',
-    'debug_toolbar',
     'djoser',
     'store',
     'tag',
@@ -51,7 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    'core.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,6 +67,28 @@ INTERNAL_IPS = [
     # ...
 ]
 
+# The toolbar instruments every request; keep it to local debugging
+# (DEBUG_TOOLBAR=0 turns it off there too, e.g. for benchmarks).
+DEBUG_TOOLBAR = DEBUG and os.environ.get('DEBUG_TOOLBAR', '1') == '1'
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(1, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
+# Per-route metrics (core.metrics), scraped from /metrics.
+METRICS_ALLOWED_IPS = INTERNAL_IPS
+METRICS_SLOW_REQUEST_SECONDS = 0.5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'foody.slow_requests': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
 ROOT_URLCONF = 'foody.urls'
 
 TEMPLATES = [
@@ -144,6 +165,17 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = '/media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Product image renditions (store.images) are rendered in a pool of worker
+# processes after the upload commits; set to False to render inline.
+IMAGE_RENDITIONS_ASYNC = True
+IMAGE_RENDITION_WORKERS = 2
+# Enforced while the upload streams in (store.uploads.ImageUploadHandler).
+PRODUCT_IMAGE_MAX_UPLOAD_SIZE = 50 * 1024
+PRODUCT_IMAGE_MAX_DIMENSION = 6000
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -152,13 +184,57 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING' : False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'store.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_PAGINATION_CLASS': 'store.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
+    # DRF's defaults, timed for the foody_render_seconds_total metric (core.metrics).
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.metrics.TimedJSONRenderer',
+        'core.metrics.TimedBrowsableAPIRenderer',
     ),
 }
 SIMPLE_JWT = {
    'AUTH_HEADER_TYPES': ('JWT',),
    "ACCESS_TOKEN_LIFETIME": timedelta(hours=24),
+   # Adds customer_id and perms claims (store.authentication).
+   "TOKEN_OBTAIN_SERIALIZER": "store.authentication.TokenObtainPairSerializer",
+}
+# Authenticated users and their customer ids, cached per process by
+# store.authentication.CachedJWTAuthentication. Saves in this process
+# invalidate at once; other processes catch up within the TTL.
+AUTH_IDENTITY_CACHE_TTL = 60
+AUTH_IDENTITY_CACHE_SIZE = 10000
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Versioned catalog responses (store.cache), per process. LocMemCache
+    # evicts least recently used entries past MAX_ENTRIES.
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+    # Their version tokens, shared by every web worker and management
+    # command on the host so a bump anywhere invalidates everywhere. Point
+    # CATALOG_VERSIONS_DIR at a shared volume, or swap in a shared backend
+    # (Redis, DatabaseCache) when running on several hosts.
+    'catalog_versions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CATALOG_VERSIONS_DIR', BASE_DIR / 'var' / 'catalog-versions'),
+        'TIMEOUT': None,
+        'OPTIONS': {
+            # Culling drops random keys; a dropped token only costs a miss.
+            'MAX_ENTRIES': 200000,
+        },
+    },
 }
+CATALOG_CACHE_ENABLED = True
 
 AUTH_USER_MODEL = 'core.User'
 
@@ -0,0 +1,152 @@
+"""
+JWT authentication that keeps resolved identities (the user row and the
+customer id) in a small per-process LRU cache, so authenticated requests
+don't load core.User and Customer from the database every time.
+
+Tokens issued by TokenObtainPairSerializer also carry the customer id
+and the permissions in PERMISSION_CLAIMS, which views read from
+request.auth instead of the database. Like any claim they hold until the
+token expires: revoking a permission takes effect on the user's next
+login or token expiry. is_staff and is_active are read from the cached
+user row instead, so changing them takes effect on the next request.
+
+Entries are dropped when the user or customer is saved or deleted (see
+store.signals.handlers) and expire after AUTH_IDENTITY_CACHE_TTL seconds,
+which bounds how long another process can serve a stale identity.
+"""
+import time
+from uuid import UUID
+from collections import OrderedDict
+from threading import Lock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer as BaseTokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from . import models
+
+# Permissions embedded in issued tokens; checked with has_token_permission.
+PERMISSION_CLAIMS = ['store.view_history']
+
+
+class IdentityCache:
+    # Keyed by str(user id): the token claim is a string, model pks aren't.
+
+    def __init__(self):
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    def get(self, user_id):
+        user_id = str(user_id)
+        with self.lock:
+            entry = self.entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.entries[user_id]
+                return None
+            self.entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, identity):
+        user_id = str(user_id)
+        with self.lock:
+            self.entries[user_id] = (time.monotonic() + settings.AUTH_IDENTITY_CACHE_TTL, identity)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > settings.AUTH_IDENTITY_CACHE_SIZE:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+identities = IdentityCache()
+
+
+def user_fields():
+    return [field.attname for field in get_user_model()._meta.concrete_fields]
+
+
+def load_identity(user_id):
+    """(user field values, customer id) for user_id in one query, or None if there is no such user."""
+    row = get_user_model().objects.filter(pk = user_id).values_list(*user_fields(), 'customer__id').first()
+    if row is None:
+        return None
+    return row[:-1], row[-1]
+
+
+def add_identity_claims(token, user):
+    customer_id = models.Customer.objects.filter(user_id = user.pk).values_list('id', flat = True).first()
+    token['customer_id'] = str(customer_id) if customer_id else None
+    token['perms'] = [perm for perm in PERMISSION_CLAIMS if user.has_perm(perm)]
+    return token
+
+
+def access_token_for(user):
+    """An access token with the identity claims, as TokenObtainPairSerializer issues them."""
+    return TokenObtainPairSerializer.get_token(user).access_token
+
+
+def has_token_permission(request, perm):
+    """
+    Whether the request's token grants perm. Requests without the claim
+    (older tokens, session or forced authentication) fall back to
+    user.has_perm.
+    """
+    perms = request.auth.get('perms') if hasattr(request.auth, 'get') else None
+    if perms is None or perm not in PERMISSION_CLAIMS:
+        return request.user.has_perm(perm)
+    return perm in perms
+
+
+def get_customer_id(user):
+    """The customer id of an authenticated user, without a query when it came from CachedJWTAuthentication."""
+    customer_id = getattr(user, 'customer_id', None)
+    if customer_id is None:
+        customer_id = models.Customer.objects.values_list('id', flat = True).get(user_id = user.id)
+    return customer_id
+
+
+class TokenObtainPairSerializer(BaseTokenObtainPairSerializer):
+    """Issues tokens with the identity claims (SIMPLE_JWT['TOKEN_OBTAIN_SERIALIZER'])."""
+
+    @classmethod
+    def get_token(cls, user):
+        # Refreshed access tokens copy these claims from the refresh token.
+        return add_identity_claims(super().get_token(user), user)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+
+        identity = identities.get(user_id)
+        if identity is None:
+            identity = load_identity(user_id)
+            if identity is None:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            identities.set(user_id, identity)
+        values, customer_id = identity
+        # A fresh instance per request: views may modify the user they get.
+        user = self.user_model.from_db(None, user_fields(), values)
+        user.customer_id = customer_id
+        if validated_token.get('customer_id'):
+            user.customer_id = UUID(validated_token['customer_id'])
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and \
+                validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
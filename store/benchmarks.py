@@ -0,0 +1,89 @@
+import random
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from . import counters, models, search
+
+
+def percentile(samples, percent):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    return {
+        'count': len(samples),
+        'mean_ms': round(sum(samples) / len(samples) * 1000, 3) if samples else 0.0,
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p95_ms': round(percentile(samples, 95) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def bench_client(**defaults):
+    # A REMOTE_ADDR outside INTERNAL_IPS keeps the debug toolbar out of the numbers.
+    return APIClient(HTTP_HOST='localhost', REMOTE_ADDR='10.0.0.1', **defaults)
+
+
+@contextmanager
+def rolled_back():
+    """Run a benchmark against the configured database and discard its rows."""
+    with override_settings(ALLOWED_HOSTS=['localhost']), transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def create_catalog(collections=5, products=100, images=2, reviews=2):
+    """Bulk create a synthetic catalog and return the products."""
+    collection_rows = models.Collection.objects.bulk_create([
+        models.Collection(title=f'Collection {i}') for i in range(collections)])
+    product_rows = models.Product.objects.bulk_create([
+        models.Product(
+            title=f'Product {i}', description=f'Synthetic product number {i}',
+            unit_price=Decimal(1 + i % 500) / 4, quantity=1000,
+            collection=collection_rows[i % collections])
+        for i in range(products)], batch_size=1000)
+    models.ProductImage.objects.bulk_create([
+        models.ProductImage(product=product, image=f'store/images/{product.id}-{i}.png')
+        for product in product_rows for i in range(images)], batch_size=1000)
+    models.Review.objects.bulk_create([
+        models.Review(product=product, name='Bench', description='Synthetic review')
+        for product in product_rows for i in range(reviews)], batch_size=1000)
+    counters.repair_product_counts(models.Collection.objects.filter(pk__in=[c.pk for c in collection_rows]))
+    counters.repair_review_counts(models.Product.objects.filter(collection__in=collection_rows))
+    search.reindex(models.Product.objects.filter(collection__in=collection_rows))
+    return product_rows
+
+
+def create_customers(count, prefix='bench'):
+    """Bulk create users (without usable passwords) and their customers."""
+    users = get_user_model().objects.bulk_create([
+        get_user_model()(username=f'{prefix}-{i}', email=f'{prefix}-{i}@example.com', password='!')
+        for i in range(count)], batch_size=1000)
+    # bulk_create skips the signal that creates each user's customer.
+    return models.Customer.objects.bulk_create([models.Customer(user=user) for user in users], batch_size=1000)
+
+
+def create_orders(customers, products, count, items=3, rng=None):
+    """Bulk create count orders spread over customers, each with items lines."""
+    rng = rng or random.Random(0)
+    orders = models.Order.objects.bulk_create([
+        models.Order(customer=customers[i % len(customers)]) for i in range(count)], batch_size=1000)
+    models.OrderItem.objects.bulk_create([
+        models.OrderItem(order=order, product=product, quantity=rng.randint(1, 5), unit_price=product.unit_price)
+        for order in orders for product in rng.sample(products, min(items, len(products)))], batch_size=1000)
+    return orders
@@ -0,0 +1,131 @@
+import hashlib
+import time
+from collections import Counter
+from threading import Lock
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+CACHE_ALIAS = 'catalog'
+# Version tokens live in a cache every process shares (web workers and
+# management commands alike); the responses themselves stay per process.
+VERSIONS_ALIAS = 'catalog_versions'
+
+# Per-process hit/miss counters, keyed by (scope, 'hit'|'miss').
+stats = Counter()
+_stats_lock = Lock()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_version_cache():
+    return caches[VERSIONS_ALIAS]
+
+
+def is_enabled():
+    return getattr(settings, 'CATALOG_CACHE_ENABLED', True)
+
+
+def _version_key(scope, pk=None):
+    return f'catalog:version:{scope}:{pk or "*"}'
+
+
+def get_versions(dependencies):
+    """
+    Return the current version token for each (scope, pk) dependency, and
+    the global one bump_all() moves. A missing token (never set, or
+    evicted) gets a fresh one, so entries cached under the old token can
+    never be served again.
+    """
+    cache = get_version_cache()
+    keys = [_version_key(scope, pk) for scope, pk in dependencies] + [_version_key('all')]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        # add() keeps a token another process set or bumped in the meantime.
+        for key in missing:
+            cache.add(key, time.time_ns(), timeout=None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key) for key in keys]
+
+
+def bump(scope, pk=None):
+    """Invalidate everything cached for scope/pk and the scope's lists."""
+    keys = [_version_key(scope)]
+    if pk is not None:
+        keys.append(_version_key(scope, pk))
+    version = time.time_ns()
+    get_version_cache().set_many({key: version for key in keys}, timeout=None)
+
+
+def bump_all():
+    """Invalidate every cached catalog response, in every process."""
+    get_version_cache().set(_version_key('all'), time.time_ns(), timeout=None)
+
+
+def record(scope, outcome):
+    with _stats_lock:
+        stats[(scope, outcome)] += 1
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(stats)
+
+
+class CatalogCacheMixin:
+    """
+    Read-through cache for list and retrieve. Views return the (scope, pk)
+    pairs their response depends on from get_cache_dependencies(); signal
+    handlers bump those versions whenever the underlying rows change.
+    Validator headers are cached with the data so conditional requests
+    that hit the cache are answered without touching the database.
+    """
+    cache_scope = None
+
+    def get_cache_dependencies(self):
+        return [(self.cache_scope, self.kwargs.get(self.lookup_url_kwarg or self.lookup_field))]
+
+    def get_cache_key(self, request):
+        versions = get_versions(self.get_cache_dependencies())
+        parts = [request.get_host(), request.get_full_path(), request.accepted_renderer.format, *versions]
+        digest = hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+        return f'catalog:response:{self.cache_scope}:{digest}'
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if not is_enabled():
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        key = self.get_cache_key(request)
+        entry = cache.get(key)
+        if entry is not None:
+            record(self.cache_scope, 'hit')
+            headers = entry['headers']
+            response = None
+            if 'ETag' in headers:
+                response = get_conditional_response(
+                    request, etag=headers['ETag'],
+                    last_modified=parse_http_date_safe(headers.get('Last-Modified', '')))
+            if response is None:
+                response = Response(entry['data'])
+            for header, value in headers.items():
+                response[header] = value
+            response['X-Cache'] = 'HIT'
+            return response
+        record(self.cache_scope, 'miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            headers = {header: response[header] for header in ('ETag', 'Last-Modified') if header in response}
+            cache.set(key, {'data': response.data, 'headers': headers})
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve, *args, **kwargs)
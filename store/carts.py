@@ -0,0 +1,161 @@
+import sqlite3
+from uuid import uuid4
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from . import models
+
+SWEEP_BATCH_SIZE = 1000
+
+
+def supports_upsert():
+    # INSERT ... ON CONFLICT DO UPDATE ... RETURNING: Postgres, SQLite >= 3.35.
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (3, 35)
+
+
+def touch(cart_id):
+    """Mark the cart as active now; sweep() deletes carts that stay untouched."""
+    return models.Cart.objects.filter(pk = cart_id).update(updated_at = timezone.now())
+
+
+def add_item(cart_id, product_id, quantity):
+    """
+    Add quantity of product to the cart, merging with an existing line.
+    Returns the CartItem, or None when the cart or the product doesn't exist.
+    """
+    with transaction.atomic():
+        # Touching the cart first locks its row for the rest of the add, so
+        # adds serialize with set_items() and sweep() can't delete the cart
+        # in between.
+        if not touch(cart_id):
+            return None
+        if supports_upsert():
+            return _upsert_item(cart_id, product_id, quantity)
+        return _add_item_fallback(cart_id, product_id, quantity)
+
+
+def _upsert_item(cart_id, product_id, quantity):
+    # One round trip: the SELECT only yields a row when both the cart and the
+    # product exist, and the unique (cart, product) constraint turns a second
+    # add into an increment instead of an IntegrityError.
+    item_table = connection.ops.quote_name(models.CartItem._meta.db_table)
+    cart_table = connection.ops.quote_name(models.Cart._meta.db_table)
+    product_table = connection.ops.quote_name(models.Product._meta.db_table)
+    uuid_field = models.CartItem._meta.pk
+    now = models.CartItem._meta.get_field('updated_at').get_db_prep_value(timezone.now(), connection)
+    sql = f'''
+        INSERT INTO {item_table} (id, cart_id, product_id, quantity, created_at, updated_at)
+        SELECT %s, c.id, p.id, %s, %s, %s
+        FROM {cart_table} c, {product_table} p
+        WHERE c.id = %s AND p.id = %s
+        ON CONFLICT (cart_id, product_id) DO UPDATE
+        SET quantity = {item_table}.quantity + excluded.quantity, updated_at = excluded.updated_at
+        RETURNING id, quantity
+    '''
+    params = [
+        uuid_field.get_db_prep_value(uuid4(), connection), quantity, now, now,
+        uuid_field.get_db_prep_value(cart_id, connection),
+        uuid_field.get_db_prep_value(product_id, connection),
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    item = models.CartItem(id = uuid_field.to_python(row[0]), cart_id = cart_id,
+                           product_id = product_id, quantity = row[1])
+    item._state.adding = False
+    return item
+
+
+def _add_item_fallback(cart_id, product_id, quantity):
+    with transaction.atomic():
+        if not (models.Cart.objects.filter(pk = cart_id).exists()
+                and models.Product.objects.filter(pk = product_id).exists()):
+            return None
+        item, created = models.CartItem.objects.select_for_update().get_or_create(
+            cart_id = cart_id, product_id = product_id, defaults = {'quantity': quantity})
+        if not created:
+            item.quantity = F('quantity') + quantity
+            item.save(update_fields = ['quantity', 'updated_at'])
+            item.refresh_from_db(fields = ['quantity'])
+        return item
+
+
+def set_items(cart_id, quantities):
+    """
+    Set the quantity of each product in quantities ({product_id: quantity})
+    on the cart in one transaction; a quantity of 0 removes the line.
+    Returns False when the cart doesn't exist.
+    """
+    with transaction.atomic():
+        # Touching the cart locks its row, which serializes concurrent syncs
+        # and single adds of the cart.
+        if not touch(cart_id):
+            return False
+        existing = {item.product_id: item for item in models.CartItem.objects.filter(
+            cart_id = cart_id, product_id__in = quantities)}
+        now = timezone.now()
+        created, updated, removed = [], [], []
+        for product_id, quantity in quantities.items():
+            item = existing.get(product_id)
+            if item is None:
+                if quantity:
+                    created.append(models.CartItem(cart_id = cart_id, product_id = product_id, quantity = quantity))
+            elif not quantity:
+                removed.append(item.pk)
+            elif item.quantity != quantity:
+                item.quantity = quantity
+                item.updated_at = now
+                updated.append(item)
+        if removed:
+            models.CartItem.objects.filter(pk__in = removed).delete()
+        if updated:
+            models.CartItem.objects.bulk_update(updated, ['quantity', 'updated_at'])
+        if created:
+            # Writers that bypass add_item() don't take the cart lock, so a
+            # line read as missing may exist by now: set its quantity.
+            models.CartItem.objects.bulk_create(
+                created, update_conflicts = True, unique_fields = ['cart', 'product'],
+                update_fields = ['quantity', 'updated_at'])
+    return True
+
+
+def delete_cart(cart_id):
+    """Delete the cart and its lines with two plain DELETEs, no cascade collection."""
+    delete_carts([cart_id])
+
+
+def delete_carts(cart_ids):
+    """Delete the carts and their lines; returns (carts, items) deleted."""
+    item_table = connection.ops.quote_name(models.CartItem._meta.db_table)
+    cart_table = connection.ops.quote_name(models.Cart._meta.db_table)
+    cart_ids = [models.Cart._meta.pk.get_db_prep_value(cart_id, connection) for cart_id in cart_ids]
+    placeholders = ', '.join(['%s'] * len(cart_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {item_table} WHERE cart_id IN ({placeholders})', cart_ids)
+        items = cursor.rowcount
+        cursor.execute(f'DELETE FROM {cart_table} WHERE id IN ({placeholders})', cart_ids)
+        return cursor.rowcount, items
+
+
+def sweep(cutoff, batch_size=SWEEP_BATCH_SIZE):
+    """
+    Delete the carts not touched since cutoff, and their lines, batch_size
+    carts per transaction so no lock is held for long. Carts locked by a
+    request in progress are skipped. Yields (carts, items) deleted per batch.
+    """
+    while True:
+        with transaction.atomic():
+            # Read through cart_updated_idx, oldest first.
+            cart_ids = list(models.Cart.objects.select_for_update(skip_locked = True)
+                            .filter(updated_at__lt = cutoff).order_by('updated_at')
+                            .values_list('pk', flat = True)[:batch_size])
+            if not cart_ids:
+                return
+            deleted = delete_carts(cart_ids)
+        yield deleted
+        if len(cart_ids) < batch_size:
+            return
@@ -0,0 +1,108 @@
+import hashlib
+from calendar import timegm
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified validators computed from max(updated_at) and row
+    counts of the queryset, so 304s are answered before serialization.
+    Paginated lists take them from the rows of the page being served, so
+    a page costs the same however long the list is.
+
+    conditional_dependencies lists relations that are part of the
+    representation (e.g. 'items__product'); their updated_at and row counts
+    feed the validators too. Children that only change a parent's
+    representation (images, reviews) touch the parent's updated_at instead.
+    """
+    conditional_dependencies = ()
+    # Unsafe methods that honour If-Match / If-Unmodified-Since.
+    precondition_methods = ()
+
+    def get_validators(self, queryset):
+        aggregates = {'rows': Count('pk', distinct=True), 'modified': Max('updated_at')}
+        for index, path in enumerate(self.conditional_dependencies):
+            aggregates[f'rows_{index}'] = Count(f'{path}__pk', distinct=True)
+            aggregates[f'modified_{index}'] = Max(f'{path}__updated_at')
+        values = queryset.order_by().aggregate(**aggregates)
+        if not values['rows']:
+            return None, None
+
+        modified = [value for key, value in values.items() if key.startswith('modified') and value]
+        last_modified = max(modified) if modified else None
+        parts = [self.request.get_full_path(), self.request.accepted_renderer.media_type]
+        parts += [value.isoformat() if hasattr(value, 'isoformat') else value
+                  for _, value in sorted(values.items())]
+        etag = '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+        return etag, last_modified
+
+    def get_page_validators(self, page):
+        if not page:
+            return None, None
+        pks = [row.pk for row in page]
+        modified = [row.updated_at for row in page]
+        parts = [self.request.get_full_path(), self.request.accepted_renderer.media_type,
+                 self.paginator.get_next_link(), self.paginator.get_previous_link(),
+                 [(str(row.pk), row.updated_at.isoformat()) for row in page]]
+        if self.conditional_dependencies:
+            aggregates = {}
+            for index, path in enumerate(self.conditional_dependencies):
+                aggregates[f'rows_{index}'] = Count(f'{path}__pk', distinct=True)
+                aggregates[f'modified_{index}'] = Max(f'{path}__updated_at')
+            values = type(page[0])._default_manager.filter(pk__in = pks).order_by().aggregate(**aggregates)
+            modified += [value for key, value in values.items() if key.startswith('modified') and value]
+            parts += [value.isoformat() if hasattr(value, 'isoformat') else value
+                      for _, value in sorted(values.items())]
+        etag = '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+        return etag, max(modified)
+
+    def get_detail_queryset(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        return self.get_queryset().filter(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+
+    def conditional_response(self, request, validators, handler, *args, **kwargs):
+        etag, last_modified = validators()
+        if etag is None:
+            return handler(request, *args, **kwargs)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timegm(last_modified.utctimetuple()))
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if request.method not in ('GET', 'HEAD'):
+                etag, last_modified = validators()
+        elif response.status_code != 304:
+            return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(timegm(last_modified.utctimetuple()))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return self.conditional_response(
+                request, lambda: self.get_validators(queryset), super().list, *args, **kwargs)
+
+        def handler(request, *args, **kwargs):
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return self.conditional_response(request, lambda: self.get_page_validators(page), handler, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        queryset = self.get_detail_queryset()
+        return self.conditional_response(
+            request, lambda: self.get_validators(queryset), super().retrieve, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        if request.method not in self.precondition_methods:
+            return super().update(request, *args, **kwargs)
+        with transaction.atomic():
+            # Hold the row so nothing changes between the check and the write.
+            queryset = self.get_detail_queryset()
+            list(queryset.select_for_update().values_list('pk', flat=True))
+            return self.conditional_response(
+                request, lambda: self.get_validators(queryset), super().update, *args, **kwargs)
@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from . import models
+
+
+def _adjusted(field, delta):
+    # A counter that drifted to 0 stays there instead of breaking the
+    # unsigned column's CHECK; repair_counters fixes it.
+    return Greatest(F(field) + delta, 0) if delta < 0 else F(field) + delta
+
+
+def adjust_product_count(collection_id, delta):
+    models.Collection.objects.filter(pk = collection_id).update(
+        product_count = _adjusted('product_count', delta), updated_at = timezone.now())
+
+
+def adjust_review_count(product_id, delta):
+    models.Product.objects.filter(pk = product_id).update(
+        review_count = _adjusted('review_count', delta), updated_at = timezone.now())
+
+
+def _count(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(count = Count('pk')).values('count')), 0)
+
+
+def _repair(queryset, counter, actual, batch_size):
+    """Rewrite counter on rows of queryset where it disagrees with actual."""
+    repaired = 0
+    ids = queryset.order_by('pk').values_list('pk', flat=True)
+    batch = []
+    for pk in ids.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) == batch_size:
+            repaired += _repair_batch(queryset.model, batch, counter, actual)
+            batch = []
+    if batch:
+        repaired += _repair_batch(queryset.model, batch, counter, actual)
+    return repaired
+
+
+def _repair_batch(model, ids, counter, actual):
+    with transaction.atomic():
+        stale = (model.objects.filter(pk__in = ids).annotate(actual = actual)
+                 .exclude(**{counter: F('actual')}).values_list('pk', flat=True))
+        return model.objects.filter(pk__in = list(stale)).update(**{counter: actual, 'updated_at': timezone.now()})
+
+
+def repair_product_counts(queryset=None, batch_size=1000):
+    if queryset is None:
+        queryset = models.Collection.objects.all()
+    return _repair(queryset, 'product_count', _count(models.Product, 'collection'), batch_size)
+
+
+def repair_review_counts(queryset=None, batch_size=1000):
+    if queryset is None:
+        queryset = models.Product.objects.all()
+    return _repair(queryset, 'review_count', _count(models.Review, 'product'), batch_size)
@@ -0,0 +1,127 @@
+"""
+CSV and NDJSON exports of orders and products for staff.
+
+Rows are read through a server-side cursor (QuerySet.iterator) and
+written to the response as they arrive, so memory use does not grow with
+the size of the export.
+"""
+import csv
+import itertools
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+from rest_framework import serializers
+from . import models
+
+CHUNK_SIZE = 2000
+# Lines are joined into blocks of about this many characters before being
+# handed to the server, instead of one write per row.
+BLOCK_SIZE = 64 * 1024
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+ORDER_FIELDS = ['id', 'created_at', 'payment_status', 'customer_id', 'customer__user__email']
+ORDER_COLUMNS = ['order_id', 'created_at', 'payment_status', 'customer_id', 'customer_email']
+ITEM_FIELDS = ['items__id', 'items__product_id', 'items__product__title', 'items__quantity', 'items__unit_price']
+ITEM_COLUMNS = ['item_id', 'product_id', 'product_title', 'quantity', 'unit_price']
+PRODUCT_FIELDS = ['id', 'title', 'collection_id', 'collection__title', 'unit_price', 'price__effective_price',
+                  'quantity', 'created_at', 'updated_at']
+PRODUCT_COLUMNS = ['product_id', 'title', 'collection_id', 'collection_title', 'unit_price', 'effective_price',
+                   'quantity', 'created_at', 'updated_at']
+
+
+class ExportParamsSerializer(serializers.Serializer):
+    # Not "format": DRF reads that one to pick a renderer.
+    file_format = serializers.ChoiceField(choices = list(CONTENT_TYPES), default = 'csv')
+    created_after = serializers.DateTimeField(required = False)
+    created_before = serializers.DateTimeField(required = False)
+
+
+def filter_created(queryset, params):
+    if 'created_after' in params:
+        queryset = queryset.filter(created_at__gte = params['created_after'])
+    if 'created_before' in params:
+        queryset = queryset.filter(created_at__lt = params['created_before'])
+    return queryset
+
+
+class Echo:
+    """A file-like object csv.writer can write to that hands the line back."""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(objects):
+    for obj in objects:
+        yield json.dumps(obj, cls=DjangoJSONEncoder) + '\n'
+
+
+def blocks(lines):
+    block, size = [], 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield ''.join(block)
+            block, size = [], 0
+    if block:
+        yield ''.join(block)
+
+
+def export_orders(params):
+    """Lines of the order export: one row per item in CSV, one object per order in NDJSON."""
+    # Orders without items still get a row, with empty item columns.
+    rows = (filter_created(models.Order.objects.all(), params)
+            .order_by('created_at', 'id', 'items__id')
+            .values_list(*ORDER_FIELDS, *ITEM_FIELDS)
+            .iterator(chunk_size = CHUNK_SIZE))
+    if params['file_format'] == 'csv':
+        return csv_lines(ORDER_COLUMNS + ITEM_COLUMNS, rows)
+    width = len(ORDER_FIELDS)
+    # The rows arrive ordered by order, so each order's items are adjacent.
+    return ndjson_lines(
+        {**dict(zip(ORDER_COLUMNS, order)),
+         'items': [dict(zip(ITEM_COLUMNS, row[width:])) for row in items if row[width] is not None]}
+        for order, items in itertools.groupby(rows, key=lambda row: row[:width]))
+
+
+def export_products(params):
+    rows = (filter_created(models.Product.objects.all(), params)
+            .order_by('created_at', 'id')
+            .values_list(*PRODUCT_FIELDS)
+            .iterator(chunk_size = CHUNK_SIZE))
+    if params['file_format'] == 'csv':
+        return csv_lines(PRODUCT_COLUMNS, rows)
+    return ndjson_lines(dict(zip(PRODUCT_COLUMNS, row)) for row in rows)
+
+
+EXPORTS = {
+    'orders': export_orders,
+    'products': export_products,
+}
+
+
+def streaming_export(name, params):
+    lines = EXPORTS[name](params)
+    filename = f'{name}-{timezone.now():%Y%m%dT%H%M%SZ}.{params["file_format"]}'
+    return StreamingHttpResponse(
+        blocks(lines), content_type = CONTENT_TYPES[params['file_format']],
+        headers = {'Content-Disposition': content_disposition_header(True, filename)})
+
+
+def export_response(request, name):
+    params = ExportParamsSerializer(data = request.query_params)
+    params.is_valid(raise_exception = True)
+    return streaming_export(name, params.validated_data)
@@ -0,0 +1,42 @@
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    collection = serializers.UUIDField(required = False)
+    unit_price_min = serializers.DecimalField(max_digits = 6, decimal_places = 2, required = False)
+    unit_price_max = serializers.DecimalField(max_digits = 6, decimal_places = 2, required = False)
+    in_stock = serializers.BooleanField(required = False, default = False)
+    created_after = serializers.DateTimeField(required = False)
+    created_before = serializers.DateTimeField(required = False)
+    ordering = serializers.ChoiceField(required = False, choices = [
+        'unit_price', '-unit_price', 'created_at', '-created_at'])
+
+
+class ProductFilter(BaseFilterBackend):
+    """
+    Whitelisted product filters and orderings. Every combination is served
+    by one of the composite or partial indexes on Product.Meta.indexes;
+    add the index before adding a parameter here.
+    """
+    lookups = {
+        'collection': 'collection_id',
+        'unit_price_min': 'unit_price__gte',
+        'unit_price_max': 'unit_price__lte',
+        'created_after': 'created_at__gte',
+        'created_before': 'created_at__lt',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        serializer = ProductFilterSerializer(data = request.query_params)
+        serializer.is_valid(raise_exception = True)
+        params = serializer.validated_data
+        queryset = queryset.filter(**{lookup: params[name] for name, lookup in self.lookups.items()
+                                      if name in params})
+        if params['in_stock']:
+            # Matches the condition of the partial product_instock_* indexes.
+            queryset = queryset.filter(quantity__gt = 0)
+        if 'ordering' in params:
+            ordering = params['ordering']
+            queryset = queryset.order_by(ordering, '-id' if ordering.startswith('-') else 'id')
+        return queryset
@@ -0,0 +1,106 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from . import cache, imaging, models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FORMAT = 'webp'
+
+_executors = None
+_executors_lock = threading.Lock()
+
+
+def get_executors():
+    """
+    The process pool that renders and the threads that feed it and store
+    the results. Workers are spawned, not forked, and only import
+    store.imaging.
+    """
+    global _executors
+    with _executors_lock:
+        if _executors is None:
+            workers = settings.IMAGE_RENDITION_WORKERS
+            _executors = (ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')),
+                          ThreadPoolExecutor(workers, thread_name_prefix='renditions'))
+        return _executors
+
+
+def schedule(image_id):
+    """Generate the renditions of image_id off the request path."""
+    if not settings.IMAGE_RENDITIONS_ASYNC:
+        return generate(image_id)
+    processes, threads = get_executors()
+    return threads.submit(_generate_in_background, processes, image_id)
+
+
+def generate_many(image_ids):
+    """Render many images in parallel and return how many got renditions."""
+    processes, threads = get_executors()
+    return sum(bool(renditions) for renditions in threads.map(
+        lambda image_id: _generate_in_background(processes, image_id), image_ids))
+
+
+def _generate_in_background(processes, image_id):
+    try:
+        return generate(image_id, render=lambda data: processes.submit(imaging.render, data).result())
+    except Exception:
+        logger.exception('Rendering product image %s failed', image_id)
+    finally:
+        connection.close()
+
+
+def generate(image_id, render=imaging.render):
+    """Render and store every rendition of the image, replacing older ones."""
+    image = models.ProductImage.objects.filter(pk = image_id).first()
+    if image is None:
+        return []
+    with image.image.open('rb') as original:
+        width, height, rendered = render(original.read())
+
+    renditions = []
+    for size, name, content, rendition_width, rendition_height in rendered:
+        rendition = models.ProductImageRendition(
+            image = image, size = size, format = name,
+            width = rendition_width, height = rendition_height, bytes = len(content))
+        rendition.file.save(f'{image_id}-{size}.{imaging.EXTENSIONS[name]}', ContentFile(content), save = False)
+        renditions.append(rendition)
+
+    with transaction.atomic():
+        # The image may have been deleted or replaced while rendering.
+        if not models.ProductImage.objects.select_for_update().filter(pk = image_id, image = image.image.name).exists():
+            transaction.on_commit(lambda: delete_files(renditions))
+            return []
+        # Their files go with them (see the post_delete handler).
+        models.ProductImageRendition.objects.filter(image_id = image_id).delete()
+        models.ProductImageRendition.objects.bulk_create(renditions)
+        now = timezone.now()
+        models.ProductImage.objects.filter(pk = image_id).update(width = width, height = height, updated_at = now)
+        # Renditions are part of the product's representation.
+        models.Product.objects.filter(pk = image.product_id).update(updated_at = now)
+        transaction.on_commit(lambda: cache.bump('product', image.product_id))
+    return renditions
+
+
+def delete_files(renditions):
+    for rendition in renditions:
+        rendition.file.delete(save = False)
+
+
+def requested_rendition(request):
+    """The (size, format) a request asks for with ?size= and ?image_format=."""
+    if request is None:
+        return None, DEFAULT_FORMAT
+    size = request.query_params.get('size') or None
+    name = request.query_params.get('image_format') or DEFAULT_FORMAT
+    if size is not None and size not in imaging.SIZES:
+        raise ValidationError({'size': [f'Choose one of {", ".join(imaging.SIZES)}.']})
+    if name not in imaging.FORMATS:
+        raise ValidationError({'image_format': [f'Choose one of {", ".join(imaging.FORMATS)}.']})
+    return size, name
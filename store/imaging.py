@@ -0,0 +1,51 @@
+"""
+Pillow rendering for product image renditions. Kept free of Django imports
+so it can run in spawned worker processes (see store.images).
+"""
+import io
+from PIL import Image, ImageOps
+
+# Longest edge in pixels; images are never upscaled.
+SIZES = {'large': 1200, 'medium': 480, 'thumb': 160}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+ORIENTATION_TAG = 0x0112
+
+
+def flatten(image):
+    # JPEG has no alpha channel; composite transparent images onto white.
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render(data):
+    """
+    Render every size in every format from the original image bytes.
+    Returns (width, height, [(size, format, content, width, height)]) where
+    the first width and height are the original's.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        # EXIF orientations 5-8 are rotated by 90 degrees.
+        orientation = original.getexif().get(ORIENTATION_TAG, 1)
+        width, height = original.size if orientation < 5 else original.size[::-1]
+        # JPEG can decode straight at a reduced scale, which is most of the cost.
+        original.draft('RGB', (SIZES['large'], SIZES['large']))
+        image = flatten(ImageOps.exif_transpose(original))
+
+    renditions = []
+    # Largest first, each size resampled from the previous one.
+    for size, edge in SIZES.items():
+        image = image.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=3.0)
+        for name, (pil_format, options) in FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **options)
+            renditions.append((size, name, buffer.getvalue(), image.width, image.height))
+    return width, height, renditions
@@ -0,0 +1,259 @@
+"""
+Bulk product import (upsert) from CSV or NDJSON, for supplier price and
+stock updates.
+
+Rows are keyed by product id, or by title and collection. The file is
+read row by row and applied in batches: each batch is validated with a
+handful of queries and upserted with bulk_create(update_conflicts=True)
+in its own transaction. Rows that fail are reported by number and the
+rest of the batch still goes in.
+"""
+import csv
+import io
+import json
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from rest_framework import serializers
+from . import cache, counters, models, pricing, search
+
+BATCH_SIZE = 1000
+# Past this many, errors are counted but no longer listed.
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ['csv', 'ndjson']
+# Import column: Product attribute.
+FIELDS = {
+    'title': 'title',
+    'description': 'description',
+    'unit_price': 'unit_price',
+    'quantity': 'quantity',
+    'collection': 'collection_id',
+}
+REQUIRED_TO_CREATE = ['title', 'unit_price', 'quantity', 'collection']
+
+
+class ProductImportSerializer(serializers.Serializer):
+    id = serializers.UUIDField(required = False)
+    title = serializers.CharField(max_length = 255, required = False)
+    collection = serializers.UUIDField(required = False)
+    description = serializers.CharField(required = False, allow_blank = True)
+    unit_price = serializers.DecimalField(max_digits = 6, decimal_places = 2, min_value = 0, required = False)
+    quantity = serializers.FloatField(min_value = 0, required = False)
+
+    def validate(self, attrs):
+        if 'id' not in attrs and not ('title' in attrs and 'collection' in attrs):
+            raise serializers.ValidationError('Each row needs an id, or a title and a collection.')
+        return attrs
+
+
+class ImportUploadSerializer(serializers.Serializer):
+    file = serializers.FileField()
+    # Taken from the file name (.ndjson/.jsonl, otherwise CSV) when omitted.
+    file_format = serializers.ChoiceField(choices = FORMATS, required = False)
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.error_count = 0
+        self.errors = []
+
+    def error(self, row, detail):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'errors': detail})
+
+    def count(self, change):
+        if change.created:
+            self.created += 1
+        else:
+            self.updated += 1
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'unchanged': self.unchanged,
+                'error_count': self.error_count, 'errors': sorted(self.errors, key=lambda error: error['row'])}
+
+
+class Change:
+    """What a batch does to one product."""
+
+    def __init__(self, product, created=False):
+        self.product = product
+        self.created = created
+        self.fields = set()
+        self.original_collection_id = None if created else product.collection_id
+        self.rows = []
+
+    @property
+    def modified(self):
+        return self.created or bool(self.fields)
+
+
+def guess_format(name):
+    return 'ndjson' if name.lower().endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def read_rows(file, file_format):
+    """Yield (row number, dict or None, parse error) for each row of a text file."""
+    if file_format == 'csv':
+        for number, row in enumerate(csv.DictReader(file), 1):
+            yield number, row, None
+        return
+    number = 0
+    for line in file:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield number, None, f'Invalid JSON: {error}'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Each line must be a JSON object.'
+            continue
+        yield number, row, None
+
+
+def import_products(file, file_format, batch_size=BATCH_SIZE):
+    result = ImportResult()
+    # One serializer validates every row: building one per row costs more
+    # than the rest of the import.
+    validator = ProductImportSerializer()
+    batch = []
+    for number, row, parse_error in read_rows(file, file_format):
+        if parse_error is not None:
+            result.error(number, {'non_field_errors': [parse_error]})
+            continue
+        try:
+            # Empty CSV cells and JSON nulls leave the field as it is.
+            attrs = validator.run_validation({key: value for key, value in row.items()
+                                              if key is not None and value not in ('', None)})
+        except serializers.ValidationError as error:
+            result.error(number, serializers.as_serializer_error(error))
+            continue
+        batch.append((number, attrs))
+        if len(batch) == batch_size:
+            _import_batch(batch, result)
+            batch = []
+    if batch:
+        _import_batch(batch, result)
+    return result
+
+
+def import_upload(upload, file_format=None, batch_size=BATCH_SIZE):
+    """Import an uploaded file, taking the format from its name unless given."""
+    with io.TextIOWrapper(upload.open('rb'), encoding = 'utf-8-sig', newline = '') as file:
+        return import_products(file, file_format or guess_format(upload.name), batch_size)
+
+
+def _import_batch(rows, result):
+    collection_ids = {attrs['collection'] for _, attrs in rows if 'collection' in attrs}
+    found = set(models.Collection.objects.filter(pk__in = collection_ids).values_list('id', flat=True))
+    rows = [(number, attrs) for number, attrs in rows if _check_collection(number, attrs, found, result)]
+
+    products = models.Product.objects.defer('search_vector')
+    by_id = products.in_bulk([attrs['id'] for _, attrs in rows if 'id' in attrs])
+    by_key = {}
+    keyed = [attrs for _, attrs in rows if 'id' not in attrs]
+    if keyed:
+        for product in products.filter(
+                collection_id__in = {attrs['collection'] for attrs in keyed},
+                title__in = {attrs['title'] for attrs in keyed}):
+            # One instance per product, whichever way the rows name it.
+            product = by_id.setdefault(product.pk, product)
+            by_key.setdefault((product.title, product.collection_id), []).append(product)
+
+    changes = {}
+    for number, attrs in rows:
+        if 'id' in attrs:
+            product = by_id.get(attrs['id'])
+        else:
+            matches = by_key.get((attrs['title'], attrs['collection']), [])
+            if len(matches) > 1:
+                result.error(number, {'non_field_errors': [
+                    'More than one product has this title in this collection; import it by id.']})
+                continue
+            product = matches[0] if matches else None
+        if product is None:
+            missing = [field for field in REQUIRED_TO_CREATE if field not in attrs]
+            if missing:
+                result.error(number, {field: ['This field is required to create a product.'] for field in missing})
+                continue
+            product = models.Product(description = '')
+            if 'id' in attrs:
+                product.id = attrs['id']
+            # Later rows of the batch with the same key update this one.
+            by_id[product.id] = product
+            by_key[(attrs['title'], attrs['collection'])] = [product]
+            changes[product.id] = Change(product, created = True)
+        change = changes.setdefault(product.id, Change(product))
+        change.rows.append(number)
+        for field, attribute in FIELDS.items():
+            if field in attrs and getattr(product, attribute) != attrs[field]:
+                setattr(product, attribute, attrs[field])
+                change.fields.add(attribute)
+
+    result.unchanged += sum(len(change.rows) for change in changes.values() if not change.modified)
+    changes = [change for change in changes.values() if change.modified]
+    if not changes:
+        return
+    try:
+        _write(changes)
+    except DatabaseError:
+        # Find the offending rows by writing the products one at a time.
+        for change in changes:
+            try:
+                _write([change])
+            except DatabaseError as error:
+                for number in change.rows:
+                    result.error(number, {'non_field_errors': [str(error)]})
+            else:
+                result.count(change)
+        return
+    for change in changes:
+        result.count(change)
+
+
+def _check_collection(number, attrs, found, result):
+    if 'collection' in attrs and attrs['collection'] not in found:
+        result.error(number, {'collection': ['No collection with the given ID was found.']})
+        return False
+    return True
+
+
+def _write(changes):
+    products = [change.product for change in changes]
+    for product in products:
+        # Deferred, and not written: the reindex below recomputes it.
+        product.search_vector = None
+    product_ids = [product.pk for product in products]
+    collection_ids = {product.collection_id for product in products} | \
+        {change.original_collection_id for change in changes if change.original_collection_id is not None}
+    # Only the prices of new products and of ones whose price or collection
+    # (and so promotions) changed need recomputing.
+    repriced = [change.product.pk for change in changes
+                if change.created or change.fields & {'unit_price', 'collection_id'}]
+    with transaction.atomic():
+        # One INSERT ... ON CONFLICT (id) DO UPDATE for new and existing
+        # products alike, which also covers an id created concurrently
+        # since the lookup.
+        models.Product.objects.bulk_create(
+            products, update_conflicts = True, unique_fields = ['id'],
+            update_fields = [*sorted(set().union(*(change.fields for change in changes))), 'updated_at'])
+        # bulk_create skips the signal handlers that keep these in step
+        # with the product rows.
+        if repriced:
+            pricing.refresh(models.Product.objects.filter(pk__in = repriced))
+        search.reindex(models.Product.objects.filter(pk__in = product_ids))
+        counters.repair_product_counts(models.Collection.objects.filter(pk__in = collection_ids))
+        transaction.on_commit(lambda: _bump(product_ids, collection_ids))
+
+
+def _bump(product_ids, collection_ids):
+    for product_id in product_ids:
+        cache.bump('product', product_id)
+    for collection_id in collection_ids:
+        cache.bump('collection', collection_id)
+
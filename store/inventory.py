@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models import Case, F, FloatField, When
+from django.utils import timezone
+from . import cache, models
+
+
+def lock(product_ids):
+    """
+    Lock the product rows and return their stock as {product_id: quantity}.
+    Rows are locked in id order so concurrent checkouts over overlapping
+    products can't deadlock.
+    """
+    return dict(models.Product.objects.select_for_update().filter(
+        pk__in = product_ids).order_by('pk').values_list('pk', 'quantity'))
+
+
+def reserve(quantities, stock=None):
+    """
+    Take quantities ({product_id: quantity}) out of stock. Must run inside
+    a transaction. stock is the result of lock() when the caller already
+    holds the product rows.
+
+    Returns {product_id: available} for every product that is short; in
+    that case nothing is decremented.
+    """
+    if stock is None:
+        stock = lock(quantities)
+    shortfalls = {product_id: stock.get(product_id, 0) for product_id, quantity in quantities.items()
+                  if stock.get(product_id, 0) < quantity}
+    if shortfalls:
+        return shortfalls
+
+    # One batched UPDATE; the rows are already locked and checked.
+    models.Product.objects.filter(pk__in = quantities).update(
+        quantity = Case(*[When(pk = product_id, then = F('quantity') - quantity)
+                          for product_id, quantity in quantities.items()], output_field = FloatField()),
+        updated_at = timezone.now())
+    transaction.on_commit(lambda: [cache.bump('product', product_id) for product_id in quantities])
+    return {}
@@ -0,0 +1,227 @@
+import json
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from core import metrics
+from store import models
+from store.authentication import access_token_for
+from store.benchmarks import bench_client, create_catalog, create_customers, create_orders, summarize
+
+FLOWS = ['catalog_browse', 'product_detail', 'add_to_cart', 'checkout', 'order_history']
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class InProcessTransport:
+    """Requests through the Django test client, one at a time."""
+
+    def __init__(self):
+        self.client = bench_client()
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'HTTP_AUTHORIZATION': f'JWT {token}'} if token else {}
+        response = getattr(self.client, method.lower())(path, body, format='json', **headers)
+        return response.status_code, response.content
+
+
+class HttpTransport:
+    """Requests over HTTP to a threaded server running in this process."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'JWT {token}'
+        data = json.dumps(body, default=str).encode() if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+class Command(BaseCommand):
+    help = ('Seed a synthetic store and drive its main flows (catalog browse, product detail, '
+            'add-to-cart, checkout, order history); prints throughput, latency and queries per request as JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collections', type=int, default=10)
+        parser.add_argument('--products', type=int, default=1000)
+        parser.add_argument('--images', type=int, default=2, help='Per product')
+        parser.add_argument('--reviews', type=int, default=3, help='Per product')
+        parser.add_argument('--customers', type=int, default=50)
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--requests', type=int, default=200, help='Per flow')
+        parser.add_argument('--flows', nargs='+', choices=FLOWS, default=FLOWS)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--http', action='store_true',
+                            help='Serve the app on a local port and send requests over HTTP. On SQLite, '
+                                 'concurrent checkouts fail with "database is locked" and count as errors')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent clients with --http')
+        parser.add_argument('--keep', action='store_true', help='Leave the seeded rows in the database')
+        parser.add_argument('--output', help='Write the JSON report to this file as well')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        # The server threads use their own connections, so the dataset is
+        # committed and deleted afterwards rather than rolled back.
+        with override_settings(ALLOWED_HOSTS=['localhost', '127.0.0.1'], INTERNAL_IPS=[],
+                               CATALOG_CACHE_ENABLED=True):
+            start = time.perf_counter()
+            self.seed(options)
+            seeded = time.perf_counter() - start
+            try:
+                if options['http']:
+                    results = self.run_http(options)
+                else:
+                    results = self.run_flows(options, InProcessTransport, workers=1)
+            finally:
+                if not options['keep']:
+                    self.cleanup()
+
+        report = {
+            'commit': self.commit(),
+            'database': settings.DATABASES['default']['ENGINE'].rsplit('.', 1)[-1],
+            'transport': 'http' if options['http'] else 'in_process',
+            'workers': options['workers'] if options['http'] else 1,
+            'dataset': {name: options[name] for name in
+                        ('collections', 'products', 'images', 'reviews', 'customers', 'orders', 'seed')},
+            'seed_s': round(seeded, 2),
+            'flows': results,
+        }
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
+
+    def seed(self, options):
+        prefix = f'bench-{options["seed"]}'
+        products = create_catalog(collections=options['collections'], products=options['products'],
+                                  images=options['images'], reviews=options['reviews'])
+        models.Product.objects.filter(pk__in=[product.pk for product in products]).update(quantity=10 ** 6)
+        customers = create_customers(options['customers'], prefix=prefix)
+        create_orders(customers, products, options['orders'], rng=self.rng)
+        self.collection_ids = {product.collection_id for product in products}
+        self.product_ids = [product.pk for product in products]
+        self.customers = customers
+        self.tokens = [str(access_token_for(customer.user)) for customer in customers]
+        self.cart_ids = []
+
+    def cleanup(self):
+        customer_ids = [customer.pk for customer in self.customers]
+        order_ids = [str(pk) for pk in models.Order.objects.filter(customer_id__in=customer_ids).values_list('pk', flat=True)]
+        models.OutboxEvent.objects.filter(topic='order_created', payload__order_id__in=order_ids).delete()
+        models.OrderItem.objects.filter(order__customer_id__in=customer_ids).delete()
+        models.Order.objects.filter(customer_id__in=customer_ids).delete()
+        get_user_model().objects.filter(customer__in=customer_ids).delete()
+        models.Cart.objects.filter(pk__in=self.cart_ids).delete()
+        models.Product.objects.filter(collection_id__in=self.collection_ids).delete()
+        models.Collection.objects.filter(pk__in=self.collection_ids).delete()
+
+    def commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                  text=True, cwd=settings.BASE_DIR, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def run_http(self, options):
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietRequestHandler)
+        server.set_app(get_wsgi_application())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        host, port = server.server_address
+        try:
+            return self.run_flows(options, lambda: HttpTransport(f'http://{host}:{port}'), options['workers'])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def run_flows(self, options, transport_class, workers):
+        results = {}
+        for flow in options['flows']:
+            # Prepare every iteration up front (carts to check out etc.) so
+            # only the flow's own requests are timed.
+            iterations = [getattr(self, f'prepare_{flow}')() for _ in range(options['requests'])]
+            before = metrics.registry.snapshot()
+            samples, statuses = [], []
+            lock = threading.Lock()
+            local = threading.local()
+
+            def run(iteration):
+                if not hasattr(local, 'transport'):
+                    local.transport = transport_class()
+                for method, path, token, body in iteration:
+                    start = time.perf_counter()
+                    status, _ = local.transport.request(method, path, token, body)
+                    duration = time.perf_counter() - start
+                    with lock:
+                        samples.append(duration)
+                        statuses.append(status)
+
+            start = time.perf_counter()
+            if workers == 1:
+                for iteration in iterations:
+                    run(iteration)
+            else:
+                with ThreadPoolExecutor(workers) as pool:
+                    list(pool.map(run, iterations))
+            elapsed = time.perf_counter() - start
+
+            after = metrics.registry.snapshot()
+            requests = sum(count - before.get(route, (0, 0))[0] for route, (count, _) in after.items())
+            queries = sum(total - before.get(route, (0, 0))[1] for route, (_, total) in after.items())
+            results[flow] = {
+                **summarize(samples),
+                'throughput_rps': round(len(samples) / elapsed, 1),
+                'queries_per_request': round(queries / requests, 2) if requests else None,
+                'errors': sum(status >= 400 for status in statuses),
+            }
+        return results
+
+    # Each prepare_* returns the requests of one iteration as
+    # (method, path, token, body) tuples.
+
+    def prepare_catalog_browse(self):
+        collection_id = self.rng.choice(sorted(self.collection_ids, key=str))
+        return [('GET', '/api/store/collections/', None, None),
+                ('GET', '/api/store/products/?page_size=20', None, None),
+                ('GET', f'/api/store/products/?collection={collection_id}&ordering=unit_price', None, None)]
+
+    def prepare_product_detail(self):
+        return [('GET', f'/api/store/products/{self.rng.choice(self.product_ids)}/', None, None)]
+
+    def prepare_add_to_cart(self):
+        cart = models.Cart.objects.create()
+        self.cart_ids.append(cart.pk)
+        return [('POST', f'/api/store/carts/{cart.pk}/items/', None,
+                 {'product_id': str(product_id), 'quantity': self.rng.randint(1, 3)})
+                for product_id in self.rng.sample(self.product_ids, 3)]
+
+    def prepare_checkout(self):
+        cart = models.Cart.objects.create()
+        self.cart_ids.append(cart.pk)
+        models.CartItem.objects.bulk_create([
+            models.CartItem(cart=cart, product_id=product_id, quantity=self.rng.randint(1, 3))
+            for product_id in self.rng.sample(self.product_ids, 3)])
+        return [('POST', '/api/store/orders/', self.rng.choice(self.tokens), {'cart_id': str(cart.pk)})]
+
+    def prepare_order_history(self):
+        return [('GET', '/api/store/orders/', self.rng.choice(self.tokens), None)]
@@ -0,0 +1,41 @@
+import json
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from store import cache
+from store.benchmarks import bench_client, create_catalog, rolled_back, summarize, timed
+
+
+class Command(BaseCommand):
+    help = 'Compare catalog read latency with and without the versioned cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            products = create_catalog(products=options['products'])
+            urls = ['/api/store/products/', '/api/store/collections/']
+            urls += [f'/api/store/products/{product.id}/' for product in products[:50]]
+
+            report = {}
+            for label, enabled in (('uncached', False), ('cached', True)):
+                cache.get_cache().clear()
+                before = cache.get_stats()
+                with override_settings(CATALOG_CACHE_ENABLED=enabled):
+                    report[label] = self.run(urls, options['requests'])
+                after = cache.get_stats()
+                report[label]['cache'] = {
+                    f'{scope}_{outcome}': count - before.get((scope, outcome), 0)
+                    for (scope, outcome), count in after.items()}
+
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, urls, requests):
+        client = bench_client()
+        samples = []
+        for i in range(requests):
+            duration, response = timed(client.get, urls[i % len(urls)])
+            assert response.status_code == 200, response.content
+            samples.append(duration)
+        return summarize(samples)
@@ -0,0 +1,39 @@
+import json
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from store import models
+from store.benchmarks import bench_client, create_catalog, rolled_back, summarize, timed
+
+
+class Command(BaseCommand):
+    help = 'Measure checkout latency against cart size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 50, 100, 200])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        report = {}
+        with rolled_back():
+            products = create_catalog(products=max(options['sizes']), images=1, reviews=0)
+            models.Product.objects.update(quantity=10 ** 6)
+            user = get_user_model().objects.create_user(username='bench-checkout', email='bench-checkout@example.com')
+            client = bench_client()
+            client.force_authenticate(user)
+
+            for size in options['sizes']:
+                samples, queries = [], 0
+                for i in range(options['repeat']):
+                    cart = models.Cart.objects.create()
+                    models.CartItem.objects.bulk_create([
+                        models.CartItem(cart=cart, product=product, quantity=1) for product in products[:size]])
+                    with CaptureQueriesContext(connection) as captured:
+                        duration, response = timed(client.post, '/api/store/orders/', {'cart_id': cart.id})
+                    assert response.status_code == 200, response.content
+                    samples.append(duration)
+                    queries = len(captured)
+                report[size] = {**summarize(samples), 'queries': queries}
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,84 @@
+import io
+import json
+import tempfile
+import time
+from urllib.parse import urlparse
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from PIL import Image, ImageDraw
+from store import models
+from store.benchmarks import bench_client, create_catalog, summarize, timed
+
+
+def photo(width, height, seed):
+    """A smooth synthetic photo that stays under the upload size limit as JPEG."""
+    image = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    red, green, blue = image.split()
+    image = Image.merge('RGB', (red, green.transpose(Image.FLIP_LEFT_RIGHT), blue.rotate(90, expand=False)))
+    draw = ImageDraw.Draw(image)
+    for x in range(0, width, width // 8):
+        draw.ellipse((x, height // 4, x + width // 9, height // 2), fill=((x + seed * 37) % 255, 80, 160))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=70)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = 'Measure image upload latency with inline and pooled rendering, and bytes served per catalog page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uploads', type=int, default=40)
+        parser.add_argument('--width', type=int, default=1200)
+        parser.add_argument('--height', type=int, default=900)
+
+    def handle(self, *args, **options):
+        # Renditions are rendered after commit, so this benchmark commits its
+        # rows and deletes them afterwards instead of rolling back.
+        with tempfile.TemporaryDirectory() as media, \
+                override_settings(MEDIA_ROOT=media, ALLOWED_HOSTS=['localhost'], CATALOG_CACHE_ENABLED=False):
+            products = create_catalog(collections=1, products=options['uploads'], images=0, reviews=0)
+            try:
+                report = self.run(products, options)
+            finally:
+                collection_id = products[0].collection_id
+                models.Product.objects.filter(collection_id=collection_id).delete()
+                models.Collection.objects.filter(pk=collection_id).delete()
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, products, options):
+        client = bench_client()
+        uploads = [photo(options['width'], options['height'], i) for i in range(len(products))]
+        report = {'original_bytes': sum(map(len, uploads)) // len(uploads)}
+        half = len(products) // 2
+        for mode, batch in (('inline', products[:half]), ('pooled', products[half:])):
+            with override_settings(IMAGE_RENDITIONS_ASYNC=mode == 'pooled'):
+                start = time.perf_counter()
+                samples = []
+                for product, data in zip(batch, uploads):
+                    upload = io.BytesIO(data)
+                    upload.name = 'photo.jpg'
+                    duration, response = timed(client.post, f'/api/store/products/{product.id}/images/',
+                                               {'image': upload}, format='multipart')
+                    assert response.status_code == 201, response.content
+                    samples.append(duration)
+                pending = models.ProductImage.objects.filter(product__in=batch, renditions__isnull=True)
+                while pending.exists():
+                    time.sleep(0.05)
+                report[f'upload_{mode}'] = {**summarize(samples),
+                                            'all_renditions_ready_s': round(time.perf_counter() - start, 2)}
+
+        for size in (None, 'large', 'medium', 'thumb'):
+            params = {'page_size': 20, 'collection': products[0].collection_id}
+            if size:
+                params['size'] = size
+            response = client.get('/api/store/products/', params)
+            assert response.status_code == 200, response.content
+            image_bytes = sum(self.file_size(image['image'])
+                              for product in response.data['results'] for image in product['images'])
+            report[f'page_bytes_{size or "original"}'] = {'json': len(response.content), 'images': image_bytes}
+        return report
+
+    def file_size(self, url):
+        return default_storage.size(urlparse(url).path.removeprefix(settings.MEDIA_URL))
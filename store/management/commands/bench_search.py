@@ -0,0 +1,69 @@
+import json
+import random
+from django.core.management.base import BaseCommand
+from store import models, search
+from store.benchmarks import summarize, timed
+
+
+class Command(BaseCommand):
+    help = 'Measure product search latency over a synthetic catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=500)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--database', action='store_true',
+                            help='Query the configured database (seed it first) instead of an in-memory index')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        nouns = [self.word(rng) for _ in range(2000)]
+        words = [self.word(rng) for _ in range(20000)]
+        queries = [rng.choice(nouns) for _ in range(options['queries'] // 4)]
+        queries += [rng.choice(nouns)[:3] for _ in range(options['queries'] // 4)]
+        queries += [f'{rng.choice(nouns)} {rng.choice(words)[:4]}' for _ in range(options['queries'] // 4)]
+        queries += [f'{rng.choice(words)} {rng.choice(words)}' for _ in range(options['queries'] // 4)]
+
+        if options['database']:
+            report = self.bench_database(queries)
+        else:
+            report = self.bench_index(rng, nouns, words, options['products'], queries)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    @staticmethod
+    def word(rng):
+        return ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9)))
+
+    def bench_index(self, rng, nouns, words, products, queries):
+        index = search.InvertedIndex()
+        collections = [f'{rng.choice(words)} {rng.choice(words)}' for _ in range(200)]
+        build, _ = timed(lambda: [
+            index.add(i, ' '.join(rng.choices(nouns, k=3)), ' '.join(rng.choices(words, k=8)),
+                      collections[i % len(collections)])
+            for i in range(products)])
+        return {
+            'backend': 'inverted_index',
+            'products': products,
+            'vocabulary': len(index.vocabulary),
+            'build_s': round(build, 1),
+            **self.run(lambda query: index.search(search.tokenize(query), 20), queries),
+        }
+
+    def bench_database(self, queries):
+        products = models.Product.objects.count()
+        if not search.use_database_search():
+            search.get_index()
+        return {
+            'backend': 'postgres' if search.use_database_search() else 'inverted_index',
+            'products': products,
+            **self.run(lambda query: list(search.search(models.Product.objects.all(), query)
+                                          .order_by('-rank', '-id').values_list('id', flat=True)[:20]), queries),
+        }
+
+    def run(self, execute, queries):
+        samples, hits = [], 0
+        for query in queries:
+            duration, results = timed(execute, query)
+            samples.append(duration)
+            hits += bool(results)
+        return {'queries_with_hits': hits, 'latency': summarize(samples)}
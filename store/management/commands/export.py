@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from store import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream orders (with items) or products (with collection and stock) as CSV or NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(exports.EXPORTS))
+        parser.add_argument('--file-format', choices=list(exports.CONTENT_TYPES), default='csv')
+        parser.add_argument('--created-after', help='ISO 8601 date or datetime, inclusive')
+        parser.add_argument('--created-before', help='ISO 8601 date or datetime, exclusive')
+        parser.add_argument('--output', help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        params = exports.ExportParamsSerializer(data={
+            name: options[name] for name in ('file_format', 'created_after', 'created_before')
+            if options[name] is not None})
+        if not params.is_valid():
+            raise CommandError(params.errors)
+        lines = exports.blocks(exports.EXPORTS[options['kind']](params.validated_data))
+        if options['output']:
+            with open(options['output'], 'w', newline='') as file:
+                file.writelines(lines)
+        else:
+            for block in lines:
+                self.stdout.write(block, ending='')
@@ -0,0 +1,23 @@
+import json
+from django.core.management.base import BaseCommand
+from store import imports
+
+
+class Command(BaseCommand):
+    help = ('Create or update products from a CSV or NDJSON file, keyed by id or by title and collection; '
+            'columns are id, title, collection, description, unit_price and quantity')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--file-format', choices=imports.FORMATS,
+                            help='Defaults to ndjson for .ndjson/.jsonl files and csv otherwise')
+        parser.add_argument('--batch-size', type=int, default=imports.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options['file_format'] or imports.guess_format(options['path'])
+        with open(options['path'], encoding='utf-8-sig', newline='') as file:
+            result = imports.import_products(file, file_format, options['batch_size'])
+        for error in result.errors:
+            self.stderr.write(f'Row {error["row"]}: {json.dumps(error["errors"])}')
+        self.stdout.write(f'Created {result.created}, updated {result.updated} and left {result.unchanged} '
+                          f'unchanged; {result.error_count} rows had errors.')
@@ -0,0 +1,26 @@
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from store import rollups
+
+
+class Command(BaseCommand):
+    help = ('Recompute the daily product and collection sales rollups, a few days at a time. '
+            'Without --start/--end, from the first to the last completed order')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat, help='First day (YYYY-MM-DD)')
+        parser.add_argument('--end', type=date.fromisoformat, help='Last day, inclusive (YYYY-MM-DD)')
+        parser.add_argument('--chunk-days', type=int, default=rollups.CHUNK_DAYS,
+                            help='Days recomputed per transaction')
+
+    def handle(self, *args, **options):
+        if options['chunk_days'] < 1:
+            raise CommandError('--chunk-days must be at least 1.')
+        start = time.perf_counter()
+        total = 0
+        for first_day, last_day, rows in rollups.rebuild(options['start'], options['end'], options['chunk_days']):
+            total += rows
+            self.stdout.write(f'{first_day}..{last_day}: {rows} rows')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'Wrote {total} rollup rows in {elapsed:.1f}s ({total / (elapsed or 1e-9):.0f} rows/s).')
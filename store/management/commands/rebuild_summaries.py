@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from store import summaries
+
+
+class Command(BaseCommand):
+    help = 'Recompute every customer order summary (order count, spend, last order, most-bought products)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rebuilt = summaries.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f'Rebuilt summaries for {rebuilt} customers with orders.')
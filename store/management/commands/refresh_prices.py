@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from store import models, pricing
+
+
+class Command(BaseCommand):
+    help = ('Refresh materialized product prices whose promotions started or ended. '
+            'Run it every minute from cron so promotions take effect on time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Recompute every product')
+
+    def handle(self, *args, **options):
+        if options['all']:
+            changed = pricing.refresh(models.Product.objects.all())
+        else:
+            changed = pricing.refresh_due()
+        self.stdout.write(f'Updated {changed} prices.')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from store import images, models
+
+
+class Command(BaseCommand):
+    help = 'Generate product image renditions for images that have none (or for every image with --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true')
+
+    def handle(self, *args, **options):
+        queryset = models.ProductImage.objects.all()
+        if not options['all']:
+            queryset = queryset.filter(renditions__isnull = True)
+        image_ids = list(queryset.values_list('pk', flat=True).distinct())
+        rendered = images.generate_many(image_ids)
+        self.stdout.write(f'Rendered {rendered} of {len(image_ids)} images; failures are logged.')
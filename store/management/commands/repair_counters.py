@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from store import cache, counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute Collection.product_count and Product.review_count and fix rows that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        collections = counters.repair_product_counts(batch_size=batch_size)
+        products = counters.repair_review_counts(batch_size=batch_size)
+        if collections or products:
+            # The repairs bypass the signal handlers that bump cache versions.
+            cache.bump_all()
+        self.stdout.write(f'Repaired product_count on {collections} collections '
+                          f'and review_count on {products} products.')
@@ -0,0 +1,34 @@
+import signal
+import time
+from django.core.management.base import BaseCommand
+from store import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver outbox events (e.g. order_created) to their handlers; run as many workers as needed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when no event is due')
+        parser.add_argument('--once', action='store_true', help='Process the due events and exit')
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        processed = failed = 0
+        try:
+            while not self.stopping:
+                succeeded, errors = outbox.run_once(options['batch_size'])
+                processed, failed = processed + succeeded, failed + errors
+                if succeeded + errors == 0:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'Delivered {processed} events, {failed} failed attempts.')
+
+    def stop(self, signum, frame):
+        # Finish the current batch so no claimed event waits out its lease.
+        self.stopping = True
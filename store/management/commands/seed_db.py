@@ -1,17 +1,66 @@
 import os
+import time
 from pathlib import Path
-from django.core.management.base import BaseCommand
-from django.db import connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from store import cache, counters, models, rollups, search, summaries
+from store.seeding import Seeder, make_id
 
 class Command(BaseCommand):
-    help = 'Populate the database'  
-    
+    help = ('Populate the database. With --products/--customers/--orders, generate a deterministic '
+            'synthetic dataset of that size instead of loading seed.sql')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collections', type=int, default=50)
+        parser.add_argument('--products', type=int, default=0)
+        parser.add_argument('--customers', type=int, default=0)
+        parser.add_argument('--orders', type=int, default=0)
+        parser.add_argument('--items-per-order', type=int, default=5, help='At most')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Ids derive from the seed, so load a second dataset with a different one')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
     def handle(self, *args, **options):
-        print('populating the db..........')    
+        if not (options['products'] or options['customers'] or options['orders']):
+            return self.load_sql()
+        if options['orders'] and not (options['products'] and options['customers']):
+            raise CommandError('--orders needs --products and --customers.')
+        if options['products'] and options['collections'] < 1:
+            raise CommandError('--products needs at least one collection.')
+
+        seeder = Seeder(seed=options['seed'], batch_size=options['batch_size'], stdout=self.stdout)
+        collections = options['collections'] if options['products'] else 0
+        start = time.perf_counter()
+        with transaction.atomic():
+            rows, _ = seeder.run(collections=collections, products=options['products'],
+                                 customers=options['customers'], orders=options['orders'],
+                                 items_per_order=options['items_per_order'])
+        loaded = time.perf_counter() - start
+        self.finish(seeder, options)
+        total = sum(rows.values())
+        self.stdout.write(f'Loaded {total} rows in {loaded:.1f}s ({total / (loaded or 1e-9):.0f} rows/s), '
+                          f'{time.perf_counter() - start:.1f}s including counters, search, summaries and rollups')
+
+    def finish(self, seeder, options):
+        # bulk_create and COPY skip the signal handlers that normally keep
+        # these up to date.
+        collection_ids = [make_id(options['seed'], 'collection', number) for number in range(options['collections'])]
+        counters.repair_product_counts(models.Collection.objects.filter(pk__in=collection_ids))
+        search.reindex(models.Product.objects.filter(collection_id__in=collection_ids))
+        if options['customers']:
+            first_user_id = seeder.first_user_id
+            summaries.rebuild(models.Customer.objects.filter(
+                user_id__gte=first_user_id, user_id__lt=first_user_id + options['customers']))
+        if options['orders']:
+            list(rollups.rebuild())
+        for scope in ('collection', 'product'):
+            cache.bump(scope)
+
+    def load_sql(self):
+        print('populating the db..........')
         current_dir = os.path.dirname(__file__)
         file_path = os.path.join(current_dir, 'seed.sql')
         sql = Path(file_path).read_text()
 
         with connection.cursor() as cursor:
             cursor.execute(sql)
-
@@ -0,0 +1,43 @@
+import re
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from store import carts
+
+UNITS = {'d': 'days', 'h': 'hours', 'm': 'minutes'}
+
+
+def parse_age(value):
+    match = re.fullmatch(r'(\d+)([dhm]?)', value.strip())
+    if match is None:
+        raise ValueError(value)
+    return timedelta(**{UNITS[match[2] or 'd']: int(match[1])})
+
+
+class Command(BaseCommand):
+    help = ('Delete abandoned carts (and their items) whose contents have not changed for --older-than, '
+            'in small batches. Run it daily from cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', default='30d', help='Age such as 30d, 12h or 90m (default 30d)')
+        parser.add_argument('--batch-size', type=int, default=carts.SWEEP_BATCH_SIZE,
+                            help='Carts deleted per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            age = parse_age(options['older_than'])
+        except ValueError:
+            raise CommandError('--older-than must look like 30d, 12h or 90m.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1.')
+        cutoff = timezone.now() - age
+        start = time.perf_counter()
+        cart_count = item_count = 0
+        for deleted_carts, deleted_items in carts.sweep(cutoff, options['batch_size']):
+            cart_count += deleted_carts
+            item_count += deleted_items
+        elapsed = time.perf_counter() - start
+        rows = cart_count + item_count
+        self.stdout.write(f'Deleted {cart_count} carts and {item_count} items not touched since '
+                          f'{cutoff:%Y-%m-%d %H:%M} in {elapsed:.1f}s ({rows / (elapsed or 1e-9):.0f} rows/s).')
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_prices(apps, schema_editor):
+    # No promotion is linked yet, so every product sells at its unit price.
+    Product = apps.get_model('store', 'Product')
+    ProductPrice = apps.get_model('store', 'ProductPrice')
+    rows = (ProductPrice(product_id=product_id, effective_price=unit_price)
+            for product_id, unit_price in Product.objects.values_list('id', 'unit_price').iterator())
+    ProductPrice.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_product_count_review_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='promotions',
+            field=models.ManyToManyField(blank=True, related_name='collections', to='store.promotion'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='promotions',
+            field=models.ManyToManyField(blank=True, related_name='products', to='store.promotion'),
+        ),
+        migrations.CreateModel(
+            name='ProductPrice',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='price', serialize=False, to='store.product')),
+                ('effective_price', models.DecimalField(decimal_places=2, max_digits=6)),
+                ('valid_until', models.DateTimeField(db_index=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('promotion', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.promotion')),
+            ],
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
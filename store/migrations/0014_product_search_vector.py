@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:15
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    # tsvector and GIN only exist on Postgres; other databases use the
+    # in-process index in store.search.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('''
+        UPDATE store_product p SET search_vector =
+            setweight(to_tsvector('english', coalesce(p.title, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(p.description, '')), 'B')
+            || setweight(to_tsvector('english', coalesce(c.title, '')), 'C')
+        FROM store_collection c WHERE c.id = p.collection_id
+    ''')
+    schema_editor.execute('CREATE INDEX product_search_idx ON store_product USING gin (search_vector)')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS product_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_promotions_and_product_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_outbox_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productimage',
+            name='height',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='width',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ProductImageRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('size', models.CharField(choices=[('large', 'large'), ('medium', 'medium'), ('thumb', 'thumb')], max_length=10)),
+                ('format', models.CharField(choices=[('webp', 'webp'), ('jpeg', 'jpeg')], max_length=10)),
+                ('file', models.ImageField(upload_to='store/renditions')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('bytes', models.PositiveIntegerField()),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='store.productimage')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('image', 'size', 'format'), name='unique_rendition')],
+            },
+        ),
+    ]
@@ -1,10 +1,13 @@
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.utils import timezone as django_timezone
 from uuid import uuid4
 import datetime
 from datetime import timezone
 from django.conf import settings
 from django.contrib import admin
 
+from store import imaging
 from store.validators import validate_file_size
 
 
@@ -12,6 +15,8 @@ class Collection(models.Model):
     id = models.UUIDField(default=uuid4, editable=False,
                           unique=True, primary_key=True)
     title = models.CharField(max_length = 255)
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    promotions = models.ManyToManyField('Promotion', blank=True, related_name='collections')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at =models.DateTimeField(auto_now=True)
 
@@ -24,13 +29,15 @@ class Promotion(models.Model):
     id = models.UUIDField(default=uuid4, editable=False,
                           unique=True, primary_key=True)
     description = models.TextField()
+    # Percentage off the unit price.
     discount = models.FloatField()
     start_date = models.DateTimeField(default = datetime.datetime.now)
     end_date = models.DateTimeField(null = True)
     paused = models.BooleanField(default=False)
-    def status(self):
-        expired = self.end_date and self.end_date < datetime.datetime.now(timezone.utc)
-        pending = self.start_date > datetime.datetime.now(timezone.utc)
+    def status(self, now=None):
+        now = now or datetime.datetime.now(timezone.utc)
+        expired = self.end_date and self.end_date < now
+        pending = self.start_date > now
 
         if expired:
             return self.ENDED
@@ -51,18 +58,90 @@ class Product(models.Model):
     title = models.CharField(max_length = 255)
     unit_price = models.DecimalField(max_digits= 6, decimal_places = 2)
     description = models.TextField()
-    collection = models.ForeignKey(Collection, on_delete = models.PROTECT, related_name='products')
+    # Indexed by the composite product_collection_* indexes instead.
+    collection = models.ForeignKey(Collection, on_delete = models.PROTECT, related_name='products', db_index=False)
     quantity = models.FloatField()
-    # promotions = models.ManyToManyField(Promotion)
+    promotions = models.ManyToManyField(Promotion, blank=True, related_name='products')
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    # Maintained by store.search on Postgres; GIN indexed as product_search_idx.
+    search_vector = SearchVectorField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            # The product list filters (store.filters.ProductFilter).
+            models.Index(fields=['unit_price', 'id'], name='product_price_idx'),
+            models.Index(fields=['collection', 'created_at', 'id'], name='product_collection_created_idx'),
+            models.Index(fields=['collection', 'unit_price', 'id'], name='product_collection_price_idx'),
+            models.Index(fields=['created_at', 'id'], condition=models.Q(quantity__gt=0),
+                         name='product_instock_created_idx'),
+            models.Index(fields=['unit_price', 'id'], condition=models.Q(quantity__gt=0),
+                         name='product_instock_price_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Collection.product_count is maintained by signal handlers that
+        # must commit or roll back together with this row.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @property
+    def effective_price(self):
+        try:
+            return self.price.effective_price
+        except ProductPrice.DoesNotExist:
+            return self.unit_price
+
+
+class ProductPrice(models.Model):
+    """
+    The price a product currently sells for, with the best live promotion
+    applied. Maintained by store.pricing; valid_until is when the next
+    promotion starts or ends and the row must be refreshed.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='price')
+    effective_price = models.DecimalField(max_digits= 6, decimal_places = 2)
+    promotion = models.ForeignKey(Promotion, on_delete=models.SET_NULL, null=True, related_name='+')
+    valid_until = models.DateTimeField(null=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
 
 class ProductImage(models.Model):
     id = models.UUIDField(default=uuid4, editable=False,
                           unique=True, primary_key=True)
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to ='store/images', validators=[validate_file_size])
+    # Set from the original when the renditions are generated.
+    width = models.PositiveIntegerField(null=True, editable=False)
+    height = models.PositiveIntegerField(null=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'id'], name='productimage_created_idx'),
+        ]
+
+
+class ProductImageRendition(models.Model):
+    """A resized, re-encoded copy of a ProductImage, generated by store.images."""
+    SIZE_CHOICES = {size: size for size in imaging.SIZES}
+    FORMAT_CHOICES = {name: name for name in imaging.FORMATS}
+
+    image = models.ForeignKey(ProductImage, on_delete=models.CASCADE, related_name='renditions')
+    size = models.CharField(max_length=10, choices=SIZE_CHOICES)
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    file = models.ImageField(upload_to='store/renditions')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    bytes = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['image', 'size', 'format'], name='unique_rendition'),
+        ]
 
 
 class Customer(models.Model):
@@ -132,6 +211,18 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at =models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='order_created_idx'),
+            models.Index(fields=['customer', 'created_at', 'id'], name='order_customer_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The customer's summary (store.summaries) follows payment_status
+        # changes in signal handlers that must commit with this row.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 class OrderItem(models.Model):
     id = models.UUIDField(default=uuid4, editable=False,
                           unique=True, primary_key=True)
@@ -142,13 +233,82 @@ class OrderItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at =models.DateTimeField(auto_now=True)
 
+class CustomerSummary(models.Model):
+    """
+    A customer's lifetime order totals, maintained incrementally by
+    store.summaries as orders are placed and paid.
+    """
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    order_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_order_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class CustomerProductSummary(models.Model):
+    """Units of a product across a customer's completed orders (store.summaries)."""
+    # Indexed by customer_product_summary_unique instead.
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='+', db_index=False)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['customer', 'product'], name='customer_product_summary_unique'),
+        ]
+        indexes = [
+            # A customer's most-bought products.
+            models.Index(fields=['customer', '-units', 'product'], name='customer_top_products_idx'),
+        ]
+
+
+class ProductDailySales(models.Model):
+    """A product's completed sales on one day (store.rollups)."""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='product_daily_sales_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'day'], name='product_daily_sales_idx'),
+        ]
+
+
+class CollectionDailySales(models.Model):
+    """A collection's completed sales on one day (store.rollups)."""
+    day = models.DateField()
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'collection'], name='collection_daily_sales_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['collection', 'day'], name='collection_daily_sales_idx'),
+        ]
+
+
 class Cart(models.Model):
     id = models.UUIDField(default=uuid4, editable=False,
                           unique=True, primary_key=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
+    # Touched whenever the cart's items change (store.carts.touch).
     updated_at =models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Abandoned carts for store.carts.sweep.
+            models.Index(fields=['updated_at'], name='cart_updated_idx'),
+        ]
 
 
 class CartItem(models.Model):
@@ -162,6 +322,9 @@ class CartItem(models.Model):
 
     class Meta:
         unique_together = [['cart', 'product']]
+        indexes = [
+            models.Index(fields=['cart', 'created_at', 'id'], name='cartitem_created_idx'),
+        ]
 
 class Review(models.Model):
     id = models.UUIDField(default=uuid4, editable=False,
@@ -172,10 +335,45 @@ class Review(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
- 
-
-
-
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'id'], name='review_created_idx'),
+        ]
 
+    def save(self, *args, **kwargs):
+        # Product.review_count is maintained by signal handlers that must
+        # commit or roll back together with this row.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class OutboxEvent(models.Model):
+    """
+    An event written in the same transaction as the change it describes and
+    delivered afterwards by the run_outbox_worker command (store.outbox).
+    """
+    PENDING = 'pending'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = {
+        PENDING: 'pending',
+        DONE: 'done',
+        FAILED: 'failed',
+    }
+    topic = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # When the event may next be claimed: now for new events, the end of the
+    # lease while a worker holds it, the backoff after a failure.
+    available_at = models.DateTimeField(default=django_timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True)
 
-    
\ No newline at end of file
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id'], condition=models.Q(status='pending'),
+                         name='outbox_pending_idx'),
+        ]
@@ -0,0 +1,83 @@
+import logging
+import traceback
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from . import models
+from .signals import order_created
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+# A claimed event becomes claimable again if its worker dies before
+# recording the outcome, so delivery is at least once.
+LEASE = timedelta(minutes=5)
+
+
+def publish(topic, **payload):
+    """Record an event; it is delivered only if the surrounding transaction commits."""
+    return models.OutboxEvent.objects.create(topic = topic, payload = payload)
+
+
+def deliver_order_created(payload):
+    order = models.Order.objects.prefetch_related('items__product').get(pk = payload['order_id'])
+    return order_created.send_robust(sender = models.OutboxEvent, order = order)
+
+
+HANDLERS = {
+    'order_created': deliver_order_created,
+}
+
+
+def claim(batch_size=100, now=None):
+    """
+    Lease up to batch_size due events to this worker. SKIP LOCKED lets
+    concurrent workers claim disjoint batches without waiting on each other.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        events = list(models.OutboxEvent.objects.select_for_update(skip_locked = True)
+                      .filter(status = models.OutboxEvent.PENDING, available_at__lte = now)
+                      .order_by('available_at', 'id')[:batch_size])
+        if events:
+            models.OutboxEvent.objects.filter(pk__in = [event.pk for event in events]).update(
+                available_at = now + LEASE, attempts = F('attempts') + 1)
+    for event in events:
+        event.attempts += 1
+    return events
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(2 ** attempts, 3600))
+
+
+def process(event):
+    """Run the event's handler and record the outcome. Returns True on success."""
+    handler = HANDLERS.get(event.topic)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler for topic {event.topic!r}')
+        # send_robust reports receiver failures instead of raising them.
+        errors = [error for _, error in handler(event.payload) or () if isinstance(error, Exception)]
+        if errors:
+            raise errors[0]
+    except Exception as error:
+        failed = event.attempts >= MAX_ATTEMPTS
+        logger.warning('Outbox event %s (%s) failed on attempt %s', event.pk, event.topic, event.attempts,
+                       exc_info = error)
+        models.OutboxEvent.objects.filter(pk = event.pk).update(
+            status = models.OutboxEvent.FAILED if failed else models.OutboxEvent.PENDING,
+            available_at = timezone.now() + backoff(event.attempts),
+            last_error = ''.join(traceback.format_exception(error)))
+        return False
+    models.OutboxEvent.objects.filter(pk = event.pk).update(
+        status = models.OutboxEvent.DONE, processed_at = timezone.now(), last_error = '')
+    return True
+
+
+def run_once(batch_size=100):
+    """Claim and process one batch. Returns (processed, failed)."""
+    events = claim(batch_size)
+    succeeded = sum(process(event) for event in events)
+    return succeeded, len(events) - succeeded
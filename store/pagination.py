@@ -0,0 +1,150 @@
+import base64
+import binascii
+import json
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(pagination.BasePagination):
+    """
+    Cursor pagination keyed on the full ordering tuple (by default
+    created_at, id) instead of an OFFSET, so every page costs the same.
+    The last ordering field must be unique, and none of them may be null.
+    A queryset that is already explicitly ordered (e.g. by a search rank
+    annotation) keeps its ordering, with the primary key as tie-breaker.
+    """
+    page_size = api_settings.PAGE_SIZE or 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = tuple(name for name in queryset.query.order_by if isinstance(name, str))
+        if not ordering:
+            return tuple(getattr(view, 'pagination_ordering', self.ordering))
+        pk_name = queryset.model._meta.pk.name
+        ordering = tuple(name.replace('pk', pk_name) if name.lstrip('-') == 'pk' else name for name in ordering)
+        if ordering[-1].lstrip('-') != pk_name:
+            ordering += ('-' + pk_name if ordering[-1].startswith('-') else pk_name,)
+        return ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+        model = queryset.model
+        self.model_fields = [self.get_field(model, name) for name, _ in self.fields]
+
+        position, reverse = self.decode_cursor(request, model)
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position, reverse))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = rows
+        return rows
+
+    def after(self, position, reverse):
+        """Rows strictly after position in the (possibly reversed) ordering."""
+        condition = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != reverse else 'gt'
+            term = Q(**{f'{name}__{lookup}': position[index]})
+            for previous, (previous_name, _) in enumerate(self.fields[:index]):
+                term &= Q(**{previous_name: position[previous]})
+            condition |= term
+        # Bound the leading column too so the composite index drives the scan.
+        name, descending = self.fields[0]
+        return Q(**{f'{name}__{"lte" if descending != reverse else "gte"}': position[0]}) & condition
+
+    @staticmethod
+    def get_field(model, name):
+        # None for annotations such as a search rank, whose values are JSON-native.
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    def get_position(self, row):
+        return [field.value_to_string(row) if field else getattr(row, name)
+                for (name, _), field in zip(self.fields, self.model_fields)]
+
+    def encode_cursor(self, row, reverse):
+        token = json.dumps({'p': self.get_position(row), 'r': int(reverse)}, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(token.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            token = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            values = token['p']
+            if len(values) != len(self.fields):
+                raise ValueError
+            if any(field is None and not isinstance(value, (int, float))
+                   for field, value in zip(self.model_fields, values)):
+                raise ValueError
+            position = [field.to_python(value) if field else value
+                        for field, value in zip(self.model_fields, values)]
+            return position, bool(token.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -1,4 +1,5 @@
 from rest_framework import  permissions
+from .authentication import has_token_permission
 
 
 class IsAdminOrReadOnly(permissions.BasePermission):
@@ -10,4 +11,4 @@ class IsAdminOrReadOnly(permissions.BasePermission):
 
 class ViewCustomerHistoryPermission(permissions.BasePermission):
     def has_permission(self, request, view):
-        return request.user.has_perm('store.view_history')
\ No newline at end of file
+        return has_token_permission(request, 'store.view_history')
\ No newline at end of file
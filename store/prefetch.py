@@ -0,0 +1,77 @@
+from functools import lru_cache
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+
+# Serializers declare the relations they read in their Meta:
+#
+#   class Meta:
+#       select_related = ['product']      # forward FK / one-to-one
+#       prefetch_related = ['images']     # reverse FK / many-to-many
+#
+# The plan for a serializer is built by following those declarations into the
+# nested serializers, so an endpoint always runs the same number of queries
+# no matter how many rows it returns.
+
+
+def _lookup(serializer, name):
+    field = serializer.fields.get(name)
+    if field is None:
+        return name, None
+    source = name if field.source in (None, '*') else field.source.replace('.', '__')
+    if isinstance(field, serializers.ListSerializer):
+        return source, field.child
+    if isinstance(field, serializers.BaseSerializer):
+        return source, field
+    return source, None
+
+
+def _prefixed(prefix, lookup):
+    if isinstance(lookup, Prefetch):
+        return Prefetch(f'{prefix}__{lookup.prefetch_through}', queryset=lookup.queryset, to_attr=lookup.to_attr)
+    return f'{prefix}__{lookup}'
+
+
+@lru_cache(maxsize=None)
+def get_prefetch_plan(serializer_class):
+    """Return the (select_related, prefetch_related) lookups serializer_class needs."""
+    meta = getattr(serializer_class, 'Meta', None)
+    select, prefetch = [], []
+    if meta is None:
+        return select, prefetch
+    serializer = serializer_class()
+
+    for name in getattr(meta, 'select_related', ()):
+        source, nested = _lookup(serializer, name)
+        select.append(source)
+        if nested is not None:
+            nested_select, nested_prefetch = get_prefetch_plan(type(nested))
+            select += [f'{source}__{lookup}' for lookup in nested_select]
+            prefetch += [_prefixed(source, lookup) for lookup in nested_prefetch]
+
+    for name in getattr(meta, 'prefetch_related', ()):
+        source, nested = _lookup(serializer, name)
+        nested_meta = getattr(nested, 'Meta', None)
+        if nested_meta is None or not hasattr(nested_meta, 'model'):
+            prefetch.append(source)
+            continue
+        queryset = apply_prefetch_plan(nested_meta.model.objects.all(), type(nested))
+        prefetch.append(Prefetch(source, queryset=queryset))
+
+    return select, prefetch
+
+
+def apply_prefetch_plan(queryset, serializer_class):
+    select, prefetch = get_prefetch_plan(serializer_class)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
+
+
+class PrefetchPlanMixin:
+    """Eager load whatever the view's serializer declares it reads."""
+
+    def filter_queryset(self, queryset):
+        return apply_prefetch_plan(super().filter_queryset(queryset), self.get_serializer_class())
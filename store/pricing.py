@@ -0,0 +1,88 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from . import cache, models
+
+CENT = Decimal('0.01')
+
+
+def best_promotion(promotions, now):
+    live = [promotion for promotion in promotions if promotion.status(now) == models.Promotion.LIVE]
+    return max(live, key=lambda promotion: promotion.discount, default=None)
+
+
+def next_change(promotions, now):
+    """When the set of live promotions next changes: a start or an end date."""
+    boundaries = []
+    for promotion in promotions:
+        if promotion.start_date > now:
+            boundaries.append(promotion.start_date)
+        elif promotion.end_date and promotion.end_date > now:
+            boundaries.append(promotion.end_date)
+    return min(boundaries, default=None)
+
+
+def compute_price(product, now):
+    promotions = list(product.promotions.all()) + list(product.collection.promotions.all())
+    promotion = best_promotion(promotions, now)
+    price = product.unit_price
+    if promotion is not None:
+        discount = Decimal(str(min(max(promotion.discount, 0), 100)))
+        price = (price * (100 - discount) / 100).quantize(CENT, ROUND_HALF_UP)
+    return models.ProductPrice(product = product, effective_price = price,
+                               promotion = promotion, valid_until = next_change(promotions, now))
+
+
+def refresh(products, batch_size=1000):
+    """
+    Recompute the materialized price of every product in the queryset.
+    Only rows whose price, promotion or validity changed are written.
+    Returns the number of products whose price row changed.
+    """
+    now = timezone.now()
+    queryset = (products.select_related('price', 'collection').order_by('pk')
+                .prefetch_related('promotions', 'collection__promotions'))
+    changed = 0
+    batch = []
+    for product in queryset.iterator(chunk_size = batch_size):
+        batch.append(product)
+        if len(batch) == batch_size:
+            changed += _refresh_batch(batch, now)
+            batch = []
+    if batch:
+        changed += _refresh_batch(batch, now)
+    return changed
+
+
+def _refresh_batch(products, now):
+    rows = []
+    for product in products:
+        # Read the current row first: building the new one replaces it on product.
+        current = getattr(product, 'price', None)
+        row = compute_price(product, now)
+        if current is None or (current.effective_price, current.promotion_id, current.valid_until) != \
+                (row.effective_price, row.promotion_id, row.valid_until):
+            rows.append(row)
+    if not rows:
+        return 0
+    with transaction.atomic():
+        models.ProductPrice.objects.bulk_create(
+            rows, update_conflicts = True, unique_fields = ['product'],
+            update_fields = ['effective_price', 'promotion', 'valid_until', 'updated_at'])
+        # The price is part of the product's representation.
+        product_ids = [row.product_id for row in rows]
+        models.Product.objects.filter(pk__in = product_ids).update(updated_at = now)
+        transaction.on_commit(lambda: [cache.bump('product', product_id) for product_id in product_ids])
+    return len(rows)
+
+
+def products_for_promotion(promotion):
+    return models.Product.objects.filter(
+        Q(promotions = promotion) | Q(collection__promotions = promotion)).distinct()
+
+
+def refresh_due():
+    """Refresh products with no price row yet or whose promotions started or ended."""
+    now = timezone.now()
+    return refresh(models.Product.objects.filter(Q(price__isnull = True) | Q(price__valid_until__lte = now)))
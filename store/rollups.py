@@ -0,0 +1,177 @@
+"""
+Daily sales rollups (ProductDailySales, CollectionDailySales): revenue,
+units and order count per product and per collection per day, counting
+completed orders only, so staff dashboards read a few rows per day
+instead of aggregating every OrderItem.
+
+An order counts on the day it was placed (in the current time zone) and
+its items are taken to be fixed by the time it completes. The rollups
+follow orders as they complete or stop being complete; deleting a
+completed order recomputes its day. rebuild() (manage.py rebuild_rollups)
+recomputes a date range a few days at a time, attributing sales to each
+product's current collection.
+"""
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Max, Min, PositiveIntegerField, Sum, Value, When
+from django.db.models.functions import Greatest, TruncDate
+from django.utils import timezone
+from rest_framework import serializers
+from . import models
+
+CHUNK_DAYS = 7
+MAX_LIMIT = 1000
+# Rollup model: name of its key field.
+ROLLUPS = {
+    models.ProductDailySales: 'product_id',
+    models.CollectionDailySales: 'collection_id',
+}
+
+
+class SalesParamsSerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField(help_text = 'Inclusive')
+    # total: one row per product or collection over the range; day: one per day as well.
+    interval = serializers.ChoiceField(choices = ['total', 'day'], default = 'total')
+    product = serializers.UUIDField(required = False)
+    collection = serializers.UUIDField(required = False)
+    limit = serializers.IntegerField(min_value = 1, max_value = MAX_LIMIT, default = 100)
+
+    def validate(self, attrs):
+        if attrs['end'] < attrs['start']:
+            raise serializers.ValidationError({'end': 'Must not be before start.'})
+        return attrs
+
+
+def _day_bounds(first_day, last_day):
+    """The aware datetimes [start of first_day, start of the day after last_day)."""
+    return (timezone.make_aware(datetime.combine(first_day, time.min)),
+            timezone.make_aware(datetime.combine(last_day + timedelta(days = 1), time.min)))
+
+
+def _item_totals(order_id):
+    """({product id: (revenue, units)}, {collection id: (revenue, units)}) for an order's items."""
+    rows = (models.OrderItem.objects.filter(order_id = order_id).order_by()
+            .values_list('product_id', 'product__collection_id')
+            .annotate(revenue = Sum(F('quantity') * F('unit_price'), output_field = DecimalField()),
+                      units = Sum('quantity')))
+    products, collections = {}, {}
+    for product_id, collection_id, revenue, units in rows:
+        products[product_id] = (revenue, units)
+        collection_revenue, collection_units = collections.get(collection_id, (0, 0))
+        collections[collection_id] = (collection_revenue + revenue, collection_units + units)
+    return products, collections
+
+
+def _apply(model, day, totals, sign):
+    key = ROLLUPS[model]
+    rows = model.objects.filter(day = day, **{f'{key}__in': totals})
+    if sign > 0:
+        model.objects.bulk_create([model(day = day, **{key: pk}) for pk in totals], ignore_conflicts = True)
+
+    def delta(index, output_field):
+        return Case(*[When(**{key: pk}, then = Value(sign * total[index])) for pk, total in totals.items()],
+                    output_field = output_field)
+
+    revenue = F('revenue') + delta(0, DecimalField())
+    units = F('units') + delta(1, PositiveIntegerField())
+    order_count = F('order_count') + sign
+    if sign < 0:
+        revenue, units, order_count = Greatest(revenue, Value(0)), Greatest(units, Value(0)), \
+            Greatest(order_count, Value(0))
+    rows.update(revenue = revenue, units = units, order_count = order_count)
+    if sign < 0:
+        rows.filter(order_count = 0).delete()
+
+
+def order_completed(order, sign=1):
+    """Add (sign=1) or take away (sign=-1) a completed order's sales."""
+    products, collections = _item_totals(order.pk)
+    if not products:
+        return
+    day = timezone.localdate(order.created_at)
+    _apply(models.ProductDailySales, day, products, sign)
+    _apply(models.CollectionDailySales, day, collections, sign)
+
+
+def order_saved(order, previous_status):
+    was_completed = previous_status == models.Order.COMPLETED
+    is_completed = order.payment_status == models.Order.COMPLETED
+    if is_completed and not was_completed:
+        order_completed(order)
+    elif was_completed and not is_completed:
+        order_completed(order, sign = -1)
+
+
+def order_deleted(order, previous_status):
+    # Its items (PROTECTed) are already gone, so there is nothing to subtract.
+    if previous_status == models.Order.COMPLETED:
+        day = timezone.localdate(order.created_at)
+        _rebuild_days(day, day)
+
+
+def rebuild(start=None, end=None, chunk_days=CHUNK_DAYS):
+    """
+    Recompute the rollups of the days from start to end (inclusive),
+    chunk_days at a time, each chunk in its own transaction. Without
+    start or end, from the first or to the last completed order. Yields
+    (first day, last day, rows written) per chunk.
+    """
+    if start is None or end is None:
+        bounds = models.Order.objects.filter(payment_status = models.Order.COMPLETED).aggregate(
+            first = Min('created_at'), last = Max('created_at'))
+        if bounds['first'] is None:
+            return
+        start = start or timezone.localdate(bounds['first'])
+        end = end or timezone.localdate(bounds['last'])
+    first_day = start
+    while first_day <= end:
+        last_day = min(first_day + timedelta(days = chunk_days - 1), end)
+        yield first_day, last_day, _rebuild_days(first_day, last_day)
+        first_day = last_day + timedelta(days = 1)
+
+
+def _rebuild_days(first_day, last_day):
+    since, until = _day_bounds(first_day, last_day)
+    items = (models.OrderItem.objects.order_by()
+             .filter(order__payment_status = models.Order.COMPLETED,
+                     order__created_at__gte = since, order__created_at__lt = until)
+             .annotate(day = TruncDate('order__created_at')))
+    written = 0
+    with transaction.atomic():
+        for model, key in ROLLUPS.items():
+            model.objects.filter(day__gte = first_day, day__lte = last_day).delete()
+            group = 'product_id' if model is models.ProductDailySales else 'product__collection_id'
+            rows = items.values_list('day', group).annotate(
+                revenue = Sum(F('quantity') * F('unit_price'), output_field = DecimalField()),
+                units = Sum('quantity'),
+                order_count = Count('order_id', distinct = True))
+            written += len(model.objects.bulk_create([
+                model(day = day, revenue = revenue, units = units, order_count = order_count, **{key: pk})
+                for day, pk, revenue, units, order_count in rows.iterator()], batch_size = 1000))
+    return written
+
+
+def sales(model, params):
+    """Rows of a date-range query over one of the rollups, as dicts."""
+    key = ROLLUPS[model]
+    rows = model.objects.filter(day__gte = params['start'], day__lte = params['end'])
+    if model is models.ProductDailySales:
+        if 'product' in params:
+            rows = rows.filter(product_id = params['product'])
+        if 'collection' in params:
+            rows = rows.filter(product__collection_id = params['collection'])
+    elif 'collection' in params:
+        rows = rows.filter(collection_id = params['collection'])
+    title = F(f'{key[:-3]}__title')
+    if params['interval'] == 'day':
+        columns = ['day', key, 'title', 'revenue', 'units', 'order_count']
+        rows = rows.order_by('day', key).values_list('day', key, title, 'revenue', 'units', 'order_count')
+    else:
+        columns = [key, 'title', 'revenue', 'units', 'order_count']
+        # An order falls on one day, so summing the days' order counts counts it once.
+        rows = (rows.values_list(key, title)
+                .annotate(total_revenue = Sum('revenue'), total_units = Sum('units'),
+                          total_orders = Sum('order_count'))
+                .order_by('-total_revenue', key))
+    return [dict(zip(columns, row)) for row in rows[:params['limit']]]
@@ -0,0 +1,201 @@
+import re
+import threading
+from array import array
+from bisect import bisect_left
+from heapq import nlargest
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import Case, FloatField, OuterRef, Subquery, Value, When
+from rest_framework.filters import BaseFilterBackend
+from . import models
+
+SEARCH_CONFIG = 'english'
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+# Title matches outrank description matches, which outrank collection matches,
+# mirroring the A/B/C weights of the Postgres vector.
+FIELD_WEIGHTS = {'title': 1.0, 'description': 0.4, 'collection': 0.2}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def use_database_search():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    collection_title = Subquery(models.Collection.objects.filter(pk = OuterRef('collection_id')).values('title')[:1])
+    return (SearchVector('title', weight = 'A', config = SEARCH_CONFIG)
+            + SearchVector('description', weight = 'B', config = SEARCH_CONFIG)
+            + SearchVector(collection_title, weight = 'C', config = SEARCH_CONFIG))
+
+
+def reindex(products):
+    """Bring the search index up to date for a product queryset."""
+    if use_database_search():
+        products.update(search_vector = search_vector())
+    elif _index is not None:
+        # The rows are read now, inside the writer's transaction, but only
+        # indexed once it commits: a rollback must not leave them behind.
+        rows = list(products.values_list('id', 'title', 'description', 'collection__title'))
+        transaction.on_commit(lambda: _add_rows(rows))
+
+
+def _add_rows(rows):
+    index = _index
+    if index is not None:
+        for row in rows:
+            index.add(*row)
+
+
+def search(queryset, query, limit=None):
+    """
+    Filter queryset to products matching every term of query (each term
+    also matches as a prefix, for autocomplete) and annotate a rank to
+    order by. limit keeps only the best hits of the in-process index, before
+    the queryset's own filters apply, so views leave it unset.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return queryset.none()
+    if use_database_search():
+        tsquery = SearchQuery(' & '.join(f'{term}:*' for term in terms),
+                              search_type = 'raw', config = SEARCH_CONFIG)
+        return (queryset.filter(search_vector = tsquery)
+                .annotate(rank = SearchRank('search_vector', tsquery)))
+    hits = get_index().search(terms, limit)
+    return queryset.filter(pk__in = [pk for pk, _ in hits]).annotate(rank = Case(
+        *[When(pk = pk, then = Value(score)) for pk, score in hits],
+        default = Value(0.0), output_field = FloatField()))
+
+
+class ProductSearchFilter(BaseFilterBackend):
+    search_param = 'q'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search(queryset, query).order_by('-rank', '-id')
+
+
+class InvertedIndex:
+    """
+    In-process full-text index used when the database has no tsvector
+    support (SQLite test and development runs). It is kept current by the
+    product and collection signal handlers, so rows written with
+    bulk_create or update() need a reset_index(). Postings are append-only arrays of document
+    numbers with a parallel array of weights; replaced or deleted documents
+    are tombstoned rather than removed from the postings.
+    """
+    max_expansions = 64
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.postings = {}
+        self.vocabulary = []
+        self.doc_ids = []
+        self.doc_numbers = {}
+        self.deleted = set()
+
+    def __len__(self):
+        return len(self.doc_numbers)
+
+    def add(self, doc_id, title, description, collection):
+        weights = {}
+        for field, text in (('title', title), ('description', description), ('collection', collection)):
+            for token in tokenize(text):
+                weights[token] = max(weights.get(token, 0.0), FIELD_WEIGHTS[field])
+        with self.lock:
+            self.remove(doc_id)
+            number = len(self.doc_ids)
+            self.doc_ids.append(doc_id)
+            self.doc_numbers[doc_id] = number
+            for token, weight in weights.items():
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = (array('L'), array('f'))
+                    self.vocabulary.insert(bisect_left(self.vocabulary, token), token)
+                posting[0].append(number)
+                posting[1].append(weight)
+
+    def remove(self, doc_id):
+        with self.lock:
+            number = self.doc_numbers.pop(doc_id, None)
+            if number is not None:
+                self.deleted.add(number)
+
+    def expand(self, term):
+        """Vocabulary tokens that start with term."""
+        start = bisect_left(self.vocabulary, term)
+        tokens = []
+        for token in self.vocabulary[start:start + self.max_expansions]:
+            if not token.startswith(term):
+                break
+            tokens.append(token)
+        return tokens
+
+    def search(self, terms, limit=None):
+        """Return [(doc_id, score)] for documents matching every term, best first (all of them without limit)."""
+        with self.lock:
+            expanded = []
+            for term in terms:
+                postings = [self.postings[token] for token in self.expand(term)]
+                if not postings:
+                    return []
+                expanded.append(postings)
+            # Score the rarest term's documents, then probe the other terms'
+            # sorted postings for each candidate.
+            expanded.sort(key=lambda postings: sum(len(numbers) for numbers, _ in postings))
+            scores = {}
+            for numbers, weights in expanded[0]:
+                for number, weight in zip(numbers, weights):
+                    if scores.get(number, 0.0) < weight:
+                        scores[number] = weight
+            for postings in expanded[1:]:
+                matched = {}
+                for number, score in scores.items():
+                    best = 0.0
+                    for numbers, weights in postings:
+                        index = bisect_left(numbers, number)
+                        if index < len(numbers) and numbers[index] == number and weights[index] > best:
+                            best = weights[index]
+                    if best:
+                        matched[number] = score + best
+                scores = matched
+                if not scores:
+                    return []
+            ranked = ((score, number) for number, score in scores.items() if number not in self.deleted)
+            top = nlargest(limit, ranked) if limit is not None else sorted(ranked, reverse=True)
+            return [(self.doc_ids[number], score) for score, number in top]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The process-wide fallback index, built from the database on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = InvertedIndex()
+            rows = models.Product.objects.values_list('id', 'title', 'description', 'collection__title')
+            for row in rows.iterator(chunk_size = 2000):
+                index.add(*row)
+            _index = index
+        return _index
+
+
+def unindex_product(product_id):
+    def remove():
+        if _index is not None:
+            _index.remove(product_id)
+    transaction.on_commit(remove)
+
+
+def reset_index():
+    global _index
+    with _index_lock:
+        _index = None
@@ -0,0 +1,211 @@
+"""
+Deterministic synthetic data for capacity testing (manage.py seed_db).
+
+Rows are generated and loaded in batches, in dependency order, so memory
+stays flat however many are requested. Ids are derived from the seed and
+the row number instead of being kept in memory: an order item can name
+product 123456 without the products having been held on to.
+"""
+import hashlib
+import io
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from uuid import UUID
+from django.contrib.auth import get_user_model
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from . import models
+
+ADJECTIVES = ['Fresh', 'Organic', 'Ripe', 'Sweet', 'Smoked', 'Dried', 'Golden', 'Wild', 'Spicy', 'Roasted',
+              'Crunchy', 'Local', 'Premium', 'Green', 'Red', 'Creamy', 'Whole', 'Salted', 'Aged', 'Young']
+NOUNS = ['Mango', 'Yam', 'Plantain', 'Cassava', 'Rice', 'Beans', 'Maize', 'Millet', 'Goat', 'Chicken',
+         'Tomato', 'Pepper', 'Okra', 'Egusi', 'Garri', 'Honey', 'Palm Oil', 'Groundnut', 'Cocoa', 'Ginger',
+         'Pineapple', 'Orange', 'Banana', 'Cowpea', 'Sorghum', 'Catfish', 'Crayfish', 'Ugu', 'Onion', 'Garlic']
+HISTORY = timedelta(days=365)
+
+
+def make_id(seed, kind, number):
+    """The UUID of row number of kind, the same on every run with this seed."""
+    return UUID(bytes=hashlib.md5(f'{seed}:{kind}:{number}'.encode()).digest(), version=4)
+
+
+def unit_price(number):
+    return Decimal(100 + number * 7919 % 9900) / 100
+
+
+@contextmanager
+def historical_timestamps(*model_classes):
+    # auto_now/auto_now_add would stamp every row with the load time;
+    # seeded rows carry spread-out creation times instead.
+    fields = [field for model in model_classes for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    flags = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Loader:
+    """Writes batches of unsaved instances with COPY on Postgres, bulk_create elsewhere."""
+
+    def __init__(self, batch_size=5000):
+        self.batch_size = batch_size
+        self.use_copy = connection.vendor == 'postgresql'
+        self.rows = {}
+        self.seconds = {}
+
+    def load(self, model, objects):
+        start = time.perf_counter()
+        if self.use_copy:
+            self.copy(model, objects)
+        else:
+            model.objects.bulk_create(objects, batch_size=self.batch_size)
+        label = model._meta.label
+        self.rows[label] = self.rows.get(label, 0) + len(objects)
+        self.seconds[label] = self.seconds.get(label, 0.0) + time.perf_counter() - start
+
+    def copy(self, model, objects):
+        fields = model._meta.concrete_fields
+        buffer = io.StringIO()
+        for obj in objects:
+            buffer.write('\t'.join(self.encode(field.get_db_prep_save(field.pre_save(obj, True), connection))
+                                   for field in fields))
+            buffer.write('\n')
+        buffer.seek(0)
+        quote = connection.ops.quote_name
+        sql = (f'COPY {quote(model._meta.db_table)} ({", ".join(quote(field.column) for field in fields)}) '
+               f'FROM STDIN')
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):
+                raw.copy_expert(sql, buffer)
+            else:
+                with raw.copy(sql) as copy:
+                    copy.write(buffer.getvalue())
+
+    @staticmethod
+    def encode(value):
+        # COPY's text format: \N is NULL; backslash, tab and newlines are escaped.
+        if value is None:
+            return '\\N'
+        return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+class Seeder:
+    def __init__(self, seed=0, batch_size=5000, stdout=None):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.loader = Loader(batch_size)
+        self.stdout = stdout
+        self.now = timezone.now()
+
+    def rng(self, kind, batch):
+        # One generator per batch keeps each batch reproducible on its own.
+        return random.Random(f'{self.seed}:{kind}:{batch}')
+
+    def batches(self, count):
+        for start in range(0, count, self.batch_size):
+            yield start // self.batch_size, range(start, min(start + self.batch_size, count))
+
+    def created_at(self, rng):
+        return self.now - HISTORY * rng.random()
+
+    def run(self, collections, products, customers, orders, items_per_order=5):
+        with historical_timestamps(models.Collection, models.Product, models.ProductPrice, get_user_model(),
+                                   models.Customer, models.Order, models.OrderItem):
+            self.collections(collections)
+            self.products(products, collections)
+            self.customers(customers)
+            self.orders(orders, customers, products, items_per_order)
+        return self.loader.rows, self.loader.seconds
+
+    def report(self, label):
+        if self.stdout is not None:
+            rows, seconds = self.loader.rows.get(label, 0), self.loader.seconds.get(label, 0.0)
+            self.stdout.write(f'{label}: {rows} rows in {seconds:.1f}s ({rows / (seconds or 1e-9):.0f} rows/s)')
+
+    def collections(self, count):
+        rng = self.rng('collection', 0)
+        self.loader.load(models.Collection, [
+            models.Collection(id=make_id(self.seed, 'collection', number),
+                              title=f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {number}',
+                              created_at=self.now - HISTORY, updated_at=self.now)
+            for number in range(count)])
+        self.report('store.Collection')
+
+    def products(self, count, collections):
+        for batch, numbers in self.batches(count):
+            rng = self.rng('product', batch)
+            products, prices = [], []
+            for number in numbers:
+                created_at = self.created_at(rng)
+                product_id = make_id(self.seed, 'product', number)
+                products.append(models.Product(
+                    id=product_id, title=f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}',
+                    description=' '.join(rng.choices(ADJECTIVES + NOUNS, k=12)).lower(),
+                    unit_price=unit_price(number), quantity=rng.randint(0, 500),
+                    collection_id=make_id(self.seed, 'collection', rng.randrange(collections)),
+                    created_at=created_at, updated_at=created_at))
+                prices.append(models.ProductPrice(product_id=product_id, effective_price=unit_price(number),
+                                                  updated_at=created_at))
+            self.loader.load(models.Product, products)
+            self.loader.load(models.ProductPrice, prices)
+        self.report('store.Product')
+        self.report('store.ProductPrice')
+
+    def customers(self, count):
+        User = get_user_model()
+        # Users keep integer ids; take a block after the current maximum.
+        first_id = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        self.first_user_id = first_id
+        for batch, numbers in self.batches(count):
+            rng = self.rng('customer', batch)
+            users, customers = [], []
+            for number in numbers:
+                joined = self.created_at(rng)
+                username = f'seed{self.seed}-{number}'
+                users.append(User(id=first_id + number, username=username, email=f'{username}@example.com',
+                                  password='!', first_name=rng.choice(NOUNS), last_name=rng.choice(ADJECTIVES),
+                                  date_joined=joined))
+                customers.append(models.Customer(
+                    id=make_id(self.seed, 'customer', number), user_id=first_id + number,
+                    phone=f'+234{rng.randrange(10 ** 9, 10 ** 10)}', created_at=joined, updated_at=joined))
+            self.loader.load(User, users)
+            self.loader.load(models.Customer, customers)
+        if count:
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [User]):
+                    cursor.execute(sql)
+        self.report(User._meta.label)
+        self.report('store.Customer')
+
+    def orders(self, count, customers, products, items_per_order):
+        statuses = [models.Order.COMPLETED] * 8 + [models.Order.PENDING, models.Order.FAILED]
+        for batch, numbers in self.batches(count):
+            rng = self.rng('order', batch)
+            orders, items = [], []
+            for number in numbers:
+                created_at = self.created_at(rng)
+                order_id = make_id(self.seed, 'order', number)
+                orders.append(models.Order(
+                    id=order_id, customer_id=make_id(self.seed, 'customer', rng.randrange(customers)),
+                    payment_status=rng.choice(statuses), created_at=created_at, updated_at=created_at))
+                for product_number in rng.sample(range(products), min(products, rng.randint(1, items_per_order))):
+                    items.append(models.OrderItem(
+                        id=make_id(self.seed, f'order-{number}-item', product_number), order_id=order_id,
+                        product_id=make_id(self.seed, 'product', product_number), quantity=rng.randint(1, 5),
+                        unit_price=unit_price(product_number), created_at=created_at, updated_at=created_at))
+            self.loader.load(models.Order, orders)
+            self.loader.load(models.OrderItem, items)
+        self.report('store.Order')
+        self.report('store.OrderItem')
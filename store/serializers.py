@@ -1,19 +1,41 @@
 from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
-from . import models
-from .signals import order_created
+from rest_framework.exceptions import NotFound
+from core.metrics import TimedSerializerMixin
+from . import carts, images, inventory, models, outbox
 
 
-class CollectionSerializer(serializers.ModelSerializer):
+class CollectionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     product_count = serializers.IntegerField(read_only = True)
     class Meta:
         model = models.Collection
         fields = ['id', 'title', 'product_count', 'created_at']
 
-class ProductImageSerializer(serializers.ModelSerializer):
+class ProductImageSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = models.ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'width', 'height']
+        prefetch_related = ['renditions']
+
+    def to_representation(self, instance):
+        # ?size= swaps the original for that rendition once it is generated;
+        # renditions lists every size in the ?image_format= (default WebP).
+        data = super().to_representation(instance)
+        request = self.context.get('request')
+        size, name = images.requested_rendition(request)
+        renditions = {rendition.size: rendition for rendition in instance.renditions.all() if rendition.format == name}
+        data['renditions'] = {
+            rendition.size: {'url': self.file_url(rendition.file), 'width': rendition.width, 'height': rendition.height}
+            for rendition in renditions.values()}
+        if size in renditions:
+            data.update(image = data['renditions'][size]['url'], width = renditions[size].width,
+                        height = renditions[size].height)
+        return data
+
+    def file_url(self, file):
+        request = self.context.get('request')
+        return request.build_absolute_uri(file.url) if request else file.url
 
     def create(self, validated_data):
         product_id = self.context['product_id']
@@ -21,14 +43,17 @@ class ProductImageSerializer(serializers.ModelSerializer):
 
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     review_count = serializers.IntegerField(read_only = True)
+    effective_price = serializers.DecimalField(max_digits = 6, decimal_places = 2, read_only = True)
     images = ProductImageSerializer(many = True, read_only = True)
     class Meta:
         model = models.Product
-        fields = ['id', 'title', 'unit_price', 'description','quantity', 'collection','review_count', 'images']
+        fields = ['id', 'title', 'unit_price', 'effective_price', 'description','quantity', 'collection','review_count', 'images']
+        select_related = ['price']
+        prefetch_related = ['images']
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Review
         fields = ['id', 'description', 'name']
@@ -38,110 +63,197 @@ class ReviewSerializer(serializers.ModelSerializer):
         return models.Review.objects.create(product_id = product_id, **validated_data)
     
 
-class CartItemSerialiizer(serializers.ModelSerializer):
+class CartItemSerialiizer(TimedSerializerMixin, serializers.ModelSerializer):
     product = ProductSerializer()
     total_price = serializers.SerializerMethodField()
 
     def get_total_price(self,obj:models.CartItem):
-        return obj.quantity * obj.product.unit_price
+        return obj.quantity * obj.product.effective_price
 
     class Meta:
         model = models.CartItem
         fields = ['id','product','quantity', 'total_price']
+        select_related = ['product']
 
     
 
-class AddCartItemSerialiizer(serializers.ModelSerializer):
+class AddCartItemSerialiizer(TimedSerializerMixin, serializers.ModelSerializer):
     product_id = serializers.UUIDField()
     class Meta:
         model = models.CartItem
         fields = ['id','quantity', 'product_id']
 
-    def validate_product_id(self, value):
-        if not models.Product.objects.filter(pk = value).exists():
-            raise serializers.ValidationError('No product with the given ID found')
-        return value
-        
-    
     def save(self, **kwargs):
         cart_id = self.context['cart_id']
         product_id = self.validated_data['product_id']
         quantity = self.validated_data['quantity']
-        try:
-            cart_item = models.CartItem.objects.get(cart_id = cart_id, product_id = product_id)
-            cart_item.quantity += quantity
-            self.instance = cart_item.save()
-        except models.CartItem.DoesNotExist:
-            self.instance = models.CartItem.objects.create(cart_id = cart_id, **self.validated_data)
+        # Existence checks, insert and increment happen in a single statement.
+        self.instance = carts.add_item(cart_id, product_id, quantity)
+        if self.instance is None:
+            if not models.Cart.objects.filter(pk = cart_id).exists():
+                raise NotFound('No cart with the given ID was found.')
+            raise serializers.ValidationError({'product_id': ['No product with the given ID found']})
         return self.instance
     
-class UpdateCartItemSerializer(serializers.ModelSerializer):
+class BulkCartItemListSerializer(serializers.ListSerializer):
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        # One IN query for every product; errors are reported per item.
+        product_ids = [item['product_id'] for item in items]
+        found = set(models.Product.objects.filter(pk__in = product_ids).values_list('id', flat=True))
+        errors = [{} if item['product_id'] in found else {'product_id': ['No product with the given ID found']}
+                  for item in items]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return items
+
+    def validate(self, attrs):
+        product_ids = [item['product_id'] for item in attrs]
+        if len(set(product_ids)) != len(product_ids):
+            raise serializers.ValidationError('Each product may only appear once.')
+        return attrs
+
+    def save(self, **kwargs):
+        quantities = {item['product_id']: item['quantity'] for item in self.validated_data}
+        if not carts.set_items(self.context['cart_id'], quantities):
+            raise NotFound('No cart with the given ID was found.')
+
+
+class BulkCartItemSerializer(TimedSerializerMixin, serializers.Serializer):
+    product_id = serializers.UUIDField()
+    # 0 removes the product from the cart.
+    quantity = serializers.IntegerField(min_value = 0)
+
+    class Meta:
+        list_serializer_class = BulkCartItemListSerializer
+
+
+class UpdateCartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = models.CartItem
         fields = ['quantity']
 
-class CartSerialiizer(serializers.ModelSerializer):
+class CartSerialiizer(TimedSerializerMixin, serializers.ModelSerializer):
     items = CartItemSerialiizer(many=True, read_only = True)
     total_price = serializers.SerializerMethodField()
     def get_total_price(self,obj:models.Cart):
         
-        return (sum([(item.quantity * item.product.unit_price) for item in obj.items.all()]))
+        return (sum([(item.quantity * item.product.effective_price) for item in obj.items.all()]))
 
     class Meta:
         model = models.Cart
         fields = ['id','items', 'total_price']
+        prefetch_related = ['items']
 
-class CustomerSerializer(serializers.ModelSerializer):
+class CustomerSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     user_id = serializers.IntegerField(read_only=True)
     class Meta:
         model = models.Customer
         fields = ['id', 'user_id', 'phone', 'birth_day']
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class TopProductSerializer(TimedSerializerMixin, serializers.Serializer):
+    product_id = serializers.UUIDField()
+    title = serializers.CharField()
+    units = serializers.IntegerField()
+
+
+class CustomerHistorySerializer(TimedSerializerMixin, serializers.Serializer):
+    customer_id = serializers.UUIDField()
+    order_count = serializers.IntegerField()
+    total_spent = serializers.DecimalField(max_digits = 12, decimal_places = 2)
+    last_order_at = serializers.DateTimeField()
+    top_products = TopProductSerializer(many = True)
+
+
+class SalesSerializer(TimedSerializerMixin, serializers.Serializer):
+    # Only in rows of interval=day.
+    day = serializers.DateField(required = False)
+    title = serializers.CharField()
+    revenue = serializers.DecimalField(max_digits = 14, decimal_places = 2)
+    units = serializers.IntegerField()
+    order_count = serializers.IntegerField()
+
+
+class ProductSalesSerializer(SalesSerializer):
+    product_id = serializers.UUIDField()
+
+
+class CollectionSalesSerializer(SalesSerializer):
+    collection_id = serializers.UUIDField()
+
+
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     product = ProductSerializer()
     class Meta:
         model = models.OrderItem
         fields = ['id', 'product', 'quantity','unit_price']
-class OrderSerializer(serializers.ModelSerializer):
+        select_related = ['product']
+
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
     class Meta:
         model = models.Order
         fields = ['id', 'customer', 'items', 'payment_status','created_at']
+        prefetch_related = ['items']
 
-class CreateOrderSerializer(serializers.Serializer):
-    cart_id = serializers.UUIDField()
 
-    def validate_cart_id(self, cart_id):
-        if not models.Cart.objects.filter(pk = cart_id).exists():
-            raise serializers.ValidationError('No cart with the given ID was found.')
-        if models.CartItem.objects.filter(cart_id = cart_id).count() == 0:
-            raise serializers.ValidationError('The cart is empty.')
-        return cart_id
-        
+class PlacedOrderSerializer(OrderSerializer):
+    """An order returned by CreateOrderSerializer.save, with the items it was created with."""
+    items = OrderItemSerializer(many=True, source='placed_items')
+
+
+class CreateOrderSerializer(TimedSerializerMixin, serializers.Serializer):
+    cart_id = serializers.UUIDField()
 
     def save(self, **kwargs):
+        # Checkout runs a fixed number of statements whatever the cart size:
+        # the cart lock, one locking read of the cart lines with their
+        # products, the order insert, one bulk insert of the items,
+        # one batched stock update, two deletes for the cart and the outbox insert.
         with transaction.atomic():
             cart_id = self.validated_data['cart_id']
-            user_id = self.context['user_id']
-            
+            # Resolved by the view (store.authentication.get_customer_id).
+            customer_id = self.context['customer_id']
+
+            # A second checkout of the same cart waits here, then finds it gone.
+            if not list(models.Cart.objects.select_for_update().filter(pk = cart_id).values_list('pk', flat=True)):
+                raise serializers.ValidationError({'cart_id': ['No cart with the given ID was found.']})
+            cart_items = list(models.CartItem.objects.filter(cart_id = cart_id)
+                              .select_related('product', 'product__price')
+                              .select_for_update(of = ('self', 'product'))
+                              .order_by('product_id'))
+            if not cart_items:
+                raise serializers.ValidationError({'cart_id': ['The cart is empty.']})
 
-            cart_items = models.CartItem.objects.select_related('product').filter(cart_id = cart_id)
-            customer= models.Customer.objects.get(user_id = user_id)
-            order = models.Order.objects.create(customer = customer)
+            shortfalls = inventory.reserve(
+                {item.product_id: item.quantity for item in cart_items},
+                stock = {item.product_id: item.product.quantity for item in cart_items})
+            if shortfalls:
+                # Raising inside the atomic block rolls back the whole checkout.
+                raise serializers.ValidationError({'items': [
+                    {'product_id': product_id, 'error': f'Only {available:g} left in stock.'}
+                    for product_id, available in shortfalls.items()]})
+
+            order = models.Order.objects.create(customer_id = customer_id)
             order_items = [
                 models.OrderItem(
                     product = item.product,
                     quantity = item.quantity, 
-                    unit_price = item.product.unit_price, 
+                    unit_price = item.product.effective_price, 
                     order = order
                 ) for item in cart_items]
             models.OrderItem.objects.bulk_create(order_items)
-            models.Cart.objects.filter(pk = cart_id).delete()
-            order_created.send_robust(sender=self.__class__, order = order)
-            return order
+            carts.delete_cart(cart_id)
+            # Delivered by run_outbox_worker once this transaction commits.
+            outbox.publish('order_created', order_id = str(order.id))
+
+        # Serve the response from the rows already in memory (PlacedOrderSerializer).
+        prefetch_related_objects([item.product for item in order_items], 'images__renditions')
+        order.placed_items = order_items
+        return order
         
-class UpdateOrderSerializer(serializers.ModelSerializer):
+class UpdateOrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = models.Order
         fields = ['payment_status']
@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
 from django.conf import settings
-from store.models import Customer
+from django.utils import timezone
+from store import authentication, cache, counters, images, pricing, rollups, search, summaries
+from store.models import Collection, Customer, Order, Product, ProductImage, ProductImageRendition, Promotion, Review
 
 
 
@@ -9,4 +12,207 @@ from store.models import Customer
 #signal handler
 def create_customer_for_new_user(sender, **kwargs):
     if kwargs['created']:
-        Customer.objects.create(user = kwargs['instance'])
\ No newline at end of file
+        Customer.objects.create(user = kwargs['instance'])
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_user_identity(sender, instance, **kwargs):
+    # Covers is_active, is_staff and password changes.
+    user_id = instance.pk
+    transaction.on_commit(lambda: authentication.identities.invalidate(user_id))
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def forget_customer_identity(sender, instance, **kwargs):
+    user_id = instance.user_id
+    transaction.on_commit(lambda: authentication.identities.invalidate(user_id))
+
+
+def bump_catalog_cache(scope, pk):
+    # Bump after commit so a concurrent reader can't cache pre-commit rows
+    # under the new version.
+    transaction.on_commit(lambda: cache.bump(scope, pk))
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_collection(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._original_collection_id = None
+    else:
+        instance._original_collection_id = Product.objects.filter(
+            pk = instance.pk).values_list('collection_id', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def count_product(sender, instance, created, **kwargs):
+    original_collection_id = instance._original_collection_id
+    if created:
+        counters.adjust_product_count(instance.collection_id, 1)
+    elif original_collection_id and original_collection_id != instance.collection_id:
+        counters.adjust_product_count(original_collection_id, -1)
+        counters.adjust_product_count(instance.collection_id, 1)
+
+
+@receiver(post_delete, sender=Product)
+def uncount_product(sender, instance, **kwargs):
+    counters.adjust_product_count(instance.collection_id, -1)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product(sender, instance, **kwargs):
+    bump_catalog_cache('product', instance.pk)
+    bump_catalog_cache('collection', instance.collection_id)
+    original_collection_id = getattr(instance, '_original_collection_id', None)
+    if original_collection_id and original_collection_id != instance.collection_id:
+        bump_catalog_cache('collection', original_collection_id)
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_collection(sender, instance, **kwargs):
+    bump_catalog_cache('collection', instance.pk)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_image(sender, instance, **kwargs):
+    # Images and review counts are part of the product's representation, so
+    # they move its updated_at (and therefore its ETag) too.
+    Product.objects.filter(pk = instance.product_id).update(updated_at = timezone.now())
+    bump_catalog_cache('product', instance.product_id)
+
+
+@receiver(pre_save, sender=ProductImage)
+def remember_product_image_file(sender, instance, update_fields, **kwargs):
+    if instance._state.adding:
+        instance._original_image_name = None
+    elif update_fields is None or 'image' in update_fields:
+        instance._original_image_name = ProductImage.objects.filter(
+            pk = instance.pk).values_list('image', flat=True).first()
+
+
+@receiver(post_save, sender=ProductImage)
+def render_product_image(sender, instance, created, update_fields, **kwargs):
+    # Dimension and timestamp updates from the pipeline itself don't change the file.
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    # Nor do edits of other fields: only a new file needs new renditions.
+    if created or instance.image.name != instance._original_image_name:
+        transaction.on_commit(lambda: images.schedule(instance.pk))
+
+
+@receiver(post_delete, sender=ProductImageRendition)
+def delete_rendition_file(sender, instance, **kwargs):
+    transaction.on_commit(lambda: instance.file.delete(save = False))
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_product(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._original_product_id = None
+    else:
+        instance._original_product_id = Review.objects.filter(
+            pk = instance.pk).values_list('product_id', flat=True).first()
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, created, **kwargs):
+    original_product_id = instance._original_product_id
+    if created:
+        counters.adjust_review_count(instance.product_id, 1)
+    elif original_product_id and original_product_id != instance.product_id:
+        counters.adjust_review_count(original_product_id, -1)
+        counters.adjust_review_count(instance.product_id, 1)
+        bump_catalog_cache('product', original_product_id)
+    else:
+        # Review text isn't part of the product's representation.
+        return
+    bump_catalog_cache('product', instance.product_id)
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    counters.adjust_review_count(instance.product_id, -1)
+    bump_catalog_cache('product', instance.product_id)
+
+
+@receiver(post_save, sender=Product)
+def price_product(sender, instance, **kwargs):
+    pricing.refresh(Product.objects.filter(pk = instance.pk))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    search.reindex(Product.objects.filter(pk = instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    search.unindex_product(instance.pk)
+
+
+@receiver(post_save, sender=Collection)
+def index_collection_products(sender, instance, created, **kwargs):
+    # The collection title is part of every member product's document.
+    if not created:
+        search.reindex(Product.objects.filter(collection = instance))
+
+
+@receiver(post_save, sender=Promotion)
+def price_promotion(sender, instance, **kwargs):
+    pricing.refresh(pricing.products_for_promotion(instance))
+
+
+@receiver(pre_delete, sender=Promotion)
+def remember_promoted_products(sender, instance, **kwargs):
+    instance._promoted_product_ids = list(pricing.products_for_promotion(instance).values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Promotion)
+def reprice_promoted_products(sender, instance, **kwargs):
+    pricing.refresh(Product.objects.filter(pk__in = instance._promoted_product_ids))
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+@receiver(m2m_changed, sender=Collection.promotions.through)
+def price_promotion_links(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # The links are gone by post_clear; remember who they pointed at.
+        instance._cleared_product_ids = list(pricing.products_for_promotion(instance).values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if action == 'post_clear' and reverse:
+        products = Product.objects.filter(pk__in = instance._cleared_product_ids)
+    elif not reverse:
+        products = (Product.objects.filter(pk = instance.pk) if isinstance(instance, Product)
+                    else Product.objects.filter(collection = instance))
+    elif sender is Product.promotions.through:
+        products = Product.objects.filter(pk__in = pk_set)
+    else:
+        products = Product.objects.filter(collection__in = pk_set)
+    pricing.refresh(products)
+
+
+@receiver([pre_save, pre_delete], sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._original_payment_status = None
+    else:
+        instance._original_payment_status = Order.objects.filter(
+            pk = instance.pk).values_list('payment_status', flat=True).first()
+
+
+@receiver(post_save, sender=Order)
+def summarize_order(sender, instance, created, **kwargs):
+    summaries.order_saved(instance, created, instance._original_payment_status)
+    rollups.order_saved(instance, instance._original_payment_status)
+
+
+@receiver(post_delete, sender=Order)
+def unsummarize_order(sender, instance, **kwargs):
+    summaries.order_deleted(instance)
+    rollups.order_deleted(instance, instance._original_payment_status)
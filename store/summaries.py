@@ -0,0 +1,142 @@
+"""
+Per-customer order summaries (CustomerSummary, CustomerProductSummary),
+kept up to date as orders are placed and paid so a customer's history
+is read from a few rows instead of aggregated over every OrderItem.
+
+order_count and last_order_at cover every order placed; total_spent and
+the product units cover completed orders only. An order's items are
+taken to be fixed by the time it completes. Deleting an order recomputes
+its customer from scratch, as rebuild() (manage.py rebuild_summaries)
+does for everyone.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Max, PositiveIntegerField, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from . import models
+
+TOP_PRODUCTS = 5
+
+
+def _item_totals(order_id):
+    """(amount spent, {product id: units}) for an order's items."""
+    rows = (models.OrderItem.objects.filter(order_id = order_id).order_by().values('product_id')
+            .annotate(units = Sum('quantity'),
+                      spent = Sum(F('quantity') * F('unit_price'), output_field = DecimalField())))
+    units = {row['product_id']: row['units'] for row in rows}
+    return sum((row['spent'] for row in rows), start = 0), units
+
+
+def _ensure_summary(customer_id):
+    models.CustomerSummary.objects.bulk_create([models.CustomerSummary(customer_id = customer_id)],
+                                               ignore_conflicts = True)
+
+
+def order_placed(order):
+    _ensure_summary(order.customer_id)
+    placed = Value(order.created_at)
+    models.CustomerSummary.objects.filter(pk = order.customer_id).update(
+        order_count = F('order_count') + 1,
+        last_order_at = Greatest(Coalesce('last_order_at', placed), placed),
+        updated_at = timezone.now())
+
+
+def order_completed(order, sign=1):
+    """Add (sign=1) or take away (sign=-1) a completed order's spend and units."""
+    spent, units = _item_totals(order.pk)
+    _ensure_summary(order.customer_id)
+    models.CustomerSummary.objects.filter(pk = order.customer_id).update(
+        total_spent = F('total_spent') + sign * spent, updated_at = timezone.now())
+    if not units:
+        return
+    summaries = models.CustomerProductSummary.objects.filter(
+        customer_id = order.customer_id, product_id__in = units)
+    if sign > 0:
+        models.CustomerProductSummary.objects.bulk_create([
+            models.CustomerProductSummary(customer_id = order.customer_id, product_id = product_id)
+            for product_id in units], ignore_conflicts = True)
+    delta = Case(*[When(product_id = product_id, then = Value(count)) for product_id, count in units.items()],
+                 output_field = PositiveIntegerField())
+    if sign > 0:
+        summaries.update(units = F('units') + delta)
+    else:
+        summaries.update(units = Greatest(F('units') - delta, Value(0)))
+        summaries.filter(units = 0).delete()
+
+
+def order_saved(order, created, previous_status):
+    if created:
+        order_placed(order)
+    was_completed = previous_status == models.Order.COMPLETED
+    is_completed = order.payment_status == models.Order.COMPLETED
+    if is_completed and not was_completed:
+        order_completed(order)
+    elif was_completed and not is_completed:
+        order_completed(order, sign = -1)
+
+
+def order_deleted(order):
+    # The instance's status may be stale and its items (PROTECTed) were
+    # deleted beforehand, so recompute the customer rather than subtract.
+    rebuild(models.Customer.objects.filter(pk = order.customer_id))
+
+
+def rebuild(customers=None, batch_size=1000):
+    """Recompute the summaries of every customer in the queryset (all by default)."""
+    if customers is None:
+        customers = models.Customer.objects.all()
+    ids = customers.order_by('pk').values_list('pk', flat = True)
+    batch = []
+    rebuilt = 0
+    for pk in ids.iterator(chunk_size = batch_size):
+        batch.append(pk)
+        if len(batch) == batch_size:
+            rebuilt += _rebuild_batch(batch)
+            batch = []
+    if batch:
+        rebuilt += _rebuild_batch(batch)
+    return rebuilt
+
+
+def _rebuild_batch(customer_ids):
+    orders = models.Order.objects.filter(customer_id__in = customer_ids).order_by()
+    completed = models.OrderItem.objects.filter(
+        order__customer_id__in = customer_ids, order__payment_status = models.Order.COMPLETED).order_by()
+    with transaction.atomic():
+        spent = dict(completed.values_list('order__customer_id').annotate(
+            spent = Sum(F('quantity') * F('unit_price'), output_field = DecimalField())))
+        models.CustomerSummary.objects.filter(customer_id__in = customer_ids).delete()
+        models.CustomerProductSummary.objects.filter(customer_id__in = customer_ids).delete()
+        summaries = models.CustomerSummary.objects.bulk_create([
+            models.CustomerSummary(customer_id = row['customer_id'], order_count = row['count'],
+                                   last_order_at = row['last'], total_spent = spent.get(row['customer_id'], 0))
+            for row in orders.values('customer_id').annotate(count = Count('pk'), last = Max('created_at'))])
+        models.CustomerProductSummary.objects.bulk_create([
+            models.CustomerProductSummary(customer_id = customer_id, product_id = product_id, units = units)
+            for customer_id, product_id, units in
+            completed.values_list('order__customer_id', 'product_id').annotate(units = Sum('quantity'))],
+            batch_size = 1000)
+    return len(summaries)
+
+
+def get_summary(customer_id):
+    """The customer's summary as a dict, with its top products; None if there is no such customer."""
+    try:
+        customer = models.Customer.objects.filter(pk = customer_id).order_by().select_related('summary').first()
+    except ValidationError:
+        # Not a UUID, so not a customer either.
+        return None
+    if customer is None:
+        return None
+    summary = getattr(customer, 'summary', None) or models.CustomerSummary(customer = customer)
+    top_products = (models.CustomerProductSummary.objects.filter(customer_id = customer_id)
+                    .order_by('-units', 'product_id')
+                    .values('product_id', 'units', title = F('product__title'))[:TOP_PRODUCTS])
+    return {
+        'customer_id': customer.pk,
+        'order_count': summary.order_count,
+        'total_spent': summary.total_spent,
+        'last_order_at': summary.last_order_at,
+        'top_products': list(top_products),
+    }
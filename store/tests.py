@@ -1,3 +1,1649 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import itertools
+import re
+import tempfile
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from urllib.parse import quote
+from uuid import uuid4
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from django.test import TransactionTestCase
+from rest_framework.exceptions import ValidationError
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from . import authentication, cache, counters, images, imports, models, outbox, rollups, search, seeding, summaries
+from .filters import ProductFilter
+from .signals import order_created
+from .uploads import FileTooLarge, ImageUploadHandler
+from .pagination import KeysetPagination
 
-# Create your tests here.
+
+class StoreTestCase(APITestCase):
+    def setUp(self):
+        cache.get_cache().clear()
+        cache.get_version_cache().clear()
+        search.reset_index()
+        authentication.identities.clear()
+
+    def create_user(self, username='customer', **kwargs):
+        return get_user_model().objects.create_user(
+            username=username, email=f'{username}@example.com', **kwargs)
+
+    def create_collection(self, title='Fruits'):
+        return models.Collection.objects.create(title=title)
+
+    def create_products(self, collection, count, images=2, reviews=2):
+        products = models.Product.objects.bulk_create([
+            models.Product(title=f'Product {i}', description='Fresh', unit_price=Decimal('2.50'),
+                           quantity=100, collection=collection)
+            for i in range(count)])
+        models.ProductImage.objects.bulk_create([
+            models.ProductImage(product=product, image=f'store/images/{product.id}-{i}.png')
+            for product in products for i in range(images)])
+        models.Review.objects.bulk_create([
+            models.Review(product=product, name='Ada', description='Good')
+            for product in products for i in range(reviews)])
+        # bulk_create skips the signal handlers that maintain the counters.
+        counters.repair_product_counts(models.Collection.objects.filter(pk=collection.pk))
+        counters.repair_review_counts(models.Product.objects.filter(collection=collection))
+        return products
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class QueryCountTests(StoreTestCase):
+    sizes = [1, 10, 500]
+
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.customer = models.Customer.objects.get(user=self.user)
+        self.staff = self.create_user('staff', is_staff=True)
+
+    def count_queries(self, url, populate, user=None):
+        self.client.force_authenticate(user)
+        counts = []
+        for size in self.sizes:
+            with transaction.atomic():
+                url_for_size = url.format(**populate(size) or {})
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url_for_size)
+                self.assertEqual(response.status_code, 200, response.content)
+                counts.append(len(queries))
+                transaction.set_rollback(True)
+        return counts
+
+    def assertConstantQueries(self, url, populate, user=None):
+        counts = self.count_queries(url, populate, user)
+        self.assertEqual(len(set(counts)), 1, f'{url}: {dict(zip(self.sizes, counts))}')
+
+    def test_collection_list(self):
+        def populate(size):
+            for i in range(size):
+                self.create_products(self.create_collection(f'Collection {i}'), 1)
+        self.assertConstantQueries('/api/store/collections/', populate)
+
+    def test_product_list(self):
+        def populate(size):
+            self.create_products(self.create_collection(), size)
+        self.assertConstantQueries('/api/store/products/', populate)
+
+    def test_product_images_and_reviews(self):
+        def populate(size):
+            product, = self.create_products(self.create_collection(), 1, images=size, reviews=size)
+            return {'product': product.id}
+        self.assertConstantQueries('/api/store/products/{product}/images/', populate)
+        self.assertConstantQueries('/api/store/products/{product}/reviews/', populate)
+
+    def populate_cart(self, size):
+        cart = models.Cart.objects.create()
+        products = self.create_products(self.create_collection(), size)
+        models.CartItem.objects.bulk_create([
+            models.CartItem(cart=cart, product=product, quantity=1) for product in products])
+        return {'cart': cart.id}
+
+    def test_cart_detail(self):
+        self.assertConstantQueries('/api/store/carts/{cart}/', self.populate_cart)
+
+    def test_cart_item_list(self):
+        self.assertConstantQueries('/api/store/carts/{cart}/items/', self.populate_cart)
+
+    def populate_orders(self, size):
+        products = self.create_products(self.create_collection(), 2)
+        orders = models.Order.objects.bulk_create([
+            models.Order(customer=self.customer) for i in range(size)])
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=order, product=product, quantity=1, unit_price=product.unit_price)
+            for order in orders for product in products])
+
+    def test_order_list_for_customer(self):
+        self.assertConstantQueries('/api/store/orders/', self.populate_orders, self.user)
+
+    def test_order_list_for_staff(self):
+        self.assertConstantQueries('/api/store/orders/', self.populate_orders, self.staff)
+
+    def test_customer_list(self):
+        def populate(size):
+            for i in range(size):
+                self.create_user(f'user{i}')
+        self.assertConstantQueries('/api/store/customers/', populate, self.staff)
+
+
+class KeysetPaginationTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        collection = self.create_collection()
+        self.products = self.create_products(collection, 45, images=0, reviews=0)
+        # Force ties on created_at so the id tiebreaker is exercised.
+        models.Product.objects.update(created_at=self.products[0].created_at)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [product['id'] for product in response.data['results']]
+            last = response
+            url = response.data['next']
+        return ids, last
+
+    def test_pages_cover_every_row_once(self):
+        ids, _ = self.walk('/api/store/products/?page_size=10')
+        self.assertEqual(len(ids), 45)
+        self.assertCountEqual(ids, [str(product.id) for product in self.products])
+
+    def test_previous_link_returns_the_previous_page(self):
+        first = self.client.get('/api/store/products/?page_size=10')
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/store/products/?cursor=garbage')
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogCacheTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product, = self.create_products(self.create_collection(), 1)
+        self.url = f'/api/store/products/{self.product.id}/'
+
+    def test_second_read_is_served_from_cache(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.data['id'], str(self.product.id))
+
+    def test_bump_from_another_process_invalidates(self):
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'HIT')
+        # Another process (a cron job, another worker) has its own cache
+        # objects but shares the version store.
+        other_process = FileBasedCache(settings.CACHES['catalog_versions']['LOCATION'], {'TIMEOUT': None})
+        with mock.patch.object(cache, 'get_version_cache', return_value=other_process):
+            cache.bump('product', self.product.id)
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+        with mock.patch.object(cache, 'get_version_cache', return_value=other_process):
+            cache.bump_all()
+        self.assertEqual(self.client.get('/api/store/products/')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(self.url)['X-Cache'], 'MISS')
+
+    def test_review_invalidates_product_and_list(self):
+        self.client.get(self.url)
+        self.client.get('/api/store/products/')
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Review.objects.create(product=self.product, name='Ada', description='Great')
+        detail = self.client.get(self.url)
+        self.assertEqual(detail['X-Cache'], 'MISS')
+        self.assertEqual(detail.data['review_count'], 3)
+        self.assertEqual(self.client.get('/api/store/products/')['X-Cache'], 'MISS')
+
+    def test_moving_product_invalidates_both_collections(self):
+        old = self.product.collection
+        new = self.create_collection('Grains')
+        self.client.get(f'/api/store/collections/{old.id}/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.collection = new
+            self.product.save()
+        response = self.client.get(f'/api/store/collections/{old.id}/')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['product_count'], 0)
+
+
+class ConditionalRequestTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product, = self.create_products(self.create_collection(), 1)
+        self.cart = models.Cart.objects.create()
+        self.item = models.CartItem.objects.create(cart=self.cart, product=self.product, quantity=1)
+        self.item_url = f'/api/store/carts/{self.cart.id}/items/{self.item.id}/'
+
+    def test_not_modified_skips_serialization(self):
+        url = f'/api/store/carts/{self.cart.id}/'
+        response = self.client.get(url)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_with_related_rows(self):
+        url = f'/api/store/products/{self.product.id}/'
+        with override_settings(CATALOG_CACHE_ENABLED=False):
+            etag = self.client.get(url)['ETag']
+            models.Review.objects.create(product=self.product, name='Ada', description='Great')
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_cached_response_answers_conditional_get(self):
+        url = f'/api/store/products/{self.product.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_patch_with_stale_if_match_fails(self):
+        etag = self.client.get(self.item_url)['ETag']
+        self.client.patch(self.item_url, {'quantity': 2}, HTTP_IF_MATCH=etag)
+        response = self.client.patch(self.item_url, {'quantity': 3}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 2)
+
+    def test_list_validators_cover_only_the_served_page(self):
+        products = self.create_products(self.create_collection('Grains'), 5, images=0, reviews=0)
+        url = '/api/store/products/?page_size=2'
+        with override_settings(CATALOG_CACHE_ENABLED=False):
+            with CaptureQueriesContext(connection) as queries:
+                etag = self.client.get(url)['ETag']
+            self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+            # Older than the first page: a change there keeps its ETag.
+            models.Product.objects.filter(pk=self.product.pk).update(title='Mango', updated_at=timezone.now())
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            models.Product.objects.filter(pk=products[-1].pk).update(title='Yam', updated_at=timezone.now())
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag_follows_dependencies_of_the_page(self):
+        url = f'/api/store/carts/{self.cart.id}/items/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        models.Product.objects.filter(pk=self.product.pk).update(updated_at=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_patch_returns_new_etag(self):
+        etag = self.client.get(self.item_url)['ETag']
+        response = self.client.patch(self.item_url, {'quantity': 2}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CounterTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fruits = self.create_collection('Fruits')
+        self.grains = self.create_collection('Grains')
+        self.product, = self.create_products(self.fruits, 1, reviews=0)
+
+    def assertCounts(self, fruits, grains, reviews):
+        self.fruits.refresh_from_db()
+        self.grains.refresh_from_db()
+        self.product.refresh_from_db()
+        self.assertEqual((self.fruits.product_count, self.grains.product_count, self.product.review_count),
+                         (fruits, grains, reviews))
+
+    def test_counters_follow_writes(self):
+        models.Product.objects.create(title='Yam', description='', unit_price=1, quantity=1,
+                                      collection=self.fruits)
+        review = models.Review.objects.create(product=self.product, name='Ada', description='Good')
+        self.assertCounts(2, 0, 1)
+        self.product.collection = self.grains
+        self.product.save()
+        self.assertCounts(1, 1, 1)
+        review.delete()
+        self.assertCounts(1, 1, 0)
+        self.product.delete()
+        self.fruits.refresh_from_db()
+        self.grains.refresh_from_db()
+        self.assertEqual((self.fruits.product_count, self.grains.product_count), (1, 0))
+
+    def test_drifted_counters_stay_at_zero(self):
+        review = models.Review.objects.create(product=self.product, name='Ada', description='Good')
+        models.Collection.objects.update(product_count=0)
+        models.Product.objects.update(review_count=0)
+        review.delete()
+        self.product.delete()
+        self.fruits.refresh_from_db()
+        self.assertEqual(self.fruits.product_count, 0)
+
+    def test_review_edits_move_counts_only_between_products(self):
+        other, = self.create_products(self.grains, 1, images=0, reviews=0)
+        review = models.Review.objects.create(product=self.product, name='Ada', description='Good')
+        review.description = 'Very good'
+        with CaptureQueriesContext(connection) as queries:
+            review.save()
+        self.assertFalse([query for query in queries if 'review_count' in query['sql']])
+        review.product = other
+        review.save()
+        other.refresh_from_db()
+        self.assertCounts(1, 1, 0)
+        self.assertEqual(other.review_count, 1)
+
+    def test_list_endpoints_do_not_aggregate(self):
+        response = self.client.get('/api/store/collections/')
+        counts = {collection['title']: collection['product_count'] for collection in response.data['results']}
+        self.assertEqual(counts, {'Fruits': 1, 'Grains': 0})
+
+    def test_repair_command(self):
+        models.Collection.objects.update(product_count=7)
+        models.Product.objects.update(review_count=7)
+        call_command('repair_counters', stdout=io.StringIO())
+        self.assertCounts(1, 0, 0)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'needs row-level concurrency')
+class ConcurrentCounterTests(TransactionTestCase):
+    def test_concurrent_review_inserts(self):
+        collection = models.Collection.objects.create(title='Fruits')
+        product = models.Product.objects.create(title='Mango', description='', unit_price=1,
+                                                quantity=1, collection=collection)
+        threads, per_thread = 8, 25
+
+        def add_reviews():
+            try:
+                for i in range(per_thread):
+                    models.Review.objects.create(product=product, name='Ada', description='Good')
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=add_reviews) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        product.refresh_from_db()
+        self.assertEqual(product.review_count, threads * per_thread)
+        self.assertEqual(models.Review.objects.filter(product=product).count(), threads * per_thread)
+
+
+class AddCartItemTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product, = self.create_products(self.create_collection(), 1)
+        self.cart = models.Cart.objects.create()
+        self.url = f'/api/store/carts/{self.cart.id}/items/'
+
+    def test_add_merges_into_existing_line_in_one_statement(self):
+        self.client.post(self.url, {'product_id': self.product.id, 'quantity': 2})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'product_id': self.product.id, 'quantity': 3})
+        # Touching (and so locking) the cart, then the upsert.
+        statements = [query['sql'] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(len(statements), 2, statements)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['quantity'], 5)
+        item = models.CartItem.objects.get(cart=self.cart)
+        self.assertEqual((str(item.id), item.quantity), (response.data['id'], 5))
+
+    def test_fallback_without_upsert_support(self):
+        with mock.patch('store.carts.supports_upsert', return_value=False):
+            self.client.post(self.url, {'product_id': self.product.id, 'quantity': 2})
+            response = self.client.post(self.url, {'product_id': self.product.id, 'quantity': 3})
+        self.assertEqual(response.data['quantity'], 5)
+
+    def test_unknown_product(self):
+        response = self.client.post(self.url, {'product_id': self.cart.id, 'quantity': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('product_id', response.data)
+
+    def test_unknown_cart(self):
+        response = self.client.post(f'/api/store/carts/{self.product.id}/items/',
+                                    {'product_id': self.product.id, 'quantity': 1})
+        self.assertEqual(response.status_code, 404)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'needs row-level concurrency')
+class ConcurrentAddCartItemTests(TransactionTestCase):
+    def test_parallel_adds_to_one_cart(self):
+        collection = models.Collection.objects.create(title='Fruits')
+        product = models.Product.objects.create(title='Mango', description='', unit_price=1,
+                                                quantity=1, collection=collection)
+        cart = models.Cart.objects.create()
+        url = f'/api/store/carts/{cart.id}/items/'
+        threads, per_thread = 16, 10
+        statuses = []
+
+        def add():
+            client = APIClient()
+            try:
+                for i in range(per_thread):
+                    statuses.append(client.post(url, {'product_id': product.id, 'quantity': 1}).status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=add) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(set(statuses), {201})
+        item = models.CartItem.objects.get(cart=cart, product=product)
+        self.assertEqual(item.quantity, threads * per_thread)
+
+
+class BulkCartItemTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = self.create_products(self.create_collection(), 4)
+        self.cart = models.Cart.objects.create()
+        self.url = f'/api/store/carts/{self.cart.id}/items/bulk/'
+        for product in self.products[:2]:
+            models.CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+
+    def test_add_update_and_remove_in_one_request(self):
+        keep, remove, add, _ = self.products
+        operations = [
+            {'product_id': str(keep.id), 'quantity': 5},
+            {'product_id': str(remove.id), 'quantity': 0},
+            {'product_id': str(add.id), 'quantity': 2},
+        ]
+        response = self.client.post(self.url, operations, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        quantities = {item['product']['id']: item['quantity'] for item in response.data['items']}
+        self.assertEqual(quantities, {str(keep.id): 5, str(add.id): 2})
+        self.assertEqual(response.data['total_price'], Decimal('17.50'))
+
+    def test_response_matches_cart_representation(self):
+        operations = [{'product_id': str(self.products[2].id), 'quantity': 2}]
+        response = self.client.post(f'{self.url}?size=thumb', operations, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        cart = self.client.get(f'/api/store/carts/{self.cart.id}/?size=thumb')
+        self.assertEqual(response.json(), cart.json())
+        image = response.data['items'][0]['product']['images'][0]['image']
+        self.assertTrue(image.startswith('http://testserver/'), image)
+
+    def test_query_count_does_not_grow_with_operations(self):
+        products = self.create_products(self.create_collection('Grains'), 50)
+        operations = [{'product_id': str(product.id), 'quantity': 1} for product in products]
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, operations, format='json')
+        self.assertLess(len(queries), 15)
+
+    def test_unknown_products_are_reported_per_item(self):
+        operations = [{'product_id': str(self.products[0].id), 'quantity': 1},
+                      {'product_id': str(self.cart.id), 'quantity': 1}]
+        response = self.client.post(self.url, operations, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('product_id', response.data[1])
+
+    def test_line_added_concurrently_is_set_not_duplicated(self):
+        product = self.products[3]
+        bulk_create = models.CartItem.objects.bulk_create
+
+        def add_first(items, **kwargs):
+            # A single add landing after the sync read the cart's lines.
+            models.CartItem.objects.create(cart=self.cart, product=product, quantity=7)
+            return bulk_create(items, **kwargs)
+        with mock.patch.object(models.CartItem.objects, 'bulk_create', side_effect=add_first):
+            response = self.client.post(self.url, [{'product_id': str(product.id), 'quantity': 2}], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.CartItem.objects.get(cart=self.cart, product=product).quantity, 2)
+
+    def test_duplicate_products_are_rejected(self):
+        operations = [{'product_id': str(self.products[0].id), 'quantity': 1}] * 2
+        response = self.client.post(self.url, operations, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CheckoutTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_authenticate(self.user)
+        self.mango, self.yam = self.create_products(self.create_collection(), 2)
+        self.cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=self.cart, product=self.mango, quantity=3)
+        models.CartItem.objects.create(cart=self.cart, product=self.yam, quantity=1)
+
+    def test_checkout_takes_items_out_of_stock(self):
+        response = self.client.post('/api/store/orders/', {'cart_id': self.cart.id})
+        self.assertEqual(response.status_code, 200, response.data)
+        self.mango.refresh_from_db()
+        self.yam.refresh_from_db()
+        self.assertEqual((self.mango.quantity, self.yam.quantity), (97, 99))
+        self.assertFalse(models.Cart.objects.filter(pk=self.cart.id).exists())
+
+    def test_checkout_runs_a_constant_number_of_queries(self):
+        counts = []
+        for size in (1, 50):
+            cart = models.Cart.objects.create()
+            products = self.create_products(self.create_collection(f'Size {size}'), size)
+            models.CartItem.objects.bulk_create([
+                models.CartItem(cart=cart, product=product, quantity=1) for product in products])
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post('/api/store/orders/', {'cart_id': cart.id})
+            self.assertEqual(len(response.data['items']), size)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+    def test_cart_checks_out_once(self):
+        self.assertEqual(self.client.post('/api/store/orders/', {'cart_id': self.cart.id}).status_code, 200)
+        response = self.client.post('/api/store/orders/', {'cart_id': self.cart.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cart_id', response.data)
+        self.assertEqual(models.Order.objects.count(), 1)
+
+    def test_empty_cart(self):
+        models.CartItem.objects.filter(cart=self.cart).delete()
+        response = self.client.post('/api/store/orders/', {'cart_id': self.cart.id})
+        self.assertEqual(response.data, {'cart_id': ['The cart is empty.']})
+
+    def test_shortfall_rolls_back_the_order(self):
+        models.Product.objects.filter(pk=self.mango.pk).update(quantity=2)
+        response = self.client.post('/api/store/orders/', {'cart_id': self.cart.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['items'][0]['product_id'], str(self.mango.id))
+        self.yam.refresh_from_db()
+        self.assertEqual(self.yam.quantity, 100)
+        self.assertFalse(models.Order.objects.exists())
+        self.assertEqual(models.CartItem.objects.filter(cart=self.cart).count(), 2)
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'needs row-level locking')
+class CheckoutStressTests(TransactionTestCase):
+    def test_no_oversell_under_contention(self):
+        collection = models.Collection.objects.create(title='Flash sale')
+        products = [models.Product.objects.create(title=f'Deal {i}', description='', unit_price=1,
+                                                  quantity=40, collection=collection) for i in range(3)]
+        users = [get_user_model().objects.create_user(username=f'buyer{i}', email=f'buyer{i}@example.com')
+                 for i in range(12)]
+        per_user = 10
+        statuses = []
+
+        def shop(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                for i in range(per_user):
+                    cart = models.Cart.objects.create()
+                    # Lines in different orders per user to provoke lock-order deadlocks.
+                    for product in (products if i % 2 else reversed(products)):
+                        models.CartItem.objects.create(cart=cart, product=product, quantity=1)
+                    statuses.append(client.post('/api/store/orders/', {'cart_id': cart.id}).status_code)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=shop, args=(user,)) for user in users]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(set(statuses) - {200, 400}, set())
+        self.assertEqual(statuses.count(200), 40)
+        for product in products:
+            product.refresh_from_db()
+            self.assertEqual(product.quantity, 0)
+            sold = sum(models.OrderItem.objects.filter(product=product).values_list('quantity', flat=True))
+            self.assertEqual(sold, 40)
+        sys.stderr.write(f'\n{len(statuses)} checkouts in {elapsed:.2f}s '
+                         f'({len(statuses) / elapsed:.0f} orders/sec)\n')
+
+
+class OutboxTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.client.force_authenticate(self.user)
+        self.cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=self.cart, product=self.create_products(self.create_collection(), 1)[0],
+                                       quantity=1)
+        self.delivered, self.failure = [], None
+        order_created.connect(self.receive)
+        self.addCleanup(order_created.disconnect, self.receive)
+
+    def receive(self, sender, order, **kwargs):
+        if self.failure:
+            raise RuntimeError(self.failure)
+        self.delivered.append(str(order.pk))
+
+    def checkout(self):
+        response = self.client.post('/api/store/orders/', {'cart_id': self.cart.id})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data['id']
+
+    def test_checkout_records_the_event_and_the_worker_delivers_it(self):
+        order_id = self.checkout()
+        self.assertEqual(self.delivered, [])
+        event = models.OutboxEvent.objects.get()
+        self.assertEqual((event.topic, event.payload), ('order_created', {'order_id': str(order_id)}))
+
+        out = io.StringIO()
+        call_command('run_outbox_worker', '--once', stdout=out)
+        self.assertIn('Delivered 1 events', out.getvalue())
+        self.assertEqual(self.delivered, [str(order_id)])
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (models.OutboxEvent.DONE, 1))
+
+    def test_failed_delivery_is_retried_with_backoff_then_given_up(self):
+        self.failure = 'mail server down'
+        self.checkout()
+        with mock.patch.object(outbox, 'MAX_ATTEMPTS', 2), self.assertLogs('django.dispatch', 'ERROR'), \
+                self.assertLogs('store.outbox', 'WARNING'):
+            self.assertEqual(outbox.run_once(), (0, 1))
+            event = models.OutboxEvent.objects.get()
+            self.assertEqual((event.status, event.attempts), (models.OutboxEvent.PENDING, 1))
+            self.assertIn('mail server down', event.last_error)
+            self.assertEqual(outbox.run_once(), (0, 0))
+
+            later = event.available_at + timedelta(seconds=1)
+            self.assertEqual([e.pk for e in outbox.claim(now=later)], [event.pk])
+            self.assertFalse(outbox.process(models.OutboxEvent.objects.get()))
+        event.refresh_from_db()
+        self.assertEqual((event.status, event.attempts), (models.OutboxEvent.FAILED, 2))
+
+    def test_rolled_back_checkout_records_nothing(self):
+        models.Product.objects.update(quantity=0)
+        response = self.client.post('/api/store/orders/', {'cart_id': self.cart.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.OutboxEvent.objects.exists())
+
+
+@unittest.skipUnless(connection.vendor == 'postgresql', 'needs SKIP LOCKED')
+class ConcurrentOutboxTests(TransactionTestCase):
+    def test_workers_claim_disjoint_batches(self):
+        models.OutboxEvent.objects.bulk_create([
+            models.OutboxEvent(topic='noop', payload={'n': i}) for i in range(200)])
+        claimed = []
+        barrier = threading.Barrier(4)
+
+        def work():
+            try:
+                barrier.wait()
+                while events := outbox.claim(batch_size=10):
+                    claimed.extend(event.pk for event in events)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=work) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(len(claimed), 200)
+        self.assertEqual(len(set(claimed)), 200)
+
+
+class PricingTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.collection = self.create_collection()
+        self.product = models.Product.objects.create(
+            title='Mango', description='', unit_price=Decimal('10.00'), quantity=10, collection=self.collection)
+
+    def price(self):
+        return models.ProductPrice.objects.get(product=self.product).effective_price
+
+    def promotion(self, discount, **kwargs):
+        return models.Promotion.objects.create(description=f'{discount}% off', discount=discount,
+                                               start_date=timezone.now() - timedelta(days=1), **kwargs)
+
+    def test_best_live_promotion_wins(self):
+        self.collection.promotions.add(self.promotion(10))
+        self.assertEqual(self.price(), Decimal('9.00'))
+        self.product.promotions.add(self.promotion(25))
+        self.assertEqual(self.price(), Decimal('7.50'))
+        self.product.promotions.add(self.promotion(50, end_date=timezone.now() - timedelta(hours=1)))
+        self.assertEqual(self.price(), Decimal('7.50'))
+
+    def test_pausing_and_deleting_a_promotion(self):
+        promotion = self.promotion(20)
+        self.product.promotions.add(promotion)
+        promotion.paused = True
+        promotion.save()
+        self.assertEqual(self.price(), Decimal('10.00'))
+        promotion.paused = False
+        promotion.save()
+        self.assertEqual(self.price(), Decimal('8.00'))
+        promotion.delete()
+        self.assertEqual(self.price(), Decimal('10.00'))
+
+    def test_scheduled_promotion_starts_on_refresh(self):
+        promotion = self.promotion(20)
+        models.Promotion.objects.filter(pk=promotion.pk).update(start_date=timezone.now() + timedelta(hours=1))
+        promotion.refresh_from_db()
+        promotion.save()
+        self.product.promotions.add(promotion)
+        self.assertEqual(self.price(), Decimal('10.00'))
+        models.Promotion.objects.filter(pk=promotion.pk).update(start_date=timezone.now() - timedelta(seconds=1))
+        models.ProductPrice.objects.update(valid_until=timezone.now() - timedelta(seconds=1))
+        call_command('refresh_prices', stdout=io.StringIO())
+        self.assertEqual(self.price(), Decimal('8.00'))
+
+    def test_cart_and_checkout_use_the_effective_price(self):
+        self.product.promotions.add(self.promotion(50))
+        cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        response = self.client.get(f'/api/store/carts/{cart.id}/')
+        self.assertEqual(response.data['total_price'], Decimal('10.00'))
+        self.assertEqual(response.data['items'][0]['product']['effective_price'], Decimal('5.00'))
+
+        self.client.force_authenticate(self.create_user())
+        response = self.client.post('/api/store/orders/', {'cart_id': cart.id})
+        self.assertEqual(response.data['items'][0]['unit_price'], Decimal('5.00'))
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class SearchTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.fruits = self.create_collection('Tropical fruits')
+        self.drinks = self.create_collection('Drinks')
+        self.product('Mango', 'Sweet and ripe', self.fruits)
+        self.product('Mango juice', 'Pressed daily', self.drinks)
+        self.product('Smoothie', 'Blended mango and banana', self.drinks)
+        self.product('Pineapple', 'Juicy', self.fruits)
+
+    def product(self, title, description, collection):
+        return models.Product.objects.create(title=title, description=description, unit_price=Decimal('1.00'),
+                                             quantity=10, collection=collection)
+
+    def titles(self, query, **params):
+        response = self.client.get('/api/store/products/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [product['title'] for product in response.data['results']]
+
+    def test_title_matches_rank_above_description_matches(self):
+        titles = self.titles('mango')
+        self.assertEqual(set(titles), {'Mango', 'Mango juice', 'Smoothie'})
+        self.assertEqual(titles[-1], 'Smoothie')
+
+    def test_prefix_and_collection_matches(self):
+        self.assertEqual(set(self.titles('pine')), {'Pineapple'})
+        self.assertEqual(set(self.titles('tropic')), {'Mango', 'Pineapple'})
+        self.assertEqual(self.titles('mango jui'), ['Mango juice'])
+        self.assertEqual(self.titles('kiwi'), [])
+
+    def test_cursor_pages_through_ranked_results(self):
+        first = self.client.get('/api/store/products/', {'q': 'mango', 'page_size': 2}).data
+        second = self.client.get(first['next']).data
+        self.assertEqual([p['title'] for p in first['results'] + second['results']], self.titles('mango'))
+        self.assertIsNone(second['next'])
+
+    def test_index_follows_writes(self):
+        self.titles('mango')
+        with self.captureOnCommitCallbacks(execute=True):
+            pineapple = models.Product.objects.get(title='Pineapple')
+            pineapple.title = 'Papaya'
+            pineapple.save()
+            self.drinks.title = 'Beverages'
+            self.drinks.save()
+            models.Product.objects.get(title='Mango').delete()
+        self.assertEqual(self.titles('papaya'), ['Papaya'])
+        self.assertEqual(self.titles('pineapple'), [])
+        self.assertEqual(set(self.titles('beverage')), {'Mango juice', 'Smoothie'})
+        self.assertEqual(set(self.titles('mango')), {'Mango juice', 'Smoothie'})
+
+    def test_rolled_back_writes_stay_out_of_the_index(self):
+        self.titles('mango')
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.product('Papaya', 'Soft', self.fruits)
+                    models.Product.objects.get(title='Pineapple').delete()
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(search.get_index().search(['papaya']), [])
+        self.assertEqual(len(search.get_index().search(['pineapple'])), 1)
+
+    def test_filters_apply_to_every_match(self):
+        models.Product.objects.bulk_create([
+            models.Product(title='Mango', description='', unit_price=1, quantity=1, collection=self.drinks)
+            for _ in range(1001)])
+        # A description match, ranked below every one of the drinks.
+        self.product('Fruit salad', 'With mango', self.fruits)
+        search.reset_index()
+        self.assertEqual(set(self.titles('mango', collection=self.fruits.pk)), {'Mango', 'Fruit salad'})
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class ProductFilterTests(StoreTestCase):
+    filters = {
+        'collection': lambda test: {'collection': test.fruits.pk},
+        'unit_price': lambda test: {'unit_price_min': '1.00', 'unit_price_max': '3.00'},
+        'in_stock': lambda test: {'in_stock': 'true'},
+        'created_at': lambda test: {'created_after': '2020-01-01T00:00:00Z',
+                                    'created_before': '2100-01-01T00:00:00Z'},
+    }
+    orderings = [None, 'unit_price', '-unit_price', 'created_at', '-created_at']
+
+    def setUp(self):
+        super().setUp()
+        self.fruits = self.create_collection('Fruits')
+        self.drinks = self.create_collection('Drinks')
+        for title, price, quantity, collection in [('Apple', '1.00', 5, self.fruits), ('Kiwi', '4.00', 5, self.fruits),
+                                                   ('Pear', '2.00', 0, self.fruits), ('Tea', '3.00', 9, self.drinks)]:
+            models.Product.objects.create(title=title, description='', unit_price=Decimal(price),
+                                          quantity=quantity, collection=collection)
+
+    def titles(self, **params):
+        response = self.client.get('/api/store/products/', params)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [product['title'] for product in response.data['results']]
+
+    def test_filters_combine(self):
+        self.assertEqual(self.titles(collection=self.fruits.pk, in_stock='true', ordering='unit_price'), ['Apple', 'Kiwi'])
+        self.assertEqual(self.titles(unit_price_min='2.00', unit_price_max='3.00', ordering='-unit_price'), ['Tea', 'Pear'])
+        self.assertEqual(self.titles(created_before='2000-01-01T00:00:00Z'), [])
+
+    def test_ordering_pages_with_cursor(self):
+        first = self.client.get('/api/store/products/', {'ordering': 'unit_price', 'page_size': 3}).data
+        second = self.client.get(first['next']).data
+        self.assertEqual([p['title'] for p in first['results'] + second['results']], ['Apple', 'Pear', 'Tea', 'Kiwi'])
+
+    def test_rejects_unknown_values(self):
+        for params in [{'ordering': 'title'}, {'unit_price_min': 'cheap'}, {'collection': 'x'}]:
+            self.assertEqual(self.client.get('/api/store/products/', params).status_code, 400)
+
+    def plan(self, params):
+        request = Request(APIRequestFactory().get('/', params))
+        queryset = ProductFilter().filter_queryset(request, models.Product.objects.all(), None)
+        ordering = KeysetPagination().get_ordering(request, queryset, None)
+        return queryset.order_by(*ordering)[:21].explain()
+
+    def test_every_filter_combination_uses_an_index(self):
+        table = models.Product._meta.db_table
+        if connection.vendor == 'postgresql':
+            full_scan = re.compile(rf'Seq Scan on {table}\b')
+        else:
+            full_scan = re.compile(rf'SCAN {table}$', re.MULTILINE)
+        for size in range(len(self.filters) + 1):
+            for names in itertools.combinations(self.filters, size):
+                for ordering in self.orderings:
+                    params = {key: value for name in names for key, value in self.filters[name](self).items()}
+                    if ordering:
+                        params['ordering'] = ordering
+                    with self.subTest(params=params), transaction.atomic():
+                        if connection.vendor == 'postgresql':
+                            # A handful of rows is always cheapest to scan;
+                            # ask whether an index can serve the query at all.
+                            with connection.cursor() as cursor:
+                                cursor.execute('SET LOCAL enable_seqscan = off')
+                        plan = self.plan(params)
+                        self.assertIsNone(full_scan.search(plan), plan)
+
+
+def image_file(name='photo.png', size=(800, 600), mode='RGBA', format='PNG'):
+    buffer = io.BytesIO()
+    color = {'RGBA': (200, 120, 40, 128), 'RGB': (200, 120, 40), '1': 0}[mode]
+    Image.new(mode, size, color).save(buffer, format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{format.lower()}')
+
+
+@override_settings(IMAGE_RENDITIONS_ASYNC=False, CATALOG_CACHE_ENABLED=False)
+class ImageRenditionTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.product = self.create_products(self.create_collection(), 1, images=0, reviews=0)[0]
+        self.url = f'/api/store/products/{self.product.id}/images/'
+
+    def upload(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(self.url, {'image': image_file(**kwargs)}, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+        return models.ProductImage.objects.get(pk=response.data['id'])
+
+    def test_upload_generates_every_rendition(self):
+        image = self.upload()
+        self.assertEqual((image.width, image.height), (800, 600))
+        renditions = {(r.size, r.format): (r.width, r.height) for r in image.renditions.all()}
+        self.assertEqual(renditions, {
+            ('large', 'webp'): (800, 600), ('large', 'jpeg'): (800, 600),
+            ('medium', 'webp'): (480, 360), ('medium', 'jpeg'): (480, 360),
+            ('thumb', 'webp'): (160, 120), ('thumb', 'jpeg'): (160, 120)})
+        thumb = image.renditions.get(size='thumb', format='jpeg')
+        with Image.open(thumb.file) as decoded:
+            self.assertEqual((decoded.format, decoded.size), ('JPEG', (160, 120)))
+
+    def test_size_selects_the_rendition(self):
+        image = self.upload()
+        data = self.client.get(f'{self.url}{image.id}/', {'size': 'thumb'}).data
+        self.assertTrue(data['image'].endswith('.webp'))
+        self.assertEqual((data['width'], data['height']), (160, 120))
+        self.assertEqual(set(data['renditions']), {'thumb', 'medium', 'large'})
+
+        products = self.client.get('/api/store/products/', {'size': 'medium', 'image_format': 'jpeg'}).data
+        image_data = products['results'][0]['images'][0]
+        self.assertTrue(image_data['image'].endswith('.jpg'))
+        self.assertEqual(image_data['width'], 480)
+
+        original = self.client.get(f'{self.url}{image.id}/').data
+        self.assertEqual((original['width'], original['height']), (800, 600))
+        self.assertEqual(self.client.get(self.url, {'size': 'huge'}).status_code, 400)
+
+    def test_only_a_new_file_is_rendered_again(self):
+        image = self.upload()
+        with mock.patch('store.images.schedule') as schedule, self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        schedule.assert_not_called()
+        with mock.patch('store.images.schedule') as schedule, self.captureOnCommitCallbacks(execute=True):
+            image.image = image_file('other.png')
+            image.save()
+        schedule.assert_called_once_with(image.pk)
+
+    def test_replaced_or_deleted_image_discards_its_renditions(self):
+        image = self.upload()
+        files = [rendition.file.path for rendition in image.renditions.all()]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'{self.url}{image.id}/')
+        self.assertFalse(models.ProductImageRendition.objects.exists())
+        self.assertFalse(any(map(os.path.exists, files)))
+
+        image = models.ProductImage.objects.create(product=self.product, image=image_file())
+        stale = images.generate(image.id, render=lambda data: (image.delete(), images.imaging.render(data))[1])
+        self.assertEqual(stale, [])
+
+
+@override_settings(PRODUCT_IMAGE_MAX_UPLOAD_SIZE=20 * 1024, PRODUCT_IMAGE_MAX_DIMENSION=2000)
+class ImageUploadTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, IMAGE_RENDITIONS_ASYNC=False))
+        self.product = self.create_products(self.create_collection(), 1, images=0, reviews=0)[0]
+        self.url = f'/api/store/products/{self.product.id}/images/'
+
+    def post(self, upload):
+        return self.client.post(self.url, {'image': upload}, format='multipart')
+
+    def handler(self):
+        handler = ImageUploadHandler()
+        handler.new_file('image', 'photo.png', 'image/png', None)
+        return handler
+
+    def test_accepts_an_image_under_the_limit(self):
+        self.assertEqual(self.post(image_file(size=(400, 300))).status_code, 201)
+
+    def test_refuses_an_oversized_body_before_reading_it(self):
+        upload = SimpleUploadedFile('photo.jpg', b'\xff\xd8\xff' + os.urandom(80 * 1024), content_type='image/jpeg')
+        with mock.patch.object(ImageUploadHandler, 'receive_data_chunk') as receive:
+            response = self.post(upload)
+        self.assertEqual(response.status_code, 413)
+        receive.assert_not_called()
+        self.assertFalse(models.ProductImage.objects.exists())
+
+    def test_aborts_once_the_stream_passes_the_limit(self):
+        handler = self.handler()
+        header = image_file(size=(100, 100)).read()
+        handler.receive_data_chunk(header, 0)
+        chunk = b'\0' * handler.chunk_size
+        position = len(header)
+        with self.assertRaises(FileTooLarge):
+            while True:
+                handler.receive_data_chunk(chunk, position)
+                position += len(chunk)
+        self.assertLessEqual(handler.buffer.tell(), 20 * 1024)
+
+    def test_rejects_files_that_are_not_images_on_the_first_chunk(self):
+        handler = self.handler()
+        with self.assertRaises(ValidationError):
+            handler.receive_data_chunk(b'<?php system($_GET["c"]); ?>', 0)
+        response = self.post(SimpleUploadedFile('photo.png', b'MZ' + b'\0' * 100, content_type='image/png'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_oversized_dimensions_from_the_header(self):
+        # A mostly blank 1-bit PNG compresses to a few KB but would decode
+        # to a huge bitmap.
+        upload = image_file(size=(5000, 5000), mode='1')
+        self.assertLess(upload.size, 20 * 1024)
+        response = self.post(upload)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('2000px', str(response.data['image'][0]))
+
+    def test_rejects_a_truncated_image(self):
+        data = image_file(size=(400, 300), mode='RGB', format='JPEG').read()
+        response = self.post(SimpleUploadedFile('photo.jpg', data[:10], content_type='image/jpeg'))
+        self.assertEqual(response.status_code, 400)
+
+
+class BenchCommandTests(StoreTestCase):
+    def test_reports_every_flow_and_cleans_up(self):
+        out = io.StringIO()
+        call_command('bench', '--collections=2', '--products=10', '--customers=2', '--orders=3', '--requests=2',
+                     stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['flows']), {'catalog_browse', 'product_detail', 'add_to_cart', 'checkout',
+                                                'order_history'})
+        for flow, result in report['flows'].items():
+            self.assertEqual(result['errors'], 0, flow)
+            self.assertGreater(result['count'], 0, flow)
+            self.assertIn('p99_ms', result)
+        self.assertFalse(models.Product.objects.exists())
+        self.assertFalse(models.Order.objects.exists())
+        self.assertFalse(get_user_model().objects.exists())
+
+
+class SeedCommandTests(StoreTestCase):
+    def seed(self, seed=0):
+        call_command('seed_db', '--collections=3', '--products=25', '--customers=6', '--orders=40',
+                     '--batch-size=10', f'--seed={seed}', stdout=io.StringIO())
+
+    def test_loads_a_deterministic_dataset(self):
+        self.seed()
+        self.assertEqual(models.Collection.objects.count(), 3)
+        self.assertEqual(models.Product.objects.count(), 25)
+        self.assertEqual(models.ProductPrice.objects.count(), 25)
+        self.assertEqual(models.Customer.objects.count(), 6)
+        self.assertEqual(models.Order.objects.count(), 40)
+        self.assertEqual(sum(models.Collection.objects.values_list('product_count', flat=True)), 25)
+        self.assertEqual(models.Product.objects.filter(pk=seeding.make_id(0, 'product', 24)).count(), 1)
+        first = sorted(models.OrderItem.objects.values_list('id', 'order_id', 'product_id', 'quantity'))
+
+        models.OrderItem.objects.all().delete()
+        models.Order.objects.all().delete()
+        get_user_model().objects.all().delete()
+        models.ProductPrice.objects.all().delete()
+        models.Product.objects.all().delete()
+        models.Collection.objects.all().delete()
+        self.seed()
+        self.assertEqual(sorted(models.OrderItem.objects.values_list('id', 'order_id', 'product_id', 'quantity')),
+                         first)
+
+    def test_datasets_with_different_seeds_coexist(self):
+        self.seed(0)
+        self.seed(1)
+        self.assertEqual(models.Product.objects.count(), 50)
+        self.assertEqual(get_user_model().objects.count(), 12)
+        # The user id sequence continues after the seeded block.
+        user = get_user_model().objects.create_user(username='after', email='after@example.com', password='x')
+        self.assertGreater(user.pk, 12)
+
+    def test_keeps_historical_timestamps(self):
+        self.seed()
+        oldest = models.Order.objects.order_by('created_at').first()
+        self.assertLess(oldest.created_at, timezone.now() - timedelta(days=7))
+        self.assertTrue(models.Product._meta.get_field('created_at').auto_now_add)
+
+
+class ExportTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = self.create_user('staff', is_staff=True)
+        self.customer = models.Customer.objects.get(user=self.create_user())
+        self.products = self.create_products(self.create_collection(), 3, images=0, reviews=0)
+        self.order = models.Order.objects.create(customer=self.customer)
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=self.order, product=product, quantity=2, unit_price=product.unit_price)
+            for product in self.products[:2]])
+        self.empty_order = models.Order.objects.create(customer=self.customer)
+        models.Order.objects.filter(pk=self.empty_order.pk).update(created_at=timezone.now() - timedelta(days=30))
+        self.client.force_authenticate(self.staff)
+
+    def export(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_orders_csv_has_a_row_per_item(self):
+        response, content = self.export('/api/store/orders/export/')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertRegex(response['Content-Disposition'], r'^attachment; filename="orders-\d{8}T\d{6}Z\.csv"$')
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0][:2], ['order_id', 'created_at'])
+        self.assertEqual([row[0] for row in rows[1:]],
+                         [str(self.empty_order.pk), str(self.order.pk), str(self.order.pk)])
+        self.assertEqual(rows[1][5:], ['', '', '', '', ''])
+        self.assertEqual(rows[2][4], 'customer@example.com')
+
+    def test_orders_ndjson_has_an_object_per_order(self):
+        response, content = self.export('/api/store/orders/export/?file_format=ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        orders = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([order['order_id'] for order in orders], [str(self.empty_order.pk), str(self.order.pk)])
+        self.assertEqual(orders[0]['items'], [])
+        self.assertEqual(sorted(item['product_id'] for item in orders[1]['items']),
+                         sorted(str(product.pk) for product in self.products[:2]))
+
+    def test_filters_by_created_at(self):
+        after = (timezone.now() - timedelta(days=1)).isoformat()
+        _, content = self.export(f'/api/store/orders/export/?file_format=ndjson&created_after={quote(after)}')
+        self.assertEqual([json.loads(line)['order_id'] for line in content.splitlines()], [str(self.order.pk)])
+        _, content = self.export(f'/api/store/orders/export/?file_format=ndjson&created_before={quote(after)}')
+        self.assertEqual([json.loads(line)['order_id'] for line in content.splitlines()],
+                         [str(self.empty_order.pk)])
+
+    def test_products(self):
+        _, content = self.export('/api/store/products/export/')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual({row['product_id'] for row in rows}, {str(product.pk) for product in self.products})
+        self.assertEqual({row['collection_title'] for row in rows}, {'Fruits'})
+        self.assertEqual({row['quantity'] for row in rows}, {'100.0'})
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.customer.user)
+        self.assertEqual(self.client.get('/api/store/orders/export/').status_code, 403)
+        self.assertEqual(self.client.get('/api/store/products/export/').status_code, 403)
+
+    def test_rejects_unknown_formats(self):
+        self.assertEqual(self.client.get('/api/store/orders/export/?file_format=xml').status_code, 400)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command('export', 'orders', '--file-format=ndjson', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+        with self.assertRaises(CommandError):
+            call_command('export', 'orders', '--created-after=yesterday', stdout=io.StringIO())
+
+
+@override_settings(CATALOG_CACHE_ENABLED=False)
+class ProductImportTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = self.create_user('staff', is_staff=True)
+        self.fruits = self.create_collection()
+        self.grains = self.create_collection('Grains')
+        self.mango, self.yam = self.create_products(self.fruits, 2, images=0, reviews=0)
+        self.client.force_authenticate(self.staff)
+
+    def upload(self, content, name='products.csv', **data):
+        return self.client.post('/api/store/products/import/',
+                                {'file': SimpleUploadedFile(name, content.encode()), **data}, format='multipart')
+
+    def test_upserts_by_id_and_by_title(self):
+        content = (
+            'id,title,collection,unit_price,quantity\n'
+            f'{self.mango.pk},,,3.75,\n'
+            f',Product 1,{self.fruits.pk},,0\n'
+            f',Rice,{self.grains.pk},12.00,40\n'
+            f'{self.yam.pk},,{self.grains.pk},,\n'
+        )
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'created': 1, 'updated': 2, 'unchanged': 0, 'error_count': 0, 'errors': []})
+        self.mango.refresh_from_db()
+        self.yam.refresh_from_db()
+        self.assertEqual((self.mango.unit_price, self.mango.quantity), (Decimal('3.75'), 100))
+        self.assertEqual((self.yam.quantity, self.yam.collection_id), (0, self.grains.pk))
+        rice = models.Product.objects.get(title='Rice')
+        self.assertEqual(rice.effective_price, Decimal('12.00'))
+        self.assertEqual(models.ProductPrice.objects.get(product=self.mango).effective_price, Decimal('3.75'))
+        self.fruits.refresh_from_db()
+        self.grains.refresh_from_db()
+        self.assertEqual((self.fruits.product_count, self.grains.product_count), (1, 2))
+        self.assertEqual(
+            [product['id'] for product in self.client.get('/api/store/products/?q=rice').data['results']],
+            [str(rice.pk)])
+
+    def test_reports_row_errors_without_aborting_the_batch(self):
+        content = '\n'.join([
+            json.dumps({'id': str(self.mango.pk), 'unit_price': '5.00'}),
+            '{not json',
+            json.dumps({'id': str(self.yam.pk), 'unit_price': 'cheap'}),
+            json.dumps({'title': 'Rice', 'collection': str(uuid4())}),
+            json.dumps({'title': 'Millet', 'collection': str(self.grains.pk)}),
+            json.dumps({'unit_price': '1.00'}),
+            json.dumps({'id': str(self.yam.pk), 'quantity': 100}),
+        ]) + '\n'
+        response = self.upload(content, name='products.ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['updated'], response.data['unchanged'], response.data['error_count']),
+                         (1, 1, 5))
+        self.assertEqual([error['row'] for error in response.data['errors']], [2, 3, 4, 5, 6])
+        self.assertIn('unit_price', response.data['errors'][1]['errors'])
+        self.assertIn('collection', response.data['errors'][2]['errors'])
+        self.assertEqual(set(response.data['errors'][3]['errors']), {'unit_price', 'quantity'})
+        self.mango.refresh_from_db()
+        self.assertEqual(self.mango.unit_price, Decimal('5.00'))
+
+    def test_database_errors_fail_only_their_rows(self):
+        write = imports._write
+
+        def failing_write(changes):
+            if any(change.product.pk == self.yam.pk for change in changes):
+                raise DatabaseError('constraint failed')
+            write(changes)
+        content = f'id,quantity\n{self.mango.pk},1\n{self.yam.pk},2\n'
+        with mock.patch.object(imports, '_write', failing_write):
+            response = self.upload(content)
+        self.assertEqual((response.data['updated'], response.data['error_count']), (1, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.mango.refresh_from_db()
+        self.assertEqual(self.mango.quantity, 1)
+
+    def test_ambiguous_titles_must_be_imported_by_id(self):
+        models.Product.objects.filter(pk=self.yam.pk).update(title='Product 0')
+        response = self.upload(f'title,collection,quantity\nProduct 0,{self.fruits.pk},1\n')
+        self.assertEqual(response.data['error_count'], 1)
+
+    def test_queries_per_batch_are_constant(self):
+        def import_rows(count):
+            content = 'title,collection,unit_price,quantity\n' + ''.join(
+                f'Item {count}-{i},{self.fruits.pk},1.00,5\n' for i in range(count))
+            with CaptureQueriesContext(connection) as queries:
+                result = imports.import_products(io.StringIO(content), 'csv')
+            self.assertEqual(result.created, count)
+            return len(queries)
+        self.assertEqual(import_rows(5), import_rows(50))
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.create_user())
+        self.assertEqual(self.upload('id\n').status_code, 403)
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write(f'id,quantity\n{self.mango.pk},7\n{uuid4()},1\n')
+        self.addCleanup(os.remove, file.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_products', file.name, stdout=out, stderr=err)
+        self.assertIn('updated 1', out.getvalue())
+        self.assertIn('Row 2:', err.getvalue())
+
+
+class CachedJWTAuthenticationTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user()
+        self.token = str(AccessToken.for_user(self.user))
+
+    def get(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(path, HTTP_AUTHORIZATION=f'JWT {self.token}')
+        identity_queries = [query['sql'] for query in queries
+                            if re.search(r'FROM "(core_user|store_customer)"', query['sql'])]
+        return response, identity_queries
+
+    def test_identity_is_cached(self):
+        for path in ['/api/store/orders/', '/api/store/customers/me/']:
+            self.get(path)
+        response, identity_queries = self.get('/api/store/orders/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(identity_queries, [])
+        response, identity_queries = self.get('/api/store/customers/me/')
+        self.assertEqual(response.status_code, 200)
+        # Only the customer the endpoint returns, looked up by primary key.
+        self.assertEqual(len(identity_queries), 1)
+
+    def test_saving_the_user_invalidates(self):
+        self.get('/api/store/orders/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        response, _ = self.get('/api/store/orders/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_deleted_users_are_rejected(self):
+        self.get('/api/store/orders/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        response, _ = self.get('/api/store/orders/')
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(AUTH_IDENTITY_CACHE_TTL=0)
+    def test_entries_expire(self):
+        self.get('/api/store/orders/')
+        _, identity_queries = self.get('/api/store/orders/')
+        self.assertEqual(len(identity_queries), 1)
+
+    @override_settings(AUTH_IDENTITY_CACHE_SIZE=2)
+    def test_least_recently_used_entries_are_evicted(self):
+        identities = authentication.IdentityCache()
+        for user_id in [1, 2, 1, 3]:
+            identities.set(user_id, ((), None))
+        self.assertEqual(list(identities.entries), ['1', '3'])
+
+
+class TokenClaimTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = self.create_user(password='a-long-password')
+        self.customer = models.Customer.objects.get(user=self.user)
+
+    def obtain(self):
+        response = self.client.post('/auth/jwt/create/', {'username': 'customer', 'password': 'a-long-password'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_tokens_carry_identity_claims(self):
+        tokens = self.obtain()
+        access = AccessToken(tokens['access'])
+        self.assertEqual((access['customer_id'], access['perms']), (str(self.customer.pk), []))
+        self.assertNotIn('is_staff', access)
+        refreshed = self.client.post('/auth/jwt/refresh/', {'refresh': tokens['refresh']}).data
+        self.assertEqual(AccessToken(refreshed['access'])['customer_id'], str(self.customer.pk))
+
+    def test_history_permission_comes_from_the_token(self):
+        url = f'/api/store/customers/{self.customer.pk}/history/'
+        token = self.obtain()['access']
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=f'JWT {token}').status_code, 403)
+
+        self.user.user_permissions.add(Permission.objects.get(codename='view_history'))
+        token = self.obtain()['access']
+        self.assertEqual(AccessToken(token)['perms'], ['store.view_history'])
+        self.client.get(url, HTTP_AUTHORIZATION=f'JWT {token}')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, HTTP_AUTHORIZATION=f'JWT {token}')
+        self.assertEqual(response.status_code, 200)
+        # Only the history itself is read: no user, customer or permission lookups.
+        self.assertFalse([query for query in queries if 'auth_' in query['sql'] or 'core_user' in query['sql']])
+
+    def test_staff_status_is_read_from_the_user_not_the_token(self):
+        token = self.obtain()['access']
+        other = models.Customer.objects.get(user=self.create_user('other'))
+        models.Order.objects.create(customer=other)
+        auth = {'HTTP_AUTHORIZATION': f'JWT {token}'}
+        self.assertEqual(len(self.client.get('/api/store/orders/', **auth).data['results']), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_staff = True
+            self.user.save()
+        self.assertEqual(len(self.client.get('/api/store/orders/', **auth).data['results']), 1)
+
+    def test_checkout_uses_the_customer_claim(self):
+        product, = self.create_products(self.create_collection(), 1, images=0, reviews=0)
+        cart = models.Cart.objects.create()
+        models.CartItem.objects.create(cart=cart, product=product, quantity=1)
+        token = self.obtain()['access']
+        response = self.client.post('/api/store/orders/', {'cart_id': str(cart.pk)}, format='json',
+                                    HTTP_AUTHORIZATION=f'JWT {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(models.Order.objects.get().customer_id, self.customer.pk)
+
+
+class CustomerHistoryTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = models.Customer.objects.get(user=self.create_user())
+        self.mango, self.yam, self.rice = self.create_products(self.create_collection(), 3, images=0, reviews=0)
+        self.staff = self.create_user('staff', is_staff=True)
+        self.staff.user_permissions.add(Permission.objects.get(codename='view_history'))
+        self.client.force_authenticate(self.staff)
+
+    def place_order(self, lines, status=models.Order.PENDING):
+        order = models.Order.objects.create(customer=self.customer)
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=order, product=product, quantity=quantity, unit_price=Decimal(price))
+            for product, quantity, price in lines])
+        if status != models.Order.PENDING:
+            order.payment_status = status
+            order.save()
+        return order
+
+    def history(self, query=''):
+        response = self.client.get(f'/api/store/customers/{self.customer.pk}/history/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assert_matches_rebuild(self):
+        before = self.history()
+        summaries.rebuild()
+        after = self.history()
+        for key in ['order_count', 'total_spent', 'last_order_at', 'top_products']:
+            self.assertEqual(before[key], after[key], key)
+
+    def test_summary_follows_orders_and_payment_status(self):
+        first = self.place_order([(self.mango, 2, '1.50'), (self.yam, 1, '4.00')], models.Order.COMPLETED)
+        second = self.place_order([(self.mango, 3, '1.50'), (self.rice, 1, '9.00')])
+        data = self.history()
+        self.assertEqual((data['order_count'], data['total_spent']), (2, Decimal('7.00')))
+        self.assertEqual(data['last_order_at'], second.created_at.isoformat().replace('+00:00', 'Z'))
+        self.assertEqual([(product['product_id'], product['units']) for product in data['top_products']],
+                         sorted([(str(self.mango.pk), 2), (str(self.yam.pk), 1)], key=lambda row: -row[1]))
+        self.assert_matches_rebuild()
+
+        self.client.force_authenticate(self.staff)
+        self.client.patch(f'/api/store/orders/{second.pk}/', {'payment_status': 'completed'})
+        data = self.history()
+        self.assertEqual(data['total_spent'], Decimal('20.50'))
+        self.assertEqual(data['top_products'][0], {'product_id': str(self.mango.pk), 'title': 'Product 0', 'units': 5})
+        self.assert_matches_rebuild()
+
+        first.payment_status = models.Order.FAILED
+        first.save()
+        data = self.history()
+        self.assertEqual(data['total_spent'], Decimal('13.50'))
+        self.assertNotIn(str(self.yam.pk), [product['product_id'] for product in data['top_products']])
+        self.assert_matches_rebuild()
+
+        models.OrderItem.objects.filter(order=second).delete()
+        second.delete()
+        data = self.history()
+        self.assertEqual((data['order_count'], data['total_spent'], data['top_products']), (1, 0, []))
+        self.assert_matches_rebuild()
+
+    def test_orders_are_keyset_paginated(self):
+        orders = [self.place_order([(self.mango, 1, '1.00')]) for _ in range(3)]
+        data = self.history('?page_size=2')
+        self.assertEqual([order['id'] for order in data['orders']['results']], [str(orders[2].pk), str(orders[1].pk)])
+        response = self.client.get(data['orders']['next'])
+        self.assertEqual([order['id'] for order in response.data['orders']['results']], [str(orders[0].pk)])
+
+    def test_queries_do_not_grow_with_history(self):
+        def count(orders):
+            for _ in range(orders):
+                self.place_order([(self.mango, 1, '1.00'), (self.yam, 2, '2.00')], models.Order.COMPLETED)
+            self.history('?page_size=5')
+            with CaptureQueriesContext(connection) as queries:
+                self.history('?page_size=5')
+            return len(queries)
+        self.assertEqual(count(5), count(50))
+
+    def test_customers_without_orders_and_unknown_customers(self):
+        data = self.history()
+        self.assertEqual((data['order_count'], data['total_spent'], data['last_order_at']), (0, 0, None))
+        self.assertEqual(self.client.get(f'/api/store/customers/{uuid4()}/history/').status_code, 404)
+        self.assertEqual(self.client.get('/api/store/customers/not-a-uuid/history/').status_code, 404)
+
+    def test_requires_the_permission(self):
+        self.client.force_authenticate(self.create_user('other'))
+        self.assertEqual(self.client.get(f'/api/store/customers/{self.customer.pk}/history/').status_code, 403)
+
+
+class SalesRollupTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.customer = models.Customer.objects.get(user=self.create_user())
+        self.fruits, self.grains = self.create_collection('Fruits'), self.create_collection('Grains')
+        self.mango, self.yam = self.create_products(self.fruits, 2, images=0, reviews=0)
+        self.rice, = self.create_products(self.grains, 1, images=0, reviews=0)
+        self.today = timezone.localdate()
+        self.yesterday = self.today - timedelta(days=1)
+        self.client.force_authenticate(self.create_user('staff', is_staff=True))
+
+    def place_order(self, lines, day=None, status=models.Order.COMPLETED):
+        order = models.Order.objects.create(customer=self.customer)
+        models.OrderItem.objects.bulk_create([
+            models.OrderItem(order=order, product=product, quantity=quantity, unit_price=Decimal(price))
+            for product, quantity, price in lines])
+        if day is not None:
+            models.Order.objects.filter(pk=order.pk).update(
+                created_at=order.created_at - timedelta(days=(self.today - day).days))
+            order.refresh_from_db()
+        order.payment_status = status
+        order.save()
+        return order
+
+    def rollup_rows(self):
+        return {
+            model.__name__: sorted((row.day, getattr(row, key), row.revenue, row.units, row.order_count)
+                                   for row in model.objects.all())
+            for model, key in rollups.ROLLUPS.items()}
+
+    def assert_matches_rebuild(self):
+        before = self.rollup_rows()
+        list(rollups.rebuild())
+        self.assertEqual(self.rollup_rows(), before)
+
+    def sales(self, kind, **params):
+        response = self.client.get(f'/api/store/sales/{kind}/',
+                                   {'start': self.yesterday, 'end': self.today, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_rollups_follow_completed_orders(self):
+        self.place_order([(self.mango, 2, '1.50'), (self.rice, 1, '4.00')], day=self.yesterday)
+        pending = self.place_order([(self.mango, 1, '1.50'), (self.yam, 3, '2.00')], status=models.Order.PENDING)
+        self.assertEqual(self.rollup_rows()['CollectionDailySales'], sorted([
+            (self.yesterday, self.fruits.pk, Decimal('3.00'), 2, 1),
+            (self.yesterday, self.grains.pk, Decimal('4.00'), 1, 1)]))
+        self.assert_matches_rebuild()
+
+        pending.payment_status = models.Order.COMPLETED
+        pending.save()
+        fruits_today = models.CollectionDailySales.objects.get(day=self.today, collection=self.fruits)
+        self.assertEqual((fruits_today.revenue, fruits_today.units, fruits_today.order_count),
+                         (Decimal('7.50'), 4, 1))
+        self.assert_matches_rebuild()
+
+        self.client.patch(f'/api/store/orders/{pending.pk}/', {'payment_status': 'failed'})
+        self.assertFalse(models.ProductDailySales.objects.filter(day=self.today).exists())
+        self.assert_matches_rebuild()
+
+    def test_deleting_a_completed_order_recomputes_its_day(self):
+        kept = self.place_order([(self.mango, 1, '1.50')])
+        deleted = self.place_order([(self.mango, 2, '1.50'), (self.yam, 1, '2.00')])
+        models.OrderItem.objects.filter(order=deleted).delete()
+        models.Order.objects.filter(pk=deleted.pk).delete()
+        self.assertEqual(self.rollup_rows()['ProductDailySales'],
+                         [(self.today, self.mango.pk, Decimal('1.50'), 1, 1)])
+        self.assertTrue(models.Order.objects.filter(pk=kept.pk).exists())
+
+    def test_date_range_queries(self):
+        self.place_order([(self.mango, 2, '1.50'), (self.rice, 1, '4.00')], day=self.yesterday)
+        self.place_order([(self.mango, 1, '1.50'), (self.yam, 3, '2.00')])
+        self.place_order([(self.rice, 1, '4.00')], day=self.today - timedelta(days=5))
+
+        products = self.sales('products')
+        self.assertEqual([(row['product_id'], row['revenue'], row['units'], row['order_count']) for row in products], [
+            (str(self.yam.pk), Decimal('6.00'), 3, 1),
+            (str(self.mango.pk), Decimal('4.50'), 3, 2),
+            (str(self.rice.pk), Decimal('4.00'), 1, 1)])
+        self.assertNotIn('day', products[0])
+
+        collections = self.sales('collections', start=self.today - timedelta(days=7))
+        self.assertEqual([(row['title'], row['revenue'], row['order_count']) for row in collections],
+                         [('Fruits', Decimal('10.50'), 2), ('Grains', Decimal('8.00'), 2)])
+
+        daily = self.sales('products', interval='day', product=self.mango.pk)
+        self.assertEqual([(row['day'], row['revenue']) for row in daily],
+                         [(self.yesterday.isoformat(), Decimal('3.00')), (self.today.isoformat(), Decimal('1.50'))])
+        self.assertEqual(len(self.sales('products', collection=self.grains.pk, limit=5)), 1)
+
+    def test_queries_are_read_from_the_rollups(self):
+        self.place_order([(self.mango, 2, '1.50')])
+        with CaptureQueriesContext(connection) as queries:
+            self.sales('collections')
+        self.assertFalse([query for query in queries if 'store_orderitem' in query['sql']])
+
+    def test_params_are_validated(self):
+        response = self.client.get('/api/store/sales/products/', {'start': self.today, 'end': self.yesterday})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('end', response.data)
+        self.assertEqual(self.client.get('/api/store/sales/products/').status_code, 400)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.create_user('other'))
+        self.assertEqual(self.client.get('/api/store/sales/products/').status_code, 403)
+
+    def test_rebuild_command_backfills_in_chunks(self):
+        for days_ago in range(10):
+            self.place_order([(self.mango, 1, '1.50')], day=self.today - timedelta(days=days_ago))
+        before = self.rollup_rows()
+        models.ProductDailySales.objects.all().delete()
+        models.CollectionDailySales.objects.all().delete()
+        out = io.StringIO()
+        call_command('rebuild_rollups', '--chunk-days', '4', stdout=out)
+        self.assertEqual(self.rollup_rows(), before)
+        self.assertEqual(len(re.findall(r'^\d{4}-\d\d-\d\d\.\.', out.getvalue(), re.M)), 3)
+        self.assertIn('Wrote 20 rollup rows', out.getvalue())
+
+        out = io.StringIO()
+        call_command('rebuild_rollups', '--start', self.yesterday.isoformat(), stdout=out)
+        self.assertIn('Wrote 4 rollup rows', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--chunk-days', '0')
+
+
+class SweepCartsTests(StoreTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product, = self.create_products(self.create_collection(), 1, images=0, reviews=0)
+
+    def create_cart(self, days_ago, items=True):
+        cart = models.Cart.objects.create()
+        if items:
+            models.CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        models.Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=days_ago))
+        return cart
+
+    def sweep(self, *args):
+        out = io.StringIO()
+        call_command('sweep_carts', *args, stdout=out)
+        return out.getvalue()
+
+    def test_deletes_untouched_carts_in_batches(self):
+        old = [self.create_cart(40) for _ in range(5)] + [self.create_cart(40, items=False)]
+        recent = self.create_cart(2)
+        with CaptureQueriesContext(connection) as queries:
+            output = self.sweep('--older-than', '30d', '--batch-size', '2')
+        self.assertIn('Deleted 6 carts and 5 items', output)
+        self.assertEqual(list(models.Cart.objects.values_list('pk', flat=True)), [recent.pk])
+        self.assertEqual(models.CartItem.objects.get().cart_id, recent.pk)
+        self.assertFalse(models.Cart.objects.filter(pk__in=[cart.pk for cart in old]).exists())
+        # Three batches of a SELECT and two DELETEs, then an empty SELECT; no per-row cascade.
+        deletes = [query['sql'] for query in queries if query['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 6)
+
+    def test_item_changes_touch_the_cart(self):
+        cart = self.create_cart(40, items=False)
+        url = f'/api/store/carts/{cart.pk}/items/'
+        self.client.post(url, {'product_id': self.product.id, 'quantity': 1})
+        self.assertIn('Deleted 0 carts', self.sweep('--older-than', '1d'))
+
+        item = models.CartItem.objects.get(cart=cart)
+        for request in [lambda: self.client.patch(f'{url}{item.pk}/', {'quantity': 3}),
+                        lambda: self.client.post(f'{url}bulk/', [{'product_id': str(self.product.id), 'quantity': 2}],
+                                                 format='json'),
+                        lambda: self.client.delete(f'{url}{item.pk}/')]:
+            models.Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now() - timedelta(days=40))
+            self.assertLess(request().status_code, 300)
+            self.assertGreater(models.Cart.objects.get(pk=cart.pk).updated_at, timezone.now() - timedelta(hours=1))
+
+    def test_ages(self):
+        self.create_cart(2)
+        self.assertIn('Deleted 0 carts', self.sweep('--older-than', '72h'))
+        self.assertIn('Deleted 1 carts', self.sweep('--older-than', '90m'))
+        for args in [('--older-than', 'a week'), ('--batch-size', '0')]:
+            with self.assertRaises(CommandError):
+                self.sweep(*args)
@@ -0,0 +1,105 @@
+import io
+from django.conf import settings
+from django.core.files.uploadedfile import InMemoryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image, UnidentifiedImageError
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+# Leading bytes of the formats the rendition pipeline accepts.
+SIGNATURES = {
+    'JPEG': [b'\xff\xd8\xff'],
+    'PNG': [b'\x89PNG\r\n\x1a\n'],
+    'GIF': [b'GIF87a', b'GIF89a'],
+    'WEBP': [b'RIFF'],
+}
+SIGNATURE_LENGTH = 12
+# Room for the multipart boundaries, headers and the other form fields.
+MULTIPART_OVERHEAD = 16 * 1024
+
+
+class FileTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_code = 'file_too_large'
+
+    def __init__(self, limit):
+        super().__init__(f'Files cannot be larger than {limit // 1024}KB.')
+
+
+def sniff_format(head):
+    """The image format whose signature head starts with, or None."""
+    for name, signatures in SIGNATURES.items():
+        if any(head.startswith(signature) for signature in signatures):
+            if name == 'WEBP' and head[8:12] != b'WEBP':
+                return None
+            return name
+    return None
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """
+    Validates image uploads while they stream in instead of after Django
+    has buffered them: a Content-Length over the limit is refused before
+    the body is read, bytes past the limit abort the upload, and the file
+    signature and the header's dimensions are checked as soon as enough of
+    the file has arrived. Pillow only ever parses the header here.
+
+    Accepted files are kept in memory, which the size limit bounds.
+    """
+    chunk_size = 8 * 1024
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size = settings.PRODUCT_IMAGE_MAX_UPLOAD_SIZE
+        self.max_dimension = settings.PRODUCT_IMAGE_MAX_DIMENSION
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if content_length and content_length > self.max_size + MULTIPART_OVERHEAD:
+            raise FileTooLarge(self.max_size)
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.buffer = io.BytesIO()
+        self.header_checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.max_size:
+            raise FileTooLarge(self.max_size)
+        self.buffer.write(raw_data)
+        if not self.header_checked:
+            self.check_header(complete=False)
+        # Returning None tells Django no other handler needs the chunk.
+
+    def file_complete(self, file_size):
+        if not self.header_checked:
+            self.check_header(complete=True)
+        self.buffer.seek(0)
+        return InMemoryUploadedFile(
+            self.buffer, self.field_name, self.file_name, self.content_type,
+            file_size, self.charset, self.content_type_extra)
+
+    def check_header(self, complete):
+        data = self.buffer.getvalue()
+        if len(data) < SIGNATURE_LENGTH and not complete:
+            return
+        image_format = sniff_format(data[:SIGNATURE_LENGTH])
+        if image_format is None:
+            self.reject('Upload a JPEG, PNG, GIF or WebP image.')
+        try:
+            # Image.open is lazy: it parses the header and stops.
+            with Image.open(io.BytesIO(data), formats=[image_format]) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width = height = float('inf')
+        except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+            if complete:
+                self.reject('The image is corrupt or truncated.')
+            # The header (e.g. a JPEG behind a large EXIF block) may continue
+            # in the next chunk.
+            return
+        if max(width, height) > self.max_dimension:
+            self.reject(f'Images cannot be larger than {self.max_dimension}px on either side.')
+        self.header_checked = True
+
+    def reject(self, message):
+        raise ValidationError({self.field_name: [message]})
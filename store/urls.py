@@ -8,6 +8,7 @@ router.register('products', views.ProductViewSet, basename='products')
 router.register('carts', views.CartViewSet)
 router.register('customers', views.CustomerViewSet)
 router.register('orders',views.OrderViewSet, basename='orders')
+router.register('sales', views.SalesViewSet, basename='sales')
 products_router  = routers.NestedDefaultRouter(router, 'products', lookup = 'product')
 products_router.register('reviews', views.ReviewViewSet, basename='product-reviews')
 products_router.register('images', views.ProductImageViewSet, basename='product-images')
@@ -1,6 +1,9 @@
+from django.conf import settings
 from django.core.exceptions import ValidationError
 def validate_file_size(file):
-    max_file_size_kb = 50
+    # Uploads through the API are already checked while streaming
+    # (store.uploads); this covers files assigned any other way.
+    max_file_size = settings.PRODUCT_IMAGE_MAX_UPLOAD_SIZE
 
-    if file.size > max_file_size_kb:
-        raise ValidationError(f'Files cannot be larger than {max_file_size_kb}KB!')
+    if file.size > max_file_size:
+        raise ValidationError(f'Files cannot be larger than {max_file_size // 1024}KB!')
@@ -1,18 +1,27 @@
-from django.db.models import Count
 from rest_framework import viewsets, mixins, decorators
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
-from . import models, serializers
+from . import carts, exports, imports, models, rollups, serializers, summaries
+from .authentication import get_customer_id
+from .cache import CatalogCacheMixin
+from .conditional import ConditionalGetMixin
 from .permissions import IsAdminOrReadOnly, ViewCustomerHistoryPermission
+from .filters import ProductFilter
+from .pagination import KeysetPagination
+from .prefetch import PrefetchPlanMixin, apply_prefetch_plan
+from .search import ProductSearchFilter
+from .uploads import ImageUploadHandler
 
 
 
 # Create your views here.
 
-class CollectionViewSet(viewsets.ModelViewSet):
-    queryset = models.Collection.objects.annotate(product_count = Count('products__id')).all()
+class CollectionViewSet(CatalogCacheMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = models.Collection.objects.all()
     serializer_class = serializers.CollectionSerializer
     permission_classes = [IsAdminOrReadOnly]
+    cache_scope = 'collection'
 
     def destroy(self, request, *args, **kwargs):
         collection = models.Collection.objects.filter(pk = kwargs['pk'])
@@ -21,12 +30,26 @@ class CollectionViewSet(viewsets.ModelViewSet):
         #         return Response({'error': 'Cannot delete collection with a product'})
         return super().destroy(request, *args, **kwargs)
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = models.Product.objects.annotate(review_count = Count('review__id')).all()
+class ProductViewSet(CatalogCacheMixin, ConditionalGetMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
+    queryset = models.Product.objects.all()
     serializer_class = serializers.ProductSerializer
     permission_classes = [IsAdminOrReadOnly]
-
-class ReviewViewSet(viewsets.ModelViewSet):
+    filter_backends = [ProductSearchFilter, ProductFilter]
+    cache_scope = 'product'
+
+    @decorators.action(detail=False, permission_classes=[IsAdminUser])
+    def export(self, request):
+        return exports.export_response(request, 'products')
+
+    @decorators.action(detail=False, methods=['post'], url_path='import', permission_classes=[IsAdminUser])
+    def import_products(self, request):
+        serializer = imports.ImportUploadSerializer(data = request.data)
+        serializer.is_valid(raise_exception = True)
+        result = imports.import_upload(serializer.validated_data['file'],
+                                       serializer.validated_data.get('file_format'))
+        return Response(result.as_dict())
+
+class ReviewViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = serializers.ReviewSerializer
 
     def get_queryset(self):
@@ -35,14 +58,17 @@ class ReviewViewSet(viewsets.ModelViewSet):
     def get_serializer_context(self):
         return {'product_id' : self.kwargs['product_pk']}
  
-class CartViewSet(mixins.RetrieveModelMixin,mixins.CreateModelMixin,mixins.DestroyModelMixin,viewsets.GenericViewSet):
-    queryset = models.Cart.objects.prefetch_related('items__product').all()
+class CartViewSet(ConditionalGetMixin, PrefetchPlanMixin, mixins.RetrieveModelMixin,mixins.CreateModelMixin,mixins.DestroyModelMixin,viewsets.GenericViewSet):
+    queryset = models.Cart.objects.all()
     serializer_class = serializers.CartSerialiizer
+    conditional_dependencies = ['items', 'items__product']
 
     
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(ConditionalGetMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     http_method_names = ['get','post', 'patch', 'delete']
+    conditional_dependencies = ['product']
+    precondition_methods = ['PATCH']
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -54,22 +80,48 @@ class CartItemViewSet(viewsets.ModelViewSet):
         return models.CartItem.objects.filter(cart_id = self.kwargs['cart_pk'])
     
     def get_serializer_context(self):
-        return {'cart_id': self.kwargs['cart_pk']}
+        return {**super().get_serializer_context(), 'cart_id': self.kwargs['cart_pk']}
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        carts.touch(self.kwargs['cart_pk'])
 
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        carts.touch(self.kwargs['cart_pk'])
+
+    @decorators.action(detail=False, methods=['POST'])
+    def bulk(self, request, cart_pk):
+        serializer = serializers.BulkCartItemSerializer(
+            data = request.data, many = True, context = self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        cart = apply_prefetch_plan(models.Cart.objects.filter(pk = cart_pk), serializers.CartSerialiizer).get()
+        return Response(serializers.CartSerialiizer(cart, context = self.get_serializer_context()).data)
 
-class CustomerViewSet( viewsets.ModelViewSet):
+
+class CustomerViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = models.Customer.objects.all()
     serializer_class = serializers.CustomerSerializer
     permission_classes = [IsAdminUser]
 
     @decorators.action(detail=True, permission_classes=[ViewCustomerHistoryPermission])
     def history(self, request, pk):
-        return Response('ok')
+        # Served from the precomputed summary plus one keyset page of
+        # orders, so the cost doesn't grow with the customer's history.
+        summary = summaries.get_summary(pk)
+        if summary is None:
+            raise NotFound('No customer with the given ID was found.')
+        paginator = KeysetPagination()
+        orders = apply_prefetch_plan(models.Order.objects.filter(customer_id = pk), serializers.OrderSerializer)
+        page = paginator.paginate_queryset(orders, request, self)
+        orders = paginator.get_paginated_response(serializers.OrderSerializer(page, many = True).data).data
+        return Response({**serializers.CustomerHistorySerializer(summary).data, 'orders': orders})
 
 
     @decorators.action(detail=False, methods=('GET', 'PUT'), permission_classes=[IsAuthenticated])
     def me(self, request):
-        customer= models.Customer.objects.get(user_id = request.user.id)
+        customer= models.Customer.objects.get(pk = get_customer_id(request.user))
         if request.method == 'GET':
             serializer = serializers.CustomerSerializer(customer)
             return Response(serializer.data)
@@ -80,20 +132,23 @@ class CustomerViewSet( viewsets.ModelViewSet):
             return Response(serializer.data)
 
         
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(ConditionalGetMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     http_method_names = ['post','patch','get', 'delete', 'options','head']
+    conditional_dependencies = ['items', 'items__product']
+    precondition_methods = ['PATCH']
 
     def get_permissions(self):
-        if  self.request.method in ['PATCH', 'DELETE']:
+        if  self.request.method in ['PATCH', 'DELETE'] or self.action == 'export':
             return [IsAdminUser()]
         return [IsAuthenticated()]
 
 
     def create(self, request, *args, **kwargs):
-        serializer = serializers.CreateOrderSerializer(data = self.request.data, context = {"user_id" : self.request.user.id})
+        serializer = serializers.CreateOrderSerializer(
+            data = self.request.data, context = {"customer_id" : get_customer_id(self.request.user)})
         serializer.is_valid(raise_exception=True)
         order = serializer.save()
-        serializer = serializers.OrderSerializer(order)
+        serializer = serializers.PlacedOrderSerializer(order)
         return Response(serializer.data)
         
 
@@ -101,8 +156,7 @@ class OrderViewSet(viewsets.ModelViewSet):
         user = self.request.user
         if user.is_staff:
             return models.Order.objects.all()
-        customer_id = models.Customer.objects.only('id').get(user_id = user.id)
-        return models.Order.objects.filter(customer = customer_id)
+        return models.Order.objects.filter(customer_id = get_customer_id(user))
     
     def get_serializer_class(self):
         if self.request.method == "POST":
@@ -110,19 +164,44 @@ class OrderViewSet(viewsets.ModelViewSet):
         elif self.request.method == 'PATCH':
             return serializers.UpdateOrderSerializer
         return serializers.OrderSerializer
+
+    @decorators.action(detail=False)
+    def export(self, request):
+        return exports.export_response(request, 'orders')
     
 
-class ProductImageViewSet(viewsets.ModelViewSet):
+class ProductImageViewSet(CatalogCacheMixin, ConditionalGetMixin, PrefetchPlanMixin, viewsets.ModelViewSet):
     def get_queryset(self):
         return models.ProductImage.objects.filter(product_id = self.kwargs['product_pk'])
     serializer_class = serializers.ProductImageSerializer
+    cache_scope = 'product_image'
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Must be in place before anything reads the request body.
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
     def get_serializer_context(self):
-        return {'product_id' : self.kwargs['product_pk']}
-   
+        return {**super().get_serializer_context(), 'product_id' : self.kwargs['product_pk']}
 
-    
+    def get_cache_dependencies(self):
+        return [('product', self.kwargs['product_pk'])]
 
-    
 
+class SalesViewSet(viewsets.ViewSet):
+    """Date-range sales figures for staff, read from the daily rollups."""
+    permission_classes = [IsAdminUser]
+
+    def sales_response(self, request, model, serializer_class):
+        params = rollups.SalesParamsSerializer(data = request.query_params)
+        params.is_valid(raise_exception = True)
+        rows = rollups.sales(model, params.validated_data)
+        return Response(serializer_class(rows, many = True).data)
 
+    @decorators.action(detail=False)
+    def products(self, request):
+        return self.sales_response(request, models.ProductDailySales, serializers.ProductSalesSerializer)
 
+    @decorators.action(detail=False)
+    def collections(self, request):
+        return self.sales_response(request, models.CollectionDailySales, serializers.CollectionSalesSerializer)